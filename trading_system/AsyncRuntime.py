@@ -0,0 +1,181 @@
+# The AsyncRuntime class runs the components of the trading system as asyncio tasks, for live trading.
+# The components are connected by asyncio queues instead of deques polled in a loop:
+# each task waits on its input queue and only wakes up when a message arrives, so nothing spins on an empty channel,
+# and while a task waits for the network (the liquidity provider reading the market data, for instance),
+# the other tasks keep working.
+
+# The components are not changed: each one still appends its messages to its output channels, which are deques here.
+# After a component handled a message, its task moves the messages of its output deques to the next queues.
+# A task puts the messages with await: when the next queue is full, the task waits for the next component,
+# and the market data is not read faster than the trading system handles it (backpressure).
+# The market data queues (lp_2_gateway, ob_2_ts) are bounded by queue_size.
+# The order queues form a cycle (strategy -> order manager -> gateway -> order manager -> strategy):
+# if they were all bounded and full, each task would wait for the next one forever, so they are bounded
+# by order_queue_size, which is unbounded (0) by default.
+
+# The order book can be an OrderBook or a BookManager.
+# The source of the market data is an iterable or an asynchronous iterable of orders (a network feed, for instance).
+
+import asyncio
+from collections import deque
+
+from OrderBook import OrderBook
+from BookManager import BookManager
+from TradingStrategy import TradingStrategy
+from OrderManager import OrderManager
+from MarketSimulator import MarketSimulator
+
+
+class AsyncRuntime:
+
+	def __init__(self,source,order_book=None,trading_strategy=None,order_manager=None,gateway=None,queue_size=1000,order_queue_size=0):
+		self.source = source
+		self.queue_size = queue_size
+		self.order_queue_size = order_queue_size
+		self.ob = order_book if order_book is not None else OrderBook()
+		self.ts = trading_strategy if trading_strategy is not None else TradingStrategy()
+		self.om = order_manager if order_manager is not None else OrderManager()
+		self.gw = gateway if gateway is not None else MarketSimulator()
+		self.book_events = deque()
+		if isinstance(self.ob, BookManager):
+			self.ob.bm_2_ts = self.book_events
+		else:
+			self.ob.ob_to_ts = self.book_events
+		self.ts.ts_2_om = deque()
+		self.om.om_2_gw = deque()
+		self.om.om_2_ts = deque()
+		self.gw.gw_2_om = deque()
+		self.errors = []
+
+	# The queues are created in run, since an asyncio queue belongs to the event loop running it.
+	def create_queues(self):
+		self.lp_2_gateway = asyncio.Queue(self.queue_size)
+		self.ob_2_ts = asyncio.Queue(self.queue_size)
+		self.ts_2_om = asyncio.Queue(self.order_queue_size)
+		self.om_2_gw = asyncio.Queue(self.order_queue_size)
+		self.gw_2_om = asyncio.Queue(self.order_queue_size)
+		self.om_2_ts = asyncio.Queue(self.order_queue_size)
+		# in_flight counts the messages put in a queue and not handled yet; idle is set when it is 0.
+		self.in_flight = 0
+		self.idle = asyncio.Event()
+		self.idle.set()
+
+	# The run function runs the trading system until the source is exhausted and every message has been handled.
+	async def run(self):
+		self.create_queues()
+		om_outputs = [(self.om.om_2_gw, self.om_2_gw), (self.om.om_2_ts, self.om_2_ts)]
+		tasks = [asyncio.create_task(self.pump(self.lp_2_gateway, self.ob.handle_order, [(self.book_events, self.ob_2_ts)])),
+						 asyncio.create_task(self.pump(self.ob_2_ts, self.handle_book_event, [(self.ts.ts_2_om, self.ts_2_om)])),
+						 asyncio.create_task(self.pump(self.ts_2_om, self.om.handle_order_from_trading_strategy, om_outputs)),
+						 asyncio.create_task(self.pump(self.om_2_gw, self.gw.handle_order, [(self.gw.gw_2_om, self.gw_2_om)])),
+						 asyncio.create_task(self.pump(self.gw_2_om, self.om.handle_order_from_gateway, om_outputs)),
+						 asyncio.create_task(self.pump(self.om_2_ts, self.ts.handle_market_response, [(self.ts.ts_2_om, self.ts_2_om)]))]
+		try:
+			await self.read_source()
+			await self.idle.wait()
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+
+	# The book events go to the order manager (for the reference prices of its risk engine), then to the strategy.
+	def handle_book_event(self,book_event):
+		self.om.handle_book_event(book_event)
+		self.ts.handle_book_event(book_event)
+
+	# The read_source function is the task of the liquidity provider: it sends the orders of the source to the order book.
+	async def read_source(self):
+		if hasattr(self.source, '__aiter__'):
+			async for order in self.source:
+				await self.put(self.lp_2_gateway, order)
+		else:
+			for order in self.source:
+				await self.put(self.lp_2_gateway, order)
+
+	async def put(self,queue,message):
+		self.in_flight += 1
+		self.idle.clear()
+		await queue.put(message)
+
+	# The pump function is the loop of a component task: it waits for a message, gives it to the component
+	# and sends the messages the component appended to its output channels.
+	# The message is counted as handled only once its outputs are in the next queues:
+	# the runtime is idle when no message is left in any queue or in any component.
+	# A component raising an exception does not stop its task: the error is printed and kept in errors with its message,
+	# and the task goes on with the next message.
+	async def pump(self,queue,handler,outputs):
+		while True:
+			message = await queue.get()
+			try:
+				try:
+					handler(message)
+				except Exception as error:
+					print('error handling %s: %r' % (message, error))
+					self.errors.append((message, error))
+				for channel, next_queue in outputs:
+					while channel:
+						await self.put(next_queue, channel.popleft())
+			finally:
+				queue.task_done()
+				self.in_flight -= 1
+				if self.in_flight == 0:
+					self.idle.set()
+
+
+# The run_live function runs the trading system on a source of orders and returns the runtime.
+def run_live(source,**kwargs):
+	runtime = AsyncRuntime(source, **kwargs)
+	asyncio.run(runtime.run())
+	return runtime
+
+
+import unittest
+from RiskEngine import RiskEngine
+
+class TestAsyncRuntime(unittest.TestCase):
+
+	def orders(self):
+		return [{'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'},
+						{'id': 2, 'price': 218, 'quantity': 10, 'side': 'ask', 'action': 'new'}]
+
+	# The two orders of the liquidity provider cross: the strategy sends two orders, which are accepted by the market:
+	def test_run(self):
+		runtime = run_live(self.orders(), queue_size=1, order_queue_size=1)
+		self.assertEqual(len(runtime.om.orders), 2)
+		self.assertEqual([o['status'] for o in runtime.om.orders.values()], ['accepted', 'accepted'])
+		self.assertEqual([o['status'] for o in runtime.ts.orders.values()], ['accepted', 'accepted'])
+		self.assertEqual(len(runtime.gw.orders), 2)
+
+	# The book events reach the risk engine of the order manager:
+	def test_risk_engine(self):
+		runtime = run_live(self.orders(), order_manager=OrderManager(risk_engine=RiskEngine(price_band=0.1)))
+		self.assertEqual(runtime.om.risk_engine.reference_prices, {None: 218.5})
+		self.assertEqual([o['status'] for o in runtime.ts.orders.values()], ['accepted', 'accepted'])
+
+	# A failing handler does not stop the runtime: the error is kept and the other messages are handled.
+	def test_failing_handler(self):
+		trading_strategy = TradingStrategy()
+		handle_book_event = trading_strategy.handle_book_event
+		def failing_handler(book_event):
+			if book_event['bid_price'] == 219:
+				raise RuntimeError('failing strategy')
+			handle_book_event(book_event)
+		trading_strategy.handle_book_event = failing_handler
+		orders = self.orders() + [{'id': 3, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'}]
+		runtime = AsyncRuntime(orders, trading_strategy=trading_strategy)
+		asyncio.run(asyncio.wait_for(runtime.run(), 5))
+		self.assertEqual(len(runtime.errors), 2)
+		self.assertIsInstance(runtime.errors[0][1], RuntimeError)
+		self.assertEqual(runtime.in_flight, 0)
+
+	# The source can be asynchronous, the other tasks run while it waits:
+	def test_async_source(self):
+		async def source():
+			for order in self.orders():
+				await asyncio.sleep(0.01)
+				yield order
+		runtime = run_live(source())
+		self.assertEqual([o['status'] for o in runtime.ts.orders.values()], ['accepted', 'accepted'])
+
+if __name__ == '__main__':
+	unittest.main()
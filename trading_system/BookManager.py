@@ -0,0 +1,204 @@
+# The BookManager class gathers the order books of many instruments.
+# Each order coming from the liquidity provider carries a symbol field; the book manager routes the order
+# to the OrderBook of this symbol (the book is created the first time the symbol is seen)
+# and tags the book events with the symbol before sending them to the trading strategies.
+# It has the same channels and the same handle_order_from_gateway function as OrderBook,
+# so it can replace a single book in the trading system.
+
+# For a large universe, the ShardedBookManager class spreads the symbols over several worker processes.
+# A symbol is always sent to the same worker (the shard is a stable hash of the symbol),
+# so the orders of one symbol are handled in order. The events of different symbols can be interleaved differently
+# than with a single BookManager, but the events of one symbol keep their order.
+
+import multiprocessing
+import zlib
+
+from OrderBook import OrderBook
+
+
+class BookManager:
+
+	def __init__(self,gw_2_bm = None,bm_2_ts = None,depth = 5,book_event_mode = 'top'):
+		self.books = {}
+		self.gw_2_bm = gw_2_bm
+		self.bm_2_ts = bm_2_ts
+		self.depth = depth
+		self.book_event_mode = book_event_mode
+
+	# The get_book function returns the book of a symbol and creates it the first time.
+	# The books have no channels: the book manager collects the book event returned by handle_order.
+	def get_book(self,symbol):
+		book = self.books.get(symbol)
+		if book is None:
+			book = OrderBook(depth = self.depth, book_event_mode = self.book_event_mode)
+			self.books[symbol] = book
+		return book
+
+	def handle_order_from_gateway(self,order = None):
+		if self.gw_2_bm is None:
+			print('simulation mode')
+			return self.handle_order(order)
+		elif len(self.gw_2_bm)>0:
+			self.handle_order(self.gw_2_bm.popleft())
+
+	# The handle_order function sends the order to the book of its symbol:
+	def handle_order(self,o):
+		be = self.route_order(o)
+		if be is None:
+			return None
+		if self.bm_2_ts is not None:
+			self.bm_2_ts.append(be)
+		else:
+			return be
+
+	# The handle_orders function handles a list of orders and returns the list of book events they generated.
+	def handle_orders(self,orders):
+		book_events = []
+		for o in orders:
+			be = self.route_order(o)
+			if be is not None:
+				book_events.append(be)
+		return book_events
+
+	# The route_order function finds the book of the order symbol and tags the book event with the symbol.
+	def route_order(self,o):
+		if 'symbol' not in o:
+			print('order without symbol id=%d' % (o['id']))
+			return None
+		be = self.get_book(o['symbol']).handle_order(o)
+		if be is not None:
+			be['symbol'] = o['symbol']
+		return be
+
+
+# The shard_of function gives the worker of a symbol.
+# We use crc32 rather than hash because the hash of a string changes from one Python process to another.
+def shard_of(symbol,shard_count):
+	return zlib.crc32(symbol.encode()) % shard_count
+
+
+# The run_book_shard function is the loop of a worker process.
+# It receives batches of orders, handles them with its own BookManager and sends back the batch of book events.
+# None stops the worker.
+def run_book_shard(shard_in,shard_out,depth,book_event_mode):
+	book_manager = BookManager(depth = depth, book_event_mode = book_event_mode)
+	while True:
+		orders = shard_in.get()
+		if orders is None:
+			break
+		shard_out.put(book_manager.handle_orders(orders))
+
+
+# The ShardedBookManager class sends the orders to the worker processes by batches of batch_size orders,
+# since each message between processes is pickled, sending one order at a time would cost more than handling it.
+# flush sends the orders not sent yet and collect waits for the book events of all the batches sent.
+class ShardedBookManager:
+
+	def __init__(self,shard_count,gw_2_bm = None,bm_2_ts = None,depth = 5,book_event_mode = 'top',batch_size = 1000):
+		self.shard_count = shard_count
+		self.gw_2_bm = gw_2_bm
+		self.bm_2_ts = bm_2_ts
+		self.batch_size = batch_size
+		self.pending = [[] for _ in range(shard_count)]
+		self.batches_in_flight = 0
+		self.shard_out = multiprocessing.Queue()
+		self.shard_in = [multiprocessing.Queue() for _ in range(shard_count)]
+		self.workers = [multiprocessing.Process(target = run_book_shard,
+																						args = (self.shard_in[i], self.shard_out, depth, book_event_mode),
+																						daemon = True)
+										for i in range(shard_count)]
+
+	def start(self):
+		for worker in self.workers:
+			worker.start()
+
+	def stop(self):
+		self.flush()
+		for shard_in in self.shard_in:
+			shard_in.put(None)
+		for worker in self.workers:
+			worker.join()
+
+	# The handle_order_from_gateway function takes all the orders waiting in the gw_2_bm channel.
+	def handle_order_from_gateway(self):
+		if self.gw_2_bm is None:
+			print('simulation mode')
+			return
+		while len(self.gw_2_bm)>0:
+			self.handle_order(self.gw_2_bm.popleft())
+
+	def handle_order(self,o):
+		if 'symbol' not in o:
+			print('order without symbol id=%d' % (o['id']))
+			return
+		shard = shard_of(o['symbol'], self.shard_count)
+		self.pending[shard].append(o)
+		if len(self.pending[shard]) >= self.batch_size:
+			self.send(shard)
+
+	def send(self,shard):
+		self.shard_in[shard].put(self.pending[shard])
+		self.pending[shard] = []
+		self.batches_in_flight += 1
+
+	def flush(self):
+		for shard in range(self.shard_count):
+			if self.pending[shard]:
+				self.send(shard)
+
+	# The collect function flushes the pending orders and waits for the book events of every batch sent.
+	# The book events are appended to bm_2_ts, or returned when there is no channel.
+	def collect(self):
+		self.flush()
+		book_events = []
+		while self.batches_in_flight > 0:
+			book_events.extend(self.shard_out.get())
+			self.batches_in_flight -= 1
+		if self.bm_2_ts is not None:
+			self.bm_2_ts.extend(book_events)
+		else:
+			return book_events
+
+
+import unittest
+from collections import deque
+
+class TestBookManager(unittest.TestCase):
+
+	def setUp(self):
+		self.book_manager = BookManager()
+
+	# The orders of two symbols go to two books and the book events are tagged with the symbol:
+	def test_route_by_symbol(self):
+		be = self.book_manager.handle_order({'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new', 'symbol': 'GOOG'})
+		self.assertEqual(be, {'bid_price': 219, 'bid_quantity': 10, 'offer_price': -1, 'offer_quantity': -1, 'symbol': 'GOOG'})
+		be = self.book_manager.handle_order({'id': 1, 'price': 100, 'quantity': 5, 'side': 'ask', 'action': 'new', 'symbol': 'AAPL'})
+		self.assertEqual(be, {'bid_price': -1, 'bid_quantity': -1, 'offer_price': 100, 'offer_quantity': 5, 'symbol': 'AAPL'})
+		self.assertEqual(len(self.book_manager.books), 2)
+		self.assertEqual(len(self.book_manager.books['GOOG'].list_bids), 1)
+		self.assertEqual(len(self.book_manager.books['AAPL'].list_bids), 0)
+
+	def test_order_without_symbol(self):
+		self.assertIsNone(self.book_manager.handle_order({'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'}))
+		self.assertEqual(len(self.book_manager.books), 0)
+
+	# The sharded book manager must produce, for each symbol, the same book events as a single book manager:
+	def test_sharded_book_manager(self):
+		orders = []
+		for i, symbol in enumerate(['GOOG', 'AAPL', 'MSFT', 'AMZN'] * 5):
+			orders.append({'id': i, 'price': 100 + i, 'quantity': 10, 'side': 'bid', 'action': 'new', 'symbol': symbol})
+		expected = self.book_manager.handle_orders([o.copy() for o in orders])
+
+		gw_2_bm = deque(orders)
+		bm_2_ts = deque()
+		sharded_book_manager = ShardedBookManager(2, gw_2_bm, bm_2_ts, batch_size = 3)
+		sharded_book_manager.start()
+		sharded_book_manager.handle_order_from_gateway()
+		sharded_book_manager.collect()
+		sharded_book_manager.stop()
+		for symbol in ['GOOG', 'AAPL', 'MSFT', 'AMZN']:
+			self.assertEqual([be for be in bm_2_ts if be['symbol'] == symbol],
+											 [be for be in expected if be['symbol'] == symbol])
+
+if __name__ == '__main__':
+	unittest.main()
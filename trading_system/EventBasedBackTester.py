@@ -1,84 +1,329 @@
 
 
 from LiquidityProvider import LiquidityProvider
-from TradingStrategyDualMA import TradingStrategyDualMA 
+from TradingStrategyDualMA import TradingStrategyDualMA
 from MarketSimulator import MarketSimulator
 from OrderManager import OrderManager
-from OrderBook import OrderBook
+from BookManager import BookManager
+from TickStore import TickStore, load_tick_store
+from LatencyModel import DelayedChannel, FixedLatency
+from EventScheduler import EventScheduler, ScheduledChannel
+from EventJournal import EventJournal, JournaledChannel, JournalReplay, PROCESS_EVENTS, FLUSH_EVENTS, MARKET_DATA
 
 from collections import deque
 import pandas as pd
 import numpy as np
-from pandas_datareader import data
-import matplotlib.pyplot as plt
-import h5py
-
-def call_if_not_empty(deq, fun): 
-  while (len(deq) > 0):
-    fun()
-    
-
-class EventBasedBackTester: 
-	def __init__(self):
-		self.lp_2_gateway = deque()
-		self.ob_2_ts = deque()
-		self.ts_2_om = deque()
+
+# In batch mode, call_with_batch takes all the messages waiting in a channel, gives them to the component in one call
+# and appends the messages returned by the component to the next channel.
+def call_with_batch(deq, fun, next_deq):
+	if len(deq) > 0:
+		batch = list(deq)
+		deq.clear()
+		next_deq.extend(fun(batch))
+
+# The channels of the back tester, numbered from MARKET_DATA in the journal.
+CHANNELS = ('lp_2_gateway', 'ob_2_ts', 'ts_2_om', 'om_2_gw', 'gw_2_om', 'om_2_ts')
+
+
+# The components are driven by an EventScheduler: each channel is a ScheduledChannel which schedules the delivery
+# of a message to the next component, so the messages are handled in the order of their simulated time
+# and no channel is polled. The latencies of the orders, of the execution reports and of the market data
+# are the latencies of the channels (see LatencyModel).
+# The simulated time is given by the timestamps of the prices (process_data_from_tick_store):
+# before a price is injected, the events scheduled up to its timestamp are run.
+
+# With a journal_path, every message sent on a channel is recorded in an EventJournal, with the simulated time,
+# and so are the calls to process_events and flush_events: JournalReplay can then run the back test again from the journal.
+
+# With a risk_engine, the order manager checks the orders of the strategy: the book events are given to the order manager
+# before the strategy, and the risk engine throttles the orders with the simulated time instead of the wall clock.
+
+# In batch mode, the channels are deques polled in a fixed order and each component handles all the messages
+# of its channel in one call. The latencies are then handled by the market simulator and by a DelayedChannel
+# for the market data, the simulated time being moved forward by each timestamped price.
+class EventBasedBackTester:
+	def __init__(self,batch_mode=False,order_latency=None,report_latency=None,market_data_latency=None,journal_path=None,small_window_size=50,large_window_size=100,risk_engine=None):
+		self.batch_mode = batch_mode
+		self.journal = EventJournal(journal_path, clock=self.get_time) if journal_path is not None else None
+		self.scheduler = EventScheduler()
+		self.data_time = None
 		self.ms_2_om = deque()
-		self.om_2_ts = deque()
-		self.gw_2_om = deque()
-		self.om_2_gw = deque()
+		if batch_mode:
+			self.lp_2_gateway = deque()
+			self.ob_2_ts = deque()
+			self.ts_2_om = deque()
+			self.om_2_ts = deque()
+			self.gw_2_om = deque()
+			self.om_2_gw = deque()
+			self.journal_channels()
+			self.market_data = DelayedChannel(market_data_latency, self.ob_2_ts) if market_data_latency is not None else None
+			self.ob = BookManager(self.lp_2_gateway, self.market_data if self.market_data is not None else self.ob_2_ts)
+			self.ms = MarketSimulator(self.om_2_gw, self.gw_2_om, self.ob, order_latency, report_latency)
+		else:
+			self.lp_2_gateway = ScheduledChannel(self.scheduler, self.handle_market_data)
+			self.ob_2_ts = ScheduledChannel(self.scheduler, None, market_data_latency)
+			self.ts_2_om = ScheduledChannel(self.scheduler, None)
+			self.om_2_ts = ScheduledChannel(self.scheduler, None)
+			self.gw_2_om = ScheduledChannel(self.scheduler, None, report_latency)
+			self.om_2_gw = ScheduledChannel(self.scheduler, None, order_latency)
+			self.journal_channels()
+			self.market_data = None
+			self.ob = BookManager(self.lp_2_gateway, self.ob_2_ts)
+			self.ms = MarketSimulator(self.om_2_gw, self.gw_2_om, self.ob)
 		self.lp = LiquidityProvider(self.lp_2_gateway)
-		self.ob = OrderBook(self.lp_2_gateway, self.ob_2_ts)
-		self.ts = TradingStrategyDualMA(self.ob_2_ts, self.ts_2_om,self.om_2_ts)
-		self.ms = MarketSimulator(self.om_2_gw, self.gw_2_om)
-		self.om = OrderManager(self.ts_2_om, self.om_2_ts,self.om_2_gw, self.gw_2_om)
-		
-		
-	def process_data_from_yahoo(self,price):
-		order_bid = {'id': 1,'price': price, 'quantity': 1000, 'side': 'bid', 'action': 'new'}
-		order_ask = {'id': 1, 'price': price, 'quantity': 1000,'side': 'ask','action': 'new'}
-		self.lp_2_gateway.append(order_ask) 
-		self.lp_2_gateway.append(order_bid) 
-		self.process_events() 
-		order_ask['action']='delete' 
-		order_bid['action'] = 'delete' 
-		self.lp_2_gateway.append(order_ask) 
-		self.lp_2_gateway.append(order_bid)
-		
-		
+		self.ts = TradingStrategyDualMA(self.ob_2_ts, self.ts_2_om,self.om_2_ts, small_window_size, large_window_size)
+		self.om = OrderManager(self.ts_2_om, self.om_2_ts,self.om_2_gw, self.gw_2_om, risk_engine=risk_engine)
+		if risk_engine is not None:
+			risk_engine.clock = self.get_seconds
+		if not batch_mode:
+			self.ob_2_ts.consumer = self.handle_book_event
+			self.ts_2_om.consumer = self.om.handle_order_from_trading_strategy
+			self.om_2_gw.consumer = self.ms.handle_order
+			self.gw_2_om.consumer = self.om.handle_order_from_gateway
+			self.om_2_ts.consumer = self.ts.handle_market_response
+
+	# The journal_channels function replaces the channels by channels recording their messages in the journal.
+	def journal_channels(self):
+		if self.journal is None:
+			return
+		for number, name in enumerate(CHANNELS, MARKET_DATA):
+			setattr(self, name, JournaledChannel(getattr(self, name), self.journal, number))
+
+	def get_time(self):
+		return self.ms.now if self.batch_mode else self.scheduler.now
+
+	# The risk engine throttles the orders in seconds of simulated time.
+	def get_seconds(self):
+		return self.get_time() / 10 ** 9
+
+
+	def process_data_from_yahoo(self,price,symbol='GOOG',timestamp=None):
+		order_bid = {'id': 1,'price': price, 'quantity': 1000, 'side': 'bid', 'action': 'new', 'symbol': symbol}
+		order_ask = {'id': 1, 'price': price, 'quantity': 1000,'side': 'ask','action': 'new', 'symbol': symbol}
+		if timestamp is not None:
+			order_bid['timestamp'] = order_ask['timestamp'] = timestamp
+		self.send_market_data(order_ask)
+		self.send_market_data(order_bid)
+		self.process_events()
+		order_ask['action']='delete'
+		order_bid['action'] = 'delete'
+		self.send_market_data(order_ask)
+		self.send_market_data(order_bid)
+
+	# The send_market_data function sends a message of the market to the system; a timestamped message first runs
+	# the events scheduled before its timestamp.
+	def send_market_data(self,order):
+		timestamp = order.get('timestamp')
+		if timestamp is not None and not self.batch_mode:
+			self.scheduler.run(until=timestamp)
+			self.data_time = timestamp
+		self.lp_2_gateway.append(order)
+
+
+	# The process_data_from_tick_store function streams the prices of a symbol from a TickStore
+	# and injects them one by one like process_data_from_yahoo, without loading the whole history in memory.
+	# At the end, the events still scheduled (the orders and reports in flight) are run.
+	def process_data_from_tick_store(self,tick_store,symbol='GOOG',column='Adj Close'):
+		for timestamp, price in tick_store.read_ticks(symbol, column):
+			self.process_data_from_yahoo(price,symbol,timestamp)
+			self.process_events()
+		self.flush_events()
+		if self.journal is not None:
+			self.journal.commit()
+
+	# The flush_events function runs all the events still scheduled.
+	def flush_events(self):
+		if self.journal is not None:
+			self.journal.record(FLUSH_EVENTS)
+		if not self.batch_mode:
+			self.scheduler.run()
+
+
+	# The handle_market_data function gives a message of the market to the book manager, then to the market simulator
+	# which matches the orders of the strategy against the new state of the book.
+	def handle_market_data(self,order):
+		self.ob.handle_order(order)
+		self.ms.handle_market_data(order)
+
+	# The book events go to the order manager (for the reference prices of its risk engine), then to the strategy.
+	def handle_book_event(self,book_event):
+		self.om.handle_book_event(book_event)
+		self.ts.handle_book_event(book_event)
+
+	def handle_book_events(self,book_events):
+		for book_event in book_events:
+			self.om.handle_book_event(book_event)
+		return self.ts.handle_book_events(book_events)
+
+	# In batch mode, a timestamped message first moves the simulated time forward: the orders, the reports and the book events
+	# arriving before it are delivered first.
+	def handle_market_data_batch(self,orders):
+		book_events = []
+		for order in orders:
+			self.advance_time(order)
+			if self.market_data is not None:
+				self.ob.handle_order(order)
+			else:
+				book_events.extend(self.ob.handle_orders([order]))
+			self.ms.handle_market_data(order)
+		return book_events
+
+	def advance_time(self,order):
+		timestamp = order.get('timestamp')
+		if timestamp is None:
+			return
+		self.ms.advance_time(timestamp)
+		if self.market_data is not None:
+			self.market_data.advance(timestamp)
+
+	# The process_events function runs the events scheduled up to the time of the last price,
+	# or all the events when the prices have no timestamp.
 	def process_events(self):
+		if self.journal is not None:
+			self.journal.record(PROCESS_EVENTS)
+		if self.batch_mode:
+			return self.process_events_in_batches()
+		self.scheduler.run(until=self.data_time)
+
+	# The process_events_in_batches function polls the components in a fixed order,
+	# each component handling all the messages of its input channel in a single call.
+	def process_events_in_batches(self):
 		while len(self.lp_2_gateway)>0:
-			call_if_not_empty(self.lp_2_gateway, self.ob.handle_order_from_gateway)
-			call_if_not_empty(self.ob_2_ts,self.ts.handle_input_from_bb)
-			call_if_not_empty(self.ts_2_om,self.om.handle_input_from_ts)
-			call_if_not_empty(self.om_2_gw,self.ms.handle_order_from_gw)
-			call_if_not_empty(self.gw_2_om,self.om.handle_input_from_market)
-			call_if_not_empty(self.om_2_ts,self.ts.handle_response_from_om)
-			
-eb=EventBasedBackTester()
-
-def load_financial_data(start_date, end_date,output_file): 
-	try:
-		df = pd.read_pickle(output_file)
-		print('File data found...reading GOOG data') 
-	except FileNotFoundError:
-		print('File not found...downloading the GOOG data')
-		df = data.DataReader('GOOG', 'yahoo', start_date, end_date) 
-		df.to_pickle(output_file)
-	return df
-
-goog_data=load_financial_data(start_date='2001-01-01', end_date = '2022-01-01',output_file='goog_data.pkl')
-
-for line in zip(goog_data.index,goog_data['Adj Close']): 
-	date=line[0]
-	price=line[1] 
-	price_information={'date' : date,'price' : float(price)}
-	eb.process_data_from_yahoo(price_information['price']) 
-	eb.process_events()
-	
-plt.plot(eb.ts.list_total,label="Paper Trading using Event-Based BackTester") 
-plt.plot(eb.ts.list_paper_total,label="Trading using Event-Based BackTester") 
-plt.legend()
-plt.show()
-
-  
+			call_with_batch(self.lp_2_gateway, self.handle_market_data_batch, self.ob_2_ts)
+			call_with_batch(self.ob_2_ts, self.handle_book_events, self.ts_2_om)
+			call_with_batch(self.ts_2_om, self.om.handle_orders_from_trading_strategy, self.om_2_gw)
+			call_with_batch(self.om_2_gw, self.ms.handle_orders, self.gw_2_om)
+			call_with_batch(self.gw_2_om, self.om.handle_orders_from_gateway, self.om_2_ts)
+			call_with_batch(self.om_2_ts, self.ts.handle_market_responses, self.ts_2_om)
+
+
+import os
+import unittest
+import tempfile
+import shutil
+from RiskEngine import RiskEngine
+
+class TestEventBasedBackTester(unittest.TestCase):
+
+	# The batch mode must produce exactly the same orders and metrics as the one message at a time mode:
+	def test_batch_mode(self):
+		prices = 100 + np.cumsum(np.random.RandomState(0).normal(0, 1, 400))
+		eb = EventBasedBackTester()
+		eb_batch = EventBasedBackTester(batch_mode=True)
+		for price in prices:
+			eb.process_data_from_yahoo(float(price))
+			eb.process_events()
+			eb_batch.process_data_from_yahoo(float(price))
+			eb_batch.process_events()
+		self.assertGreater(eb.ts.order_id, 0)
+		self.assertEqual(eb_batch.ts.order_id, eb.ts.order_id)
+		self.assertEqual(eb_batch.ts.list_paper_total, eb.ts.list_paper_total)
+		self.assertEqual(eb_batch.ts.list_total, eb.ts.list_total)
+		self.assertEqual([o.to_dict() for o in eb_batch.om.orders.values()], [o.to_dict() for o in eb.om.orders.values()])
+		self.assertEqual([o.to_dict() for o in eb_batch.ms.orders.values()], [o.to_dict() for o in eb.ms.orders.values()])
+		# The orders of the strategy cross the liquidity of the book and are filled
+		self.assertNotEqual(eb.ts.list_total[-1], eb.ts.list_total[0])
+
+	# Streaming the prices from a TickStore gives the same result as injecting them one by one:
+	def test_process_data_from_tick_store(self):
+		root = tempfile.mkdtemp()
+		try:
+			prices = 100 + np.cumsum(np.random.RandomState(1).normal(0, 1, 200))
+			df = pd.DataFrame({'Adj Close': prices}, index=pd.date_range('2001-01-01', periods=200, freq='D'))
+			TickStore(root, '%Y').write_dataframe('GOOG', df)
+			eb = EventBasedBackTester()
+			eb.process_data_from_tick_store(TickStore(root, '%Y'))
+			eb_reference = EventBasedBackTester()
+			for price in prices:
+				eb_reference.process_data_from_yahoo(float(price))
+				eb_reference.process_events()
+			self.assertEqual(eb.ts.list_paper_total, eb_reference.ts.list_paper_total)
+		finally:
+			shutil.rmtree(root)
+
+	# With latencies, the orders reach the market after the book has changed and are filled against the book of that time:
+	# the real trading differs from the paper trading. The batch mode also simulates the latencies.
+	def test_latency(self):
+		root = tempfile.mkdtemp()
+		try:
+			prices = 100 + np.cumsum(np.random.RandomState(2).normal(0, 1, 200))
+			df = pd.DataFrame({'Adj Close': prices}, index=pd.date_range('2001-01-01', periods=200, freq='D'))
+			TickStore(root, '%Y').write_dataframe('GOOG', df)
+			hour = 3600 * 10 ** 9
+			for batch_mode in (False, True):
+				eb = EventBasedBackTester(batch_mode, FixedLatency(hour), FixedLatency(hour), FixedLatency(hour))
+				eb.process_data_from_tick_store(TickStore(root, '%Y'))
+				self.assertGreater(eb.ts.order_id, 0)
+				self.assertNotEqual(eb.ts.list_total, eb.ts.list_paper_total[:len(eb.ts.list_total)])
+			self.assertEqual(eb.scheduler.now, 0)
+		finally:
+			shutil.rmtree(root)
+
+	# The scheduler runs the events up to the time of the last price: the orders still in flight are run with the next price.
+	def test_scheduler(self):
+		eb = EventBasedBackTester(order_latency=FixedLatency(10))
+		for day in range(60):
+			eb.process_data_from_yahoo(100.0 + (day % 7), timestamp=day * 1000)
+			eb.process_events()
+			self.assertEqual(eb.scheduler.now, day * 1000)
+			self.assertTrue(eb.scheduler.next_time() is None or eb.scheduler.next_time() > day * 1000)
+		self.assertGreater(eb.ts.order_id, 0)
+
+	# The risk engine gets the book events and throttles the orders in simulated time: with a price a day,
+	# one order per hour is never throttled and the back test is the same as without the risk engine.
+	def test_risk_engine(self):
+		root = tempfile.mkdtemp()
+		try:
+			prices = 100 + np.cumsum(np.random.RandomState(2).normal(0, 1, 200))
+			df = pd.DataFrame({'Adj Close': prices}, index=pd.date_range('2001-01-01', periods=200, freq='D'))
+			TickStore(root, '%Y').write_dataframe('GOOG', df)
+			for batch_mode in (False, True):
+				eb = EventBasedBackTester(batch_mode, risk_engine=RiskEngine(price_band=0.1, max_orders=1, throttle_window=3600))
+				eb.process_data_from_tick_store(TickStore(root, '%Y'))
+				eb_reference = EventBasedBackTester(batch_mode)
+				eb_reference.process_data_from_tick_store(TickStore(root, '%Y'))
+				self.assertGreater(eb.ts.order_id, 1)
+				self.assertEqual(eb.om.risk_engine.reference_prices['GOOG'], prices[-1])
+				self.assertEqual(eb.ts.list_total, eb_reference.ts.list_total)
+		finally:
+			shutil.rmtree(root)
+
+	# Replaying the journal of a back test runs it again and sends exactly the same messages,
+	# in both modes; a back test with other latencies does not:
+	def test_journal_replay(self):
+		root = tempfile.mkdtemp()
+		try:
+			prices = np.round(100 + np.cumsum(np.random.RandomState(2).normal(0, 1, 200)), 2)
+			df = pd.DataFrame({'Adj Close': prices}, index=pd.date_range('2001-01-01', periods=200, freq='D'))
+			TickStore(root, '%Y').write_dataframe('GOOG', df)
+			hour = 3600 * 10 ** 9
+			for batch_mode in (False, True):
+				path = os.path.join(root, 'journal_%d' % batch_mode)
+				eb = EventBasedBackTester(batch_mode, FixedLatency(hour), FixedLatency(hour), FixedLatency(hour), journal_path=path)
+				eb.process_data_from_tick_store(TickStore(root, '%Y'))
+				eb.journal.close()
+				self.assertGreater(eb.ts.order_id, 0)
+				replay_path = os.path.join(root, 'replay_%d' % batch_mode)
+				eb_replay = EventBasedBackTester(batch_mode, FixedLatency(hour), FixedLatency(hour), FixedLatency(hour), journal_path=replay_path)
+				self.assertIsNone(JournalReplay(path).verify(eb_replay))
+				eb_replay.journal.close()
+				self.assertEqual(eb_replay.ts.list_total, eb.ts.list_total)
+				eb_other = EventBasedBackTester(batch_mode, journal_path=os.path.join(root, 'other_%d' % batch_mode))
+				self.assertIsNotNone(JournalReplay(path).verify(eb_other))
+				eb_other.journal.close()
+		finally:
+			shutil.rmtree(root)
+
+if __name__ == '__main__':
+	import matplotlib.pyplot as plt
+
+	eb=EventBasedBackTester()
+
+	tick_store=load_tick_store(start_date='2001-01-01', end_date = '2022-01-01',root='tick_data')
+	eb.process_data_from_tick_store(tick_store,'GOOG','Adj Close')
+
+	plt.plot(eb.ts.list_total,label="Paper Trading using Event-Based BackTester")
+	plt.plot(eb.ts.list_paper_total,label="Trading using Event-Based BackTester")
+	plt.legend()
+	plt.show()
@@ -0,0 +1,282 @@
+# The EventJournal class records every message sent on the channels of the trading system in an append-only file,
+# so a run (a production incident, for instance) can be replayed and reproduced exactly.
+
+# Each record has a sequence number, a timestamp given by the clock of the journal (the simulated time in a back test),
+# the number of the channel and the message written with the layout of WireCodec. Every record has the same size:
+# the nth record is at a fixed offset, and the file can be read as a NumPy structured array without being parsed.
+# The file is memory-mapped: recording a message only writes it in memory, there is no system call per message.
+# The records are committed in groups (group commit): every group_size records, the pages are flushed to the disk
+# and the number of committed records is written in the header of the file. A reader only sees the committed records,
+# so a crash in the middle of a group loses the end of the group, never gives a half written record.
+# The file grows by doubling its capacity. An existing journal is reopened: the new records follow its last committed record.
+
+# The prices are recorded like WireCodec writes them, in fixed point: rounded to the nearest multiple of 1 / PRICE_SCALE
+# (a millionth). A replay is exact when the prices of the market data have at most 6 decimals, like the prices of a market;
+# a price with more decimals is replayed rounded, and the replay differs from the original run.
+
+# Besides the messages, the journal records when the driver of the system ran the pending events (PROCESS_EVENTS, FLUSH_EVENTS):
+# together with the market data (MARKET_DATA), this is everything needed to run the system again.
+# The JournalReplay class feeds the market data and these marks of a journal to a new system, which must send exactly
+# the same messages: verify compares its journal with the recorded one, byte for byte.
+
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from WireCodec import encode_into, decode_from, MESSAGE_SIZE, PRICE_SCALE
+
+
+PROCESS_EVENTS, FLUSH_EVENTS, MARKET_DATA = 0, 1, 2
+
+FILE_HEADER = struct.Struct('<4sxxxxqq40x')
+MAGIC = b'TSJ1'
+COMMITTED_OFFSET = 16
+RECORD_HEADER = struct.Struct('<qqB7x')
+RECORD_SIZE = RECORD_HEADER.size + MESSAGE_SIZE
+EMPTY_MESSAGE = bytes(MESSAGE_SIZE)
+RECORD_DTYPE = np.dtype([('sequence', '<i8'), ('timestamp', '<i8'), ('channel', 'u1'), ('pad', 'V7'), ('message', 'V%d' % MESSAGE_SIZE)])
+
+
+class EventJournal:
+
+	def __init__(self,path,clock=time.time_ns,group_size=256,capacity=4096):
+		self.path = path
+		self.clock = clock
+		self.group_size = group_size
+		self.capacity = capacity
+		self.count = 0
+		self.committed = 0
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			self.open_journal()
+		else:
+			self.file = open(path, 'w+b')
+			self.file.truncate(FILE_HEADER.size + capacity * RECORD_SIZE)
+			self.mm = mmap.mmap(self.file.fileno(), 0)
+			FILE_HEADER.pack_into(self.mm, 0, MAGIC, RECORD_SIZE, 0)
+
+	# The open_journal function reopens an existing journal after its last committed record:
+	# the records of a group which was not committed are written over.
+	def open_journal(self):
+		self.file = open(self.path, 'r+b')
+		magic, record_size, committed = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+		if magic != MAGIC or record_size != RECORD_SIZE:
+			self.file.close()
+			raise ValueError('%s is not an event journal' % self.path)
+		self.count = self.committed = committed
+		self.capacity = max(self.capacity, committed, (os.path.getsize(self.path) - FILE_HEADER.size) // RECORD_SIZE)
+		self.file.truncate(FILE_HEADER.size + self.capacity * RECORD_SIZE)
+		self.mm = mmap.mmap(self.file.fileno(), 0)
+
+	def __len__(self):
+		return self.count
+
+	# The record function appends a message sent on a channel; a mark (PROCESS_EVENTS, FLUSH_EVENTS) has no message.
+	# The message area is cleared first: a reopened journal writes over records which were not committed,
+	# and nothing of them must be left in a mark or after a shorter message.
+	def record(self,channel,message=None):
+		if self.count == self.capacity:
+			self.grow()
+		offset = FILE_HEADER.size + self.count * RECORD_SIZE
+		RECORD_HEADER.pack_into(self.mm, offset, self.count, self.clock(), channel)
+		self.mm[offset + RECORD_HEADER.size:offset + RECORD_SIZE] = EMPTY_MESSAGE
+		if message is not None:
+			encode_into(self.mm, offset + RECORD_HEADER.size, message)
+		self.count += 1
+		if self.count - self.committed >= self.group_size:
+			self.commit()
+
+	# The commit function makes the records durable, then publishes their number in the header.
+	def commit(self):
+		if self.count == self.committed:
+			return
+		self.mm.flush()
+		struct.pack_into('<q', self.mm, COMMITTED_OFFSET, self.count)
+		self.mm.flush(0, min(mmap.PAGESIZE, len(self.mm)))
+		self.committed = self.count
+
+	def grow(self):
+		self.commit()
+		self.mm.close()
+		self.capacity *= 2
+		self.file.truncate(FILE_HEADER.size + self.capacity * RECORD_SIZE)
+		self.mm = mmap.mmap(self.file.fileno(), 0)
+
+	def close(self):
+		if self.mm is None:
+			return
+		self.commit()
+		self.mm.close()
+		self.mm = None
+		self.file.close()
+
+
+# The read_records function maps the committed records of a journal as a structured array.
+def read_records(path):
+	with open(path, 'rb') as f:
+		magic, record_size, committed = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+	if magic != MAGIC or record_size != RECORD_SIZE:
+		raise ValueError('%s is not an event journal' % path)
+	if committed == 0:
+		return np.zeros(0, RECORD_DTYPE)
+	return np.memmap(path, RECORD_DTYPE, mode='r', offset=FILE_HEADER.size, shape=(committed,))
+
+# The read_journal function gives the records of a journal as (sequence, timestamp, channel, message).
+def read_journal(path):
+	records = read_records(path)
+	buffer = records.view(np.uint8)
+	for index in range(len(records)):
+		offset = index * RECORD_SIZE
+		sequence, timestamp, channel = RECORD_HEADER.unpack_from(buffer, offset)
+		message = decode_from(buffer, offset + RECORD_HEADER.size) if buffer[offset + RECORD_HEADER.size] else None
+		yield sequence, timestamp, channel, message
+
+# The first_difference function returns the sequence number of the first record which differs between two journals,
+# or None when they are identical.
+def first_difference(path,other_path):
+	records, other_records = read_records(path), read_records(other_path)
+	length = min(len(records), len(other_records))
+	rows = records[:length].view(np.uint8).reshape(length, RECORD_SIZE)
+	other_rows = other_records[:length].view(np.uint8).reshape(length, RECORD_SIZE)
+	different = np.nonzero((rows != other_rows).any(axis=1))[0]
+	if len(different) > 0:
+		return int(different[0])
+	if len(records) != len(other_records):
+		return length
+	return None
+
+
+# The JournaledChannel class wraps a channel of the system (a deque, a ScheduledChannel, a DelayedChannel):
+# a message appended to the channel is recorded in the journal, then sent. Everything else goes to the wrapped channel.
+class JournaledChannel:
+
+	def __init__(self,channel,journal,number):
+		self.__dict__.update(channel=channel, journal=journal, number=number)
+
+	def append(self,message):
+		self.journal.record(self.number, message)
+		self.channel.append(message)
+
+	def extend(self,messages):
+		for message in messages:
+			self.append(message)
+
+	def __len__(self):
+		return len(self.channel)
+
+	def __iter__(self):
+		return iter(self.channel)
+
+	def __getattr__(self,name):
+		return getattr(self.channel, name)
+
+	def __setattr__(self,name,value):
+		setattr(self.channel, name, value)
+
+
+# The JournalReplay class drives a system (an EventBasedBackTester) with the market data of a journal.
+# The system must have send_market_data, process_events and flush_events functions.
+class JournalReplay:
+
+	def __init__(self,path):
+		self.path = path
+
+	def replay(self,system):
+		for sequence, timestamp, channel, message in read_journal(self.path):
+			if channel == MARKET_DATA:
+				system.send_market_data(message)
+			elif channel == PROCESS_EVENTS:
+				system.process_events()
+			elif channel == FLUSH_EVENTS:
+				system.flush_events()
+		return system
+
+	# The verify function replays the journal on a system recording its own journal, and returns the sequence number
+	# of the first message which differs (None when the replay is identical).
+	def verify(self,system):
+		self.replay(system)
+		system.journal.commit()
+		return first_difference(self.path, system.journal.path)
+
+
+import unittest
+import tempfile
+import shutil
+from TradingMessages import Order, BookEvent
+
+class TestEventJournal(unittest.TestCase):
+
+	def setUp(self):
+		self.root = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.root)
+
+	# The records are only visible once committed, by groups; the file grows when it is full:
+	def test_group_commit(self):
+		path = os.path.join(self.root, 'journal')
+		clock = iter(range(1000, 2000))
+		journal = EventJournal(path, clock=lambda: next(clock), group_size=4, capacity=2)
+		messages = [Order(i, 100.25, 10, 'bid', 'new', symbol='GOOG') for i in range(5)] + [BookEvent(100.25, 10, -1, -1, 'GOOG')]
+		for message in messages:
+			journal.record(MARKET_DATA, message)
+		self.assertEqual(len(read_records(path)), 4)
+		journal.record(PROCESS_EVENTS)
+		journal.close()
+		records = list(read_journal(path))
+		self.assertEqual(len(records), 7)
+		self.assertEqual([r[0] for r in records], list(range(7)))
+		self.assertEqual(records[0][1], 1000)
+		self.assertEqual([r[3] for r in records[:6]], messages)
+		self.assertEqual(records[6][2:], (PROCESS_EVENTS, None))
+		self.assertIsNone(first_difference(path, path))
+
+	# Reopening a journal keeps its committed records and appends after them, writing over the records not committed:
+	# nothing of the old records is left in a mark or after a shorter message.
+	def test_reopen(self):
+		path = os.path.join(self.root, 'journal')
+		orders = [Order(index, 100.25, 10, 'bid', 'new', symbol='GOOG', strategy='dual_ma') for index in range(5)]
+		journal = EventJournal(path, clock=lambda: 1000, group_size=3, capacity=8)
+		for order in orders:
+			journal.record(MARKET_DATA, order)
+		journal.mm.close()
+		journal.file.close()
+		journal = EventJournal(path, clock=lambda: 2000, group_size=3, capacity=8)
+		self.assertEqual(len(journal), 3)
+		journal.record(PROCESS_EVENTS)
+		journal.record(MARKET_DATA, BookEvent(100.25, 10, -1, -1, 'GOOG'))
+		journal.close()
+		records = list(read_journal(path))
+		self.assertEqual([(r[0], r[1], r[2]) for r in records],
+										 [(0, 1000, MARKET_DATA), (1, 1000, MARKET_DATA), (2, 1000, MARKET_DATA), (3, 2000, PROCESS_EVENTS), (4, 2000, MARKET_DATA)])
+		self.assertEqual([r[3]['id'] for r in records[:3]], [0, 1, 2])
+		self.assertIsNone(records[3][3])
+		self.assertEqual(records[4][3], BookEvent(100.25, 10, -1, -1, 'GOOG'))
+		other_path = os.path.join(self.root, 'other_journal')
+		clock = iter([1000, 1000, 1000, 2000, 2000])
+		other = EventJournal(other_path, clock=lambda: next(clock))
+		for order in orders[:3]:
+			other.record(MARKET_DATA, order)
+		other.record(PROCESS_EVENTS)
+		other.record(MARKET_DATA, BookEvent(100.25, 10, -1, -1, 'GOOG'))
+		other.close()
+		self.assertIsNone(first_difference(path, other_path))
+		with open(os.path.join(self.root, 'other'), 'wb') as f:
+			f.write(b'not a journal' * 10)
+		self.assertRaises(ValueError, EventJournal, os.path.join(self.root, 'other'))
+
+	# The prices are recorded with 6 decimals: a price with more decimals is rounded.
+	def test_price_precision(self):
+		path = os.path.join(self.root, 'journal')
+		journal = EventJournal(path)
+		for price in (100.123456, 100.1234567, 1 / 3):
+			journal.record(MARKET_DATA, BookEvent(price, 10, price, 10, 'GOOG'))
+		journal.close()
+		prices = [message['bid_price'] for sequence, timestamp, channel, message in read_journal(path)]
+		self.assertEqual(prices, [100.123456, 100.123457, round(1 / 3, 6)])
+		self.assertEqual(PRICE_SCALE, 10 ** 6)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,132 @@
+# The EventScheduler class is the simulated clock of an event-based simulation.
+# The components schedule events (a function and its arguments) at a given simulated time, in nanoseconds.
+# The events are kept in a heap keyed on (time, sequence number): the next event is always at the top,
+# and the events scheduled at the same time are run in the order they were scheduled.
+# Running an event moves the clock to the time of the event: the clock jumps from one event to the next,
+# nothing is polled and the time between two events costs nothing.
+# A scheduled event can be cancelled (a timeout, for instance): it is only flagged and skipped when it reaches the top of the heap.
+
+# The ScheduledChannel class replaces a deque between two components: appending a message to the channel schedules
+# the call of the consumer with this message, after the latency of the channel if it has a latency model (see LatencyModel).
+# Like a network connection, the channel keeps the order of the messages.
+
+from heapq import heappush, heappop
+
+
+class EventScheduler:
+
+	def __init__(self,start_time = 0):
+		self.now = start_time
+		self.events = []
+		self.sequence = 0
+
+	def __len__(self):
+		return len(self.events)
+
+	# The getTime function gives the simulated time, like SimulatedRealClock.
+	def getTime(self):
+		return self.now
+
+	# The schedule function schedules fun(*args) at a simulated time, never before the current time.
+	# It returns the event, which can be given to cancel.
+	def schedule(self,time,fun,*args):
+		if time < self.now:
+			time = self.now
+		event = [time, self.sequence, fun, args]
+		self.sequence += 1
+		heappush(self.events, event)
+		return event
+
+	def schedule_in(self,delay,fun,*args):
+		return self.schedule(self.now + delay, fun, *args)
+
+	def cancel(self,event):
+		event[2] = None
+
+	# The next_time function returns the time of the next event, or None when no event is scheduled.
+	def next_time(self):
+		while self.events and self.events[0][2] is None:
+			heappop(self.events)
+		if not self.events:
+			return None
+		return self.events[0][0]
+
+	# The run function runs the events in time order until no event is left, or until the next event is after until.
+	# The clock is then moved to until. It returns the number of events run.
+	def run(self,until = None):
+		count = 0
+		events = self.events
+		while events and (until is None or events[0][0] <= until):
+			time, _, fun, args = heappop(events)
+			if fun is None:
+				continue
+			self.now = time
+			fun(*args)
+			count += 1
+		if until is not None and until > self.now:
+			self.now = until
+		return count
+
+
+class ScheduledChannel:
+
+	def __init__(self,scheduler,consumer,latency_model = None):
+		self.scheduler = scheduler
+		self.consumer = consumer
+		self.latency_model = latency_model
+		self.pending = 0
+		self.last_delivery_time = 0
+
+	def __len__(self):
+		return self.pending
+
+	def append(self,message):
+		time = self.scheduler.now
+		if self.latency_model is not None:
+			time += self.latency_model.latency(self.pending)
+			if time < self.last_delivery_time:
+				time = self.last_delivery_time
+			self.last_delivery_time = time
+		self.pending += 1
+		self.scheduler.schedule(time, self.deliver, message)
+
+	def deliver(self,message):
+		self.pending -= 1
+		self.consumer(message)
+
+
+import unittest
+from LatencyModel import FixedLatency
+
+class TestEventScheduler(unittest.TestCase):
+
+	# The events run in time order, in scheduling order at the same time, and the clock jumps to each event:
+	def test_run(self):
+		scheduler = EventScheduler()
+		events = []
+		scheduler.schedule(300, lambda: events.append(('c', scheduler.getTime())))
+		scheduler.schedule(100, lambda: events.append(('a', scheduler.getTime())))
+		scheduler.schedule(100, lambda: events.append(('b', scheduler.getTime())))
+		timeout = scheduler.schedule_in(200, lambda: events.append(('timeout', scheduler.getTime())))
+		self.assertEqual(scheduler.run(until=150), 2)
+		self.assertEqual(scheduler.now, 150)
+		scheduler.cancel(timeout)
+		self.assertEqual(scheduler.next_time(), 300)
+		scheduler.run()
+		self.assertEqual(events, [('a', 100), ('b', 100), ('c', 300)])
+
+	# An event can schedule other events; a channel delivers its messages in order after its latency:
+	def test_channel(self):
+		scheduler = EventScheduler()
+		received = []
+		channel = ScheduledChannel(scheduler, lambda message: received.append((message, scheduler.now)), FixedLatency(50))
+		echo = ScheduledChannel(scheduler, channel.append)
+		echo.append('a')
+		echo.append('b')
+		self.assertEqual(len(echo), 2)
+		scheduler.run()
+		self.assertEqual(received, [('a', 50), ('b', 50)])
+		self.assertEqual(len(channel), 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,140 @@
+# The latency models give the time a message takes to go from one component to another, in nanoseconds of simulated time.
+# They are used by the market simulator for the orders going to the market and the execution reports coming back,
+# and by the backtester for the market data going to the trading strategies.
+# Each model has a latency function taking the number of messages already waiting in the channel (the queue depth):
+#  - FixedLatency always returns the same latency,
+#  - SampledLatency draws the latency from a distribution; the draws are made by NumPy in blocks of block_size values
+#    so a draw costs a list index, not a call to the random generator,
+#  - QueueDepthLatency adds a delay per message waiting in front of the message, like a busy gateway.
+
+# A DelayedChannel is a channel between two components going through a latency model.
+# A message appended at the simulated time now is released at now plus the latency.
+# Like a network connection, the channel never reorders the messages: a message is never released before the previous one,
+# so the release times are sorted and a deque is enough (no heap is needed).
+
+from collections import deque
+
+import numpy as np
+
+
+class FixedLatency:
+
+	def __init__(self,latency):
+		self.value = int(latency)
+
+	def latency(self,queue_depth = 0):
+		return self.value
+
+
+class SampledLatency:
+
+	def __init__(self,sampler,block_size = 65536):
+		self.sampler = sampler
+		self.block_size = block_size
+		self.samples = []
+		self.index = 0
+
+	def latency(self,queue_depth = 0):
+		if self.index == len(self.samples):
+			self.samples = np.asarray(self.sampler(self.block_size)).astype(np.int64).tolist()
+			self.index = 0
+		value = self.samples[self.index]
+		self.index += 1
+		return value
+
+
+class QueueDepthLatency:
+
+	def __init__(self,latency,latency_per_message):
+		self.base = int(latency)
+		self.latency_per_message = int(latency_per_message)
+
+	def latency(self,queue_depth = 0):
+		return self.base + self.latency_per_message * queue_depth
+
+
+# The lognormal_sampler and empirical_sampler functions give the samplers most used with SampledLatency:
+# a lognormal distribution (median and shape), and the latencies measured on a real connection drawn with replacement.
+def lognormal_sampler(median,sigma,seed = 0):
+	random_state = np.random.RandomState(seed)
+	return lambda size: random_state.lognormal(np.log(median), sigma, size)
+
+def empirical_sampler(latencies,seed = 0):
+	random_state = np.random.RandomState(seed)
+	latencies = np.asarray(latencies)
+	return lambda size: latencies[random_state.randint(0, len(latencies), size)]
+
+
+class DelayedChannel:
+
+	def __init__(self,latency_model,output = None):
+		self.latency_model = latency_model
+		self.output = output
+		self.messages = deque()
+		self.now = 0
+		self.last_release_time = 0
+
+	def __len__(self):
+		return len(self.messages)
+
+	# The append function sends a message at the current simulated time of the channel.
+	def append(self,message):
+		self.push(self.now, message)
+
+	def push(self,now,message):
+		release_time = now + self.latency_model.latency(len(self.messages))
+		if release_time < self.last_release_time:
+			release_time = self.last_release_time
+		self.last_release_time = release_time
+		self.messages.append((release_time, message))
+
+	# The next_time function returns the release time of the next message, or None when the channel is empty.
+	def next_time(self):
+		if not self.messages:
+			return None
+		return self.messages[0][0]
+
+	# The pop_due function gives the messages released at the time now with their release time.
+	def pop_due(self,now):
+		while self.messages and self.messages[0][0] <= now:
+			yield self.messages.popleft()
+
+	# The advance function moves the simulated time of the channel to now and appends the released messages to the output.
+	def advance(self,now):
+		released = 0
+		for _, message in self.pop_due(now):
+			self.output.append(message)
+			released += 1
+		if now > self.now:
+			self.now = now
+		return released
+
+
+import unittest
+
+class TestLatencyModel(unittest.TestCase):
+
+	def test_models(self):
+		self.assertEqual(FixedLatency(1000).latency(5), 1000)
+		self.assertEqual(QueueDepthLatency(1000, 10).latency(5), 1050)
+		latency = SampledLatency(empirical_sampler([100, 200, 300]), block_size=4)
+		samples = [latency.latency() for i in range(10)]
+		self.assertTrue(set(samples) <= {100, 200, 300})
+		latency = SampledLatency(lognormal_sampler(1000, 0.5))
+		self.assertAlmostEqual(np.median([latency.latency() for i in range(10001)]), 1000, delta=50)
+
+	# A message never overtakes the previous one, even when its latency is shorter:
+	def test_delayed_channel(self):
+		output = []
+		channel = DelayedChannel(SampledLatency(lambda size: [500, 100] * (size // 2)), output)
+		channel.push(0, 'a')
+		channel.push(10, 'b')
+		self.assertEqual(channel.next_time(), 500)
+		self.assertEqual(channel.advance(499), 0)
+		self.assertEqual(channel.advance(500), 2)
+		self.assertEqual(output, ['a', 'b'])
+		channel.append('c')
+		self.assertEqual(channel.next_time(), 1000)
+
+if __name__ == '__main__':
+	unittest.main()
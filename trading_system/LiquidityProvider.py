@@ -1,96 +1,198 @@
-#In the code, we will create the LiquidityProvider class. 
-#The goal of this class is to act as a liquidity provider or an exchange. 
-#It will send price updates to the trading system. 
+#In the code, we will create the LiquidityProvider class.
+#The goal of this class is to act as a liquidity provider or an exchange.
+#It will send price updates to the trading system.
 #It will use the lp_2_gateway channel to send the price updates.
 
+#In replay mode, the liquidity provider sends order book messages recorded on disk instead of random orders.
+#The data source is any iterable of orders, usually the generator read_orders_from_tick_store.
+#The messages are read ahead by blocks of read_ahead messages, and read_tick_data_from_data_source
+#never lets more than max_pending messages wait in lp_2_gateway: when the trading system is late, the replay waits for it.
+#Since the data source is a generator, a replay of any size runs in constant memory.
 
-from random import randrange 
+#The timestamps of the orders are integer nanoseconds since the epoch. A timestamp given as an ISO string
+#is converted once, when the order enters the system, with the cached parser of SimulatedRealClock.
+
+
+from random import randrange
 from random import sample, seed #Since we randomly generate liquidities, we will use a pseudo random generator initialized by a seed.
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from TradingMessages import Order
+from SimulatedRealClock import parse_timestamp
 
 
 class LiquidityProvider:
-  
-  def __init__(self, lp_2_gateway=None):
-    self.orders = []
-    self.order_id = 0
-    seed(0)
-    self.lp_2_gateway = lp_2_gateway
-    
-  # We create a utility function to look up orders in the list of orders.
-  def lookup_orders(self,id): 
-    
-    count=0
-    for o in self.orders: 
-      if o['id'] == id:
-        return o, count 
-      count+=1
-    return None, None
-  
-  # The insert_manual_order function will insert orders manually into the trading system.
-  def insert_manual_order(self,order): 
-    if self.lp_2_gateway is None:
-      print('simulation mode')
-      return order 
-    self.lp_2_gateway.append(order.copy())
-    
-  # The generate_random_order function will generate orders randomly. There will be three types of orders:
-  # New (we will create a new Order ID)
-  # Modify (we will use the order ID of an order that it was created and we will change the quantity)
-  # Delete (we will use the order ID and we will delete the order)
-  
-  #Each time we create a new order, we will need to increment the order ID. 
-  #We will use thelookup_orders function as shown in the following code to check
-  #whether the order has already been created. 
-  
-  def generate_random_order(self): 
-		
-    price = randrange(8,12) 
-    quantity = randrange(1,10)*100 
-    side = sample(['buy','sell'],1)[0] 
-    order_id = randrange(0,self.order_id+1) 
-    o = self.lookup_orders(order_id)
-    
-    new_order = False 
-    if o is None:
-      action = 'new'
-      new_order = True 
-    else:
+
+	def __init__(self, lp_2_gateway=None, data_source=None, read_ahead=1000, max_pending=1000):
+		self.orders = []
+		self.order_id = 0
+		seed(0)
+		self.lp_2_gateway = lp_2_gateway
+		self.data_source = iter(data_source) if data_source is not None else None
+		self.read_ahead = read_ahead
+		self.max_pending = max_pending
+		self.read_ahead_buffer = deque()
+
+	# We create a utility function to look up orders in the list of orders.
+	def lookup_orders(self,id):
+
+		count=0
+		for o in self.orders:
+			if o['id'] == id:
+				return o, count
+			count+=1
+		return None, None
+
+	# The insert_manual_order function will insert orders manually into the trading system.
+	def insert_manual_order(self,order):
+		if self.lp_2_gateway is None:
+			print('simulation mode')
+			return order
+		order = order.copy()
+		if isinstance(order.get('timestamp'), str):
+			order['timestamp'] = parse_timestamp(order['timestamp'])
+		self.lp_2_gateway.append(order)
+
+	# The generate_random_order function will generate orders randomly. There will be three types of orders:
+	# New (we will create a new Order ID)
+	# Modify (we will use the order ID of an order that it was created and we will change the quantity)
+	# Delete (we will use the order ID and we will delete the order)
+
+	#Each time we create a new order, we will need to increment the order ID.
+	#We will use thelookup_orders function as shown in the following code to check
+	#whether the order has already been created.
+
+	#The order is built once as an Order and sent as is: the liquidity provider never changes an order after sending it,
+	#so there is no need to copy it again before appending it to the channel.
+
+	def generate_random_order(self):
+
+		price = randrange(8,12)
+		quantity = randrange(1,10)*100
+		side = sample(['buy','sell'],1)[0]
+		order_id = randrange(0,self.order_id+1)
+		o, _ = self.lookup_orders(order_id)
+
+		new_order = False
+		if o is None:
+			action = 'new'
+			new_order = True
+		else:
 			action = sample(['modify','delete'],1)[0]
-			
-			ord = {'id': self.order_id, 
-						 'price': price, 
-						 'quantity': quantity, 
-						 'side': side, 
-						 'action': action
-						}
 
-		if not new_order: 
+		ord = Order(order_id, price, quantity, side, action)
+
+		if new_order:
 			self.order_id+=1
 			self.orders.append(ord)
-		
-		if not self.lp_2_gateway: 
-			print('simulation mode') 
+
+		if self.lp_2_gateway is None:
+			print('simulation mode')
 			return ord
-    
-		self.lp_2_gateway.append(ord.copy())
-  
-	#We test whether the LiquidityProvider class works correctly by using unit testing. 
-	#Python has the unittest module. 
-	#As shown, we will create the TestMarketSimulator class, inheriting from TestCase.
-	
-	import unittest
-	
-	import LiquidityProvider
-	
-	class TestMarketSimulator(unittest.TestCase): 
-		
-		def setUp(self):
-			self.liquidity_provider = LiquidityProvider()
-			
-		def test_add_liquidity(self): 
-			self.liquidity_provider.generate_random_order() 
-			self.assertEqual(self.liquidity_provider.orders[0]['id'],0)
-			self.assertEqual(self.liquidity_provider.orders[0]['side'], 'buy') 
-			self.assertEqual(self.liquidity_provider.orders[0]['quantity'], 700) 
-			self.assertEqual(self.liquidity_provider.orders[0]['price'], 11) OrderBook class
-     
+
+		self.lp_2_gateway.append(ord)
+
+	#The read_tick_data_from_data_source function sends the recorded messages to lp_2_gateway
+	#until max_pending messages are waiting in the channel. It returns the number of messages sent;
+	#0 with an empty channel means that the replay is over.
+	def read_tick_data_from_data_source(self):
+		if self.data_source is None:
+			print('no data source')
+			return 0
+		if self.lp_2_gateway is None:
+			print('simulation mode')
+			return 0
+		sent = 0
+		while len(self.lp_2_gateway) < self.max_pending:
+			if not self.read_ahead_buffer:
+				self.read_ahead_buffer.extend(islice(self.data_source, self.read_ahead))
+				if not self.read_ahead_buffer:
+					break
+			self.lp_2_gateway.append(self.read_ahead_buffer.popleft())
+			sent += 1
+		return sent
+
+
+#The read_orders_from_tick_store generator reads the order book messages of a symbol recorded in a TickStore
+#(columns id, price, quantity, side, action and timestamp when recorded) and gives them one by one as orders.
+def read_orders_from_tick_store(tick_store,symbol,chunk_size=10000):
+	columns = ['id', 'price', 'quantity', 'side', 'action']
+	for chunk in tick_store.read(symbol, chunk_size=chunk_size):
+		timestamps = chunk['timestamp'].tolist() if 'timestamp' in chunk else [None] * len(chunk['id'])
+		for id, price, quantity, side, action, timestamp in zip(*(chunk[column].tolist() for column in columns), timestamps):
+			yield Order(id, price, quantity, side, action, symbol=symbol, timestamp=timestamp)
+
+#The record_orders function writes a list of orders in one partition of a TickStore.
+#The timestamps are recorded in nanoseconds when all the orders have one.
+def record_orders(tick_store,symbol,partition,orders):
+	columns = {'id': [o['id'] for o in orders],
+						 'price': [o['price'] for o in orders],
+						 'quantity': [o['quantity'] for o in orders],
+						 'side': [o['side'] for o in orders],
+						 'action': [o['action'] for o in orders]
+						}
+	if all('timestamp' in o for o in orders):
+		columns['timestamp'] = np.array([parse_timestamp(o['timestamp']) for o in orders], dtype=np.int64)
+	tick_store.write(symbol, partition, columns)
+
+#We test whether the LiquidityProvider class works correctly by using unit testing.
+#Python has the unittest module.
+#As shown, we will create the TestMarketSimulator class, inheriting from TestCase.
+
+import unittest
+import tempfile
+import shutil
+from TickStore import TickStore
+
+class TestMarketSimulator(unittest.TestCase):
+
+	def setUp(self):
+		self.liquidity_provider = LiquidityProvider()
+
+	def test_add_liquidity(self):
+		self.liquidity_provider.generate_random_order()
+		self.assertEqual(self.liquidity_provider.orders[0]['id'],0)
+		self.assertEqual(self.liquidity_provider.orders[0]['side'], 'buy')
+		self.assertEqual(self.liquidity_provider.orders[0]['quantity'], 700)
+		self.assertEqual(self.liquidity_provider.orders[0]['price'], 11)
+
+	#The replay sends the recorded orders in order, never more than max_pending at a time:
+	def test_replay(self):
+		root = tempfile.mkdtemp()
+		try:
+			tick_store = TickStore(root)
+			orders = [{'id': i, 'price': 100 + i, 'quantity': 10, 'side': 'bid', 'action': 'new'} for i in range(25)]
+			record_orders(tick_store, 'GOOG', '2018-06-29', orders[:10])
+			record_orders(tick_store, 'GOOG', '2018-06-30', orders[10:])
+			lp_2_gateway = deque()
+			liquidity_provider = LiquidityProvider(lp_2_gateway, read_orders_from_tick_store(tick_store, 'GOOG'), read_ahead=4, max_pending=8)
+			received = []
+			while liquidity_provider.read_tick_data_from_data_source() or lp_2_gateway:
+				self.assertLessEqual(len(lp_2_gateway), 8)
+				received.append(lp_2_gateway.popleft())
+			self.assertEqual([o['id'] for o in received], list(range(25)))
+			self.assertEqual(received[3], dict(orders[3], symbol='GOOG'))
+		finally:
+			shutil.rmtree(root)
+
+	#The ISO timestamps are converted to nanoseconds when the orders enter the system:
+	def test_timestamps(self):
+		root = tempfile.mkdtemp()
+		try:
+			tick_store = TickStore(root)
+			orders = [{'id': i, 'price': 100, 'quantity': 10, 'side': 'bid', 'action': 'new', 'timestamp': '2018-06-29 08:15:27.%06d' % (i)} for i in range(3)]
+			record_orders(tick_store, 'GOOG', '2018-06-29', orders)
+			replayed = list(read_orders_from_tick_store(tick_store, 'GOOG'))
+			self.assertEqual([o['timestamp'] for o in replayed], [1530260127000000 * 1000 + i * 1000 for i in range(3)])
+			lp_2_gateway = deque()
+			LiquidityProvider(lp_2_gateway).insert_manual_order(orders[1])
+			self.assertEqual(lp_2_gateway[0]['timestamp'], replayed[1]['timestamp'])
+			self.assertEqual(orders[1]['timestamp'], '2018-06-29 08:15:27.000001')
+		finally:
+			shutil.rmtree(root)
+
+if __name__ == '__main__':
+	unittest.main()
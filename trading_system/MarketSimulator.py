@@ -0,0 +1,504 @@
+# The MarketSimulator class is central in validating your trading strategy.
+# This class will be used to fix the market assumptions.
+
+# When the simulator is given the order book of the market (an OrderBook, or a BookManager for several symbols),
+# it works as a matching engine:
+#  - a new order is first matched against the liquidity of the other side of the market book,
+#    best price first and, within a price level, in the arrival order of the market orders (price-time priority),
+#  - what is left rests in the simulator at its limit price, behind the quantity already resting at this price
+#    in the market book (its queue position),
+#  - when the market book changes (handle_market_data), the cancellations ahead of a resting order move it up the queue
+#    and the market orders crossing its price first fill the quantity ahead of it, then the order itself.
+# Each fill is reported on gw_2_om with the status partially_filled or filled, the fill price, the fill quantity
+# and the quantity left. The liquidity taken by our orders is remembered per market order so it is never traded twice.
+# The market book itself is never changed by the simulator: it stays the replay of the market.
+
+# The resting orders are indexed like the OrderBook: by id, and per side by price level with a sorted list of the prices,
+# so a message never scans all the orders.
+# Without a market book, the orders are only accepted and fill_all_orders fills them at their price.
+
+# The orders can take time to reach the market, and the execution reports time to come back (see LatencyModel).
+# With an order_latency, handle_order only sends the order through a DelayedChannel: the order is executed when the
+# simulated time, moved forward by advance_time, reaches its arrival time, against the state of the market book at that time.
+# With a report_latency, the execution reports reach gw_2_om after their latency.
+
+from bisect import bisect_left, insort
+
+from TradingMessages import ExecutionReport
+from LatencyModel import DelayedChannel
+from OrderBook import PriceLevel
+from BookManager import BookManager
+
+
+BUY_SIDES = ('buy', 'bid')
+
+
+# A SimulatorBook holds the orders resting in the simulator for one symbol.
+# Like in the OrderBook, the bid prices are negated in the sorted list so the best level is at index 0 on both sides.
+class SimulatorBook:
+
+	def __init__(self):
+		self.bid_levels = {}
+		self.ask_levels = {}
+		self.bid_prices = []
+		self.ask_prices = []
+
+	def get_side(self,buy):
+		if buy:
+			return self.bid_levels, self.bid_prices, -1
+		return self.ask_levels, self.ask_prices, 1
+
+	def add(self,order,quantity):
+		levels, prices, sign = self.get_side(order['side'] in BUY_SIDES)
+		level = levels.get(order['price'])
+		if level is None:
+			level = PriceLevel(order['price'])
+			levels[order['price']] = level
+			insort(prices, sign * order['price'])
+		level.orders[order['id']] = order
+		level.quantity += quantity
+
+	def remove(self,order,quantity):
+		levels, prices, sign = self.get_side(order['side'] in BUY_SIDES)
+		level = levels[order['price']]
+		del level.orders[order['id']]
+		level.quantity -= quantity
+		if not level.orders:
+			del levels[order['price']]
+			del prices[bisect_left(prices, sign * order['price'])]
+
+
+class MarketSimulator:
+	def __init__(self, om_2_gw=None,gw_2_om=None,order_book=None,order_latency=None,report_latency=None):
+		self.orders = {}
+		self.books = {}
+		self.leaves_quantity = {}
+		self.queue_ahead = {}
+		self.consumed = {}
+		self.market_orders = {}
+		self.order_book = order_book
+		self.om_2_gw = om_2_gw
+		self.gw_2_om = gw_2_om
+		self.now = 0
+		self.inbound = DelayedChannel(order_latency) if order_latency is not None else None
+		self.outbound = DelayedChannel(report_latency) if report_latency is not None else None
+
+	# The lookup_orders function will help to look up outstanding orders:
+	def lookup_orders(self,order):
+		return self.orders.get(order['id'])
+
+	# The get_market_book function returns the market book of a symbol, or None when the simulator has no market book.
+	def get_market_book(self,symbol):
+		if self.order_book is None:
+			return None
+		if isinstance(self.order_book, BookManager):
+			return self.order_book.books.get(symbol)
+		return self.order_book
+
+	def get_book(self,symbol):
+		book = self.books.get(symbol)
+		if book is None:
+			book = SimulatorBook()
+			self.books[symbol] = book
+		return book
+
+	# The handle_order_from_gw function will collect the order from the gateway (the order manager) through the om_2_gw channel:
+	def handle_order_from_gw(self):
+		if self.om_2_gw is not None:
+			if len(self.om_2_gw)>0:
+				self.handle_order(self.om_2_gw.popleft())
+			else:
+				print('simulation mode')
+
+	# The handle_orders function handles a list of orders in one call and returns the list of execution reports,
+	# collected in a list standing for the gw_2_om channel during the call.
+	def handle_orders(self,orders):
+		gw_2_om = self.gw_2_om
+		self.gw_2_om = reports = []
+		try:
+			for order in orders:
+				self.handle_order(order)
+		finally:
+			self.gw_2_om = gw_2_om
+		return reports
+
+	# The send_report function sends the execution report of an order to the order manager.
+	def send_report(self,order,fill_price = None,fill_quantity = None):
+		if self.gw_2_om is None:
+			print('simulation mode')
+			return
+		report = ExecutionReport.from_order(order)
+		if fill_quantity is not None:
+			report.fill_price = fill_price
+			report.fill_quantity = fill_quantity
+			report.leaves_quantity = self.leaves_quantity.get(order['id'], 0)
+		if self.outbound is not None:
+			self.outbound.push(self.now, report)
+		else:
+			self.gw_2_om.append(report)
+
+	# The advance_time function moves the simulated time forward to now.
+	# The orders and the reports whose arrival time has come are handled in the order of their arrival time,
+	# the time of the simulator being the arrival time while an order is executed.
+	def advance_time(self,now):
+		while True:
+			order_time = self.inbound.next_time() if self.inbound is not None else None
+			report_time = self.outbound.next_time() if self.outbound is not None else None
+			if order_time is not None and order_time <= now and (report_time is None or order_time <= report_time):
+				if order_time > self.now:
+					self.now = order_time
+				_, order = self.inbound.messages.popleft()
+				self.execute_order(order)
+			elif report_time is not None and report_time <= now:
+				_, report = self.outbound.messages.popleft()
+				if self.gw_2_om is not None:
+					self.gw_2_om.append(report)
+				else:
+					print('simulation mode')
+			else:
+				break
+		if now > self.now:
+			self.now = now
+
+	# The trading rule that we use in the handle_order function will accept any new orders.
+	# If an order already has the same order ID, the order will be dropped.
+	# A new order is matched against the market book, then rests in the simulator.
+	# If the order manager cancels an order, the order is removed.
+	# An amended order keeps its place in the queue when only its quantity is reduced, otherwise it goes to the end of the queue
+	# of its new price and is matched again. An order amended down to its filled quantity or below is cancelled:
+	# nothing is left to trade, and its quantity becomes the quantity filled.
+	# The answers sent to the order manager are execution reports built from the order:
+
+	def handle_order(self, order):
+		if self.inbound is not None:
+			self.inbound.push(self.now, order)
+			return
+		self.execute_order(order)
+
+	def execute_order(self, order):
+		o=self.lookup_orders(order)
+		if o is None:
+			if order['action'] == 'New':
+				order['status'] = 'accepted'
+				self.orders[order['id']] = order
+				self.leaves_quantity[order['id']] = order['quantity']
+				self.send_report(order)
+				self.match_order(order, self.get_market_book(order.get('symbol')))
+				if order['id'] in self.orders:
+					self.rest_order(order)
+				return
+			elif order['action'] == 'Cancel' or order['action'] == 'Amend':
+				print('Order id - not found - Rejection')
+				self.send_report(order)
+				return
+		elif o is not None:
+			if order['action'] == 'New':
+				print('Duplicate order id - Rejection')
+				return
+			elif order['action'] == 'Cancel':
+				o['status']='cancelled'
+				self.remove_order(o)
+				self.send_report(o)
+				print('Order cancelled')
+			elif order['action'] == 'Amend':
+				self.amend_order(o, order)
+				print('Order amended')
+
+	def amend_order(self,o,order):
+		price = order.get('price', o['price'])
+		quantity = order.get('quantity', o['quantity'])
+		leaves = max(quantity - (o['quantity'] - self.leaves_quantity[o['id']]), 0)
+		o['status'] = 'accepted'
+		if leaves == 0:
+			o['quantity'] -= self.leaves_quantity[o['id']]
+			o['status'] = 'cancelled'
+			self.remove_order(o)
+			self.send_report(o)
+			return
+		book = self.get_book(o.get('symbol'))
+		if price == o['price'] and quantity <= o['quantity']:
+			book.get_side(o['side'] in BUY_SIDES)[0][o['price']].quantity -= self.leaves_quantity[o['id']] - leaves
+			self.leaves_quantity[o['id']] = leaves
+			o['quantity'] = quantity
+			self.send_report(o)
+			return
+		book.remove(o, self.leaves_quantity[o['id']])
+		self.queue_ahead.pop(o['id'], None)
+		o['price'] = price
+		o['quantity'] = quantity
+		self.leaves_quantity[o['id']] = leaves
+		self.send_report(o)
+		self.match_order(o, self.get_market_book(o.get('symbol')))
+		if o['id'] in self.orders:
+			self.rest_order(o)
+
+	# The rest_order function puts an order in the simulator book, behind the quantity resting at its price in the market book.
+	def rest_order(self,order):
+		self.get_book(order.get('symbol')).add(order, self.leaves_quantity[order['id']])
+		market_book = self.get_market_book(order.get('symbol'))
+		if market_book is not None:
+			_, levels, _, _ = market_book.get_side('bid' if order['side'] in BUY_SIDES else 'ask')
+			level = levels.get(order['price'])
+			self.queue_ahead[order['id']] = level.quantity if level is not None else 0
+
+	def remove_order(self,order):
+		leaves = self.leaves_quantity.pop(order['id'])
+		book = self.get_book(order.get('symbol'))
+		levels, _, _ = book.get_side(order['side'] in BUY_SIDES)
+		level = levels.get(order['price'])
+		if level is not None and order['id'] in level.orders:
+			book.remove(order, leaves)
+		del self.orders[order['id']]
+		self.queue_ahead.pop(order['id'], None)
+
+	# The match_order function matches an order against the other side of the market book, best price first
+	# and in the arrival order of the market orders within a price level.
+	# The quantity resting ahead of the order at its price is served first.
+	# It stops at the first price level not crossing the limit price of the order, or when the order is filled.
+	def match_order(self,order,market_book):
+		if market_book is None:
+			return
+		buy = order['side'] in BUY_SIDES
+		market_side = 'ask' if buy else 'bid'
+		_, levels, prices, sign = market_book.get_side(market_side)
+		limit = order['price']
+		for key in prices:
+			price = sign * key
+			if (buy and price > limit) or (not buy and price < limit):
+				return
+			for market_order in levels[price].orders.values():
+				market_key = (market_side, market_order['id'])
+				available = market_order['quantity'] - self.consumed.get(market_key, 0)
+				if available <= 0:
+					continue
+				ahead = self.queue_ahead.get(order['id'], 0)
+				if ahead > 0:
+					taken = min(ahead, available)
+					self.queue_ahead[order['id']] = ahead - taken
+					self.consumed[market_key] = self.consumed.get(market_key, 0) + taken
+					available -= taken
+					if available == 0:
+						continue
+				quantity = min(available, self.leaves_quantity[order['id']])
+				self.consumed[market_key] = self.consumed.get(market_key, 0) + quantity
+				self.fill_order(order, price, quantity)
+				if order['id'] not in self.orders:
+					return
+
+	# The fill_order function fills a quantity of an order and reports the fill.
+	def fill_order(self,order,price,quantity):
+		leaves = self.leaves_quantity[order['id']] - quantity
+		if leaves == 0:
+			order['status'] = 'filled'
+			self.remove_order(order)
+		else:
+			order['status'] = 'partially_filled'
+			self.leaves_quantity[order['id']] = leaves
+			levels, _, _ = self.get_book(order.get('symbol')).get_side(order['side'] in BUY_SIDES)
+			level = levels.get(order['price'])
+			if level is not None and order['id'] in level.orders:
+				level.quantity -= quantity
+		self.send_report(order, price, quantity)
+
+	# The handle_market_data function is called with each message of the market once the market book has handled it.
+	# A delete or a modify reduces the quantity ahead of our orders resting at its price,
+	# and the resting orders crossed by the market book are matched.
+	def handle_market_data(self,market_order):
+		symbol = market_order.get('symbol')
+		market_book = self.get_market_book(symbol)
+		if market_book is None:
+			return
+		side, price = self.find_market_order(market_order)
+		market_key = (side, market_order['id'])
+		if market_order['action'] == 'new':
+			self.market_orders.setdefault(market_key, price)
+		else:
+			if market_order['action'] == 'delete':
+				self.market_orders.pop(market_key, None)
+			if market_order['action'] != 'modify':
+				self.consumed.pop(market_key, None)
+		book = self.books.get(symbol)
+		if book is None:
+			return
+		if market_order['action'] != 'new':
+			self.update_queue_ahead(book, market_book, side, price)
+		self.match_resting_orders(book, market_book)
+
+	# The find_market_order function gives the side and the price of a message of the market.
+	# A delete or a modify can carry only the id, and the market book has already removed a deleted order:
+	# the side and the price of the market orders are kept by side and id, and like in the OrderBook,
+	# a message without a side is looked up on the bid side first.
+	def find_market_order(self,market_order):
+		side = market_order.get('side')
+		if side is None:
+			side = 'bid' if ('bid', market_order['id']) in self.market_orders else 'ask'
+		return side, self.market_orders.get((side, market_order['id']), market_order.get('price'))
+
+	def update_queue_ahead(self,book,market_book,side,price):
+		buy = side in BUY_SIDES
+		levels, _, _ = book.get_side(buy)
+		level = levels.get(price) if price is not None else None
+		if level is None:
+			return
+		_, market_levels, _, _ = market_book.get_side('bid' if buy else 'ask')
+		market_level = market_levels.get(level.price)
+		market_quantity = market_level.quantity if market_level is not None else 0
+		for order in level.orders.values():
+			if self.queue_ahead.get(order['id'], 0) > market_quantity:
+				self.queue_ahead[order['id']] = market_quantity
+
+	# The match_resting_orders function matches the resting orders of each side, best price first, in time priority.
+	# Matching stops on a side as soon as an order cannot be completely filled: the crossing liquidity is exhausted.
+	def match_resting_orders(self,book,market_book):
+		for buy in (True, False):
+			levels, prices, sign = book.get_side(buy)
+			_, _, market_prices, market_sign = market_book.get_side('ask' if buy else 'bid')
+			while prices and market_prices:
+				price = sign * prices[0]
+				best = market_sign * market_prices[0]
+				if (buy and best > price) or (not buy and best < price):
+					break
+				order = levels[price].first_order()
+				self.match_order(order, market_book)
+				if order['id'] in self.orders:
+					break
+
+	# The fill_all_orders function fills all the resting orders at their price.
+	def fill_all_orders(self):
+		for order in list(self.orders.values()):
+			self.fill_order(order, order['price'], self.leaves_quantity[order['id']])
+
+# The unit test will ensure that the trading rules are verified:
+import unittest
+from collections import deque
+from OrderBook import OrderBook
+from LatencyModel import FixedLatency
+from OrderManager import OrderManager
+from Strategy import Strategy
+
+class TestMarketSimulator(unittest.TestCase):
+
+	def setUp(self):
+		self.market_simulator = MarketSimulator()
+
+	def test_accept_order(self):
+		self.market_simulator
+		order1 = {'id': 10,
+							'price': 219,
+							'quantity': 10,
+							'side': 'bid',
+							'action' : 'New'
+						 }
+		self.market_simulator.handle_order(order1)
+		self.assertEqual(len(self.market_simulator.orders),1)
+		self.assertEqual(self.market_simulator.orders[10]['status'], 'accepted')
+
+	def test_reject_amend_of_unknown_order(self):
+		self.market_simulator
+		order1 = {'id': 10,
+							'price': 219,
+							'quantity': 10,
+							'side': 'bid',
+							'action' : 'Amend'
+						 }
+		self.market_simulator.handle_order(order1)
+		self.assertEqual(len(self.market_simulator.orders),0)
+
+	def market_order(self,id,price,quantity,side,action='new'):
+		return {'id': id, 'price': price, 'quantity': quantity, 'side': side, 'action': action}
+
+	# A new order takes the liquidity of the book best price first, then in the arrival order of the market orders,
+	# and the liquidity already taken cannot be traded again:
+	def test_price_time_priority(self):
+		order_book = OrderBook()
+		for o in [self.market_order(1, 100, 5, 'ask'), self.market_order(2, 100, 5, 'ask'), self.market_order(3, 101, 10, 'ask')]:
+			order_book.handle_order(o)
+		gw_2_om = deque()
+		market_simulator = MarketSimulator(gw_2_om=gw_2_om, order_book=order_book)
+		market_simulator.handle_order({'id': 1, 'price': 101, 'quantity': 12, 'side': 'buy', 'action': 'New'})
+		self.assertEqual([(r['status'], r.get('fill_price'), r.get('fill_quantity'), r.get('leaves_quantity')) for r in gw_2_om],
+										 [('accepted', None, None, None), ('partially_filled', 100, 5, 7), ('partially_filled', 100, 5, 2), ('filled', 101, 2, 0)])
+		gw_2_om.clear()
+		market_simulator.handle_order({'id': 2, 'price': 101, 'quantity': 10, 'side': 'buy', 'action': 'New'})
+		self.assertEqual(gw_2_om[-1]['status'], 'partially_filled')
+		self.assertEqual(gw_2_om[-1]['fill_quantity'], 8)
+		self.assertEqual(market_simulator.books[None].bid_levels[101].quantity, 2)
+		self.assertEqual(order_book.ask_levels[101].quantity, 10)
+
+	# With an order latency, the order is matched against the book at its arrival time, not at its sending time:
+	def test_order_latency(self):
+		order_book = OrderBook()
+		gw_2_om = deque()
+		market_simulator = MarketSimulator(gw_2_om=gw_2_om, order_book=order_book, order_latency=FixedLatency(100), report_latency=FixedLatency(50))
+		order_book.handle_order(self.market_order(1, 100, 10, 'ask'))
+		market_simulator.handle_order({'id': 1, 'price': 100, 'quantity': 5, 'side': 'buy', 'action': 'New'})
+		market_simulator.advance_time(99)
+		self.assertEqual(market_simulator.orders, {})
+		order_book.handle_order(self.market_order(2, 99, 10, 'ask'))
+		market_simulator.advance_time(149)
+		self.assertEqual(len(gw_2_om), 0)
+		market_simulator.advance_time(150)
+		self.assertEqual([(r['status'], r.get('fill_price')) for r in gw_2_om], [('accepted', None), ('filled', 99)])
+
+	# A resting order is filled only once the quantity ahead of it in the queue has traded:
+	def test_queue_position(self):
+		order_book = OrderBook()
+		gw_2_om = deque()
+		market_simulator = MarketSimulator(gw_2_om=gw_2_om, order_book=order_book)
+		for o in [self.market_order(1, 99, 10, 'bid')]:
+			order_book.handle_order(o)
+			market_simulator.handle_market_data(o)
+		market_simulator.handle_order({'id': 1, 'price': 99, 'quantity': 5, 'side': 'buy', 'action': 'New'})
+		self.assertEqual(market_simulator.queue_ahead[1], 10)
+		for o in [self.market_order(1, 99, 4, 'bid', 'modify'), self.market_order(2, 99, 6, 'ask')]:
+			order_book.handle_order(o)
+			market_simulator.handle_market_data(o)
+		self.assertEqual(market_simulator.queue_ahead[1], 0)
+		self.assertEqual(gw_2_om[-1], {'id': 1, 'price': 99, 'quantity': 5, 'side': 'buy', 'action': 'New', 'status': 'partially_filled',
+																	 'fill_price': 99, 'fill_quantity': 2, 'leaves_quantity': 3})
+		market_simulator.handle_order({'id': 1, 'action': 'Cancel'})
+		self.assertEqual(gw_2_om[-1]['status'], 'cancelled')
+		self.assertEqual(market_simulator.orders, {})
+		self.assertEqual(market_simulator.books[None].bid_prices, [])
+
+	# A delete carrying only the id moves our order up the queue, and frees the liquidity it had consumed:
+	def test_delete_by_id(self):
+		order_book = OrderBook()
+		gw_2_om = deque()
+		market_simulator = MarketSimulator(gw_2_om=gw_2_om, order_book=order_book)
+		for o in [self.market_order(1, 99, 10, 'bid'), self.market_order(2, 99, 5, 'bid')]:
+			order_book.handle_order(o)
+			market_simulator.handle_market_data(o)
+		market_simulator.handle_order({'id': 1, 'price': 99, 'quantity': 5, 'side': 'buy', 'action': 'New'})
+		self.assertEqual(market_simulator.queue_ahead[1], 15)
+		for o in [{'id': 1, 'action': 'delete'}, self.market_order(3, 99, 8, 'ask')]:
+			order_book.handle_order(o)
+			market_simulator.handle_market_data(o)
+		self.assertEqual(market_simulator.market_orders, {('bid', 2): 99, ('ask', 3): 99})
+		self.assertEqual(market_simulator.queue_ahead[1], 0)
+		self.assertEqual([(r['status'], r.get('fill_quantity')) for r in gw_2_om], [('accepted', None), ('partially_filled', 3)])
+
+	# An order amended below its filled quantity is cancelled, the strategy keeps the position of the fills only:
+	def test_amend_below_filled_quantity(self):
+		order_book = OrderBook()
+		order_book.handle_order(self.market_order(1, 100, 60, 'ask'))
+		strategy = Strategy(ts_2_om=deque(), name='ma')
+		order_manager = OrderManager(om_2_ts=deque(), om_2_gw=deque())
+		market_simulator = MarketSimulator(gw_2_om=deque(), order_book=order_book)
+		strategy.send_order(100, 100, 'buy')
+		strategy.execution()
+		order_manager.handle_order_from_trading_strategy(strategy.ts_2_om.popleft())
+		order = order_manager.om_2_gw.popleft()
+		market_simulator.handle_order(order)
+		market_simulator.handle_order({'id': order['id'], 'action': 'Amend', 'quantity': 50})
+		self.assertEqual([r['status'] for r in market_simulator.gw_2_om], ['accepted', 'partially_filled', 'cancelled'])
+		for report in market_simulator.gw_2_om:
+			order_manager.handle_order_from_gateway(report)
+		for report in order_manager.om_2_ts:
+			strategy.handle_market_response(report)
+		self.assertEqual((strategy.position, strategy.cash), (60, 10000 - 6000))
+		self.assertEqual(strategy.orders, {})
+		self.assertEqual(market_simulator.orders, {})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,259 +1,507 @@
-# We will build an OrderBook class; 
+# We will build an OrderBook class;
 # this class will collect orders from LiquidityProvider and sort the orders and create book events.
 # The book events in a trading system are preset events and these events can be anything
-# a trader thinks it is worth knowing. 
-# In this implementation, we choose to generate a book event each time there is a change on the top of the book 
+# a trader thinks it is worth knowing.
+# In this implementation, we choose to generate a book event each time there is a change on the top of the book
 # (any changes in the first level of the book will create an event).
 
-# We will code OrderBook by having a list for asks and bids. 
+# The book is indexed in two ways so that no message has to scan the resting orders:
+#  - an id -> order hash index per side resolves modify and delete in O(1),
+#  - per side, a dictionary price -> PriceLevel holds the orders of one price in arrival order (FIFO),
+#    and a sorted list of the level prices (best first) gives the top of the book in O(1)
+#    and finds where to insert or remove a level in O(log levels).
+# The bid prices are stored negated so that both sorted lists are ascending and the best level is always at index 0.
+# The top of the book is maintained incrementally: an update flags its side only when it hits the best level,
+# and the book event is generated only when the price or the quantity published for the first level really changed.
+# The book can also give the first N aggregated price levels of each side (depth of book).
+# Set book_event_mode to 'depth' to publish the changes of these N levels instead of the top of book events.
 # The constructor has two optional arguments, which are the two channels to receive orders and send book events.
 
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from TradingMessages import BookEvent
+
+
+# A PriceLevel gathers the orders resting at one price.
+# The orders are kept in a dictionary keyed by order ID: dictionaries keep the insertion order,
+# so iterating a level gives time priority, and removing an order from the middle of the queue is O(1).
+class PriceLevel:
+
+	def __init__(self,price):
+		self.price = price
+		self.orders = {}
+		self.quantity = 0
+
+	def first_order(self):
+		return next(iter(self.orders.values()))
+
+
 class OrderBook:
-  
-  def __init__(self,gt_2_ob = None,ob_to_ts = None):
-    self.list_asks = [] 
-    self.list_bids = [] 
-    self.gw_2_ob=gt_2_ob 
-    self.ob_to_ts = ob_to_ts 
-    self.current_bid = None 
-    self.current_ask = None
-    
-  # We will write a function, handle_order_from_gateway, which will receive the orders from the liquidity provider.
-	def handle_order_from_gateway(self,order = None): 
+
+	def __init__(self,gt_2_ob = None,ob_to_ts = None,depth = 5,book_event_mode = 'top'):
+		self.bid_orders = {}
+		self.ask_orders = {}
+		self.bid_levels = {}
+		self.ask_levels = {}
+		self.bid_prices = []
+		self.ask_prices = []
+		self.gw_2_ob=gt_2_ob
+		self.ob_to_ts = ob_to_ts
+		self.current_bid = None
+		self.current_ask = None
+		self.bid_touched = False
+		self.ask_touched = False
+		# The depth arrays are allocated once: one row per level, the columns are price, total quantity and order count.
+		self.depth = depth
+		self.book_event_mode = book_event_mode
+		self.bid_depth = np.full((depth, 3), -1.0)
+		self.ask_depth = np.full((depth, 3), -1.0)
+		self.published_bid_depth = np.full((depth, 3), -1.0)
+		self.published_ask_depth = np.full((depth, 3), -1.0)
+
+	# list_bids and list_asks give the sorted view of each side (best price first, then time priority).
+	# They are built on demand and are meant for inspection and tests, not for the order handling path.
+	@property
+	def list_bids(self):
+		return [order for price in self.bid_prices for order in self.bid_levels[-price].orders.values()]
+
+	@property
+	def list_asks(self):
+		return [order for price in self.ask_prices for order in self.ask_levels[price].orders.values()]
+
+	# We will write a function, handle_order_from_gateway, which will receive the orders from the liquidity provider.
+	def handle_order_from_gateway(self,order = None):
 		if self.gw_2_ob is None:
 			print('simulation mode')
-			self.handle_order(order) 
+			self.handle_order(order)
 		elif len(self.gw_2_ob)>0:
 			order_from_gw=self.gw_2_ob.popleft()
 			self.handle_order(order_from_gw)
-	
-	# Let's write a function to check whether the gw_2_ob channel has been defined. 
+
+	# The handle_orders function handles a list of orders in one call and returns the list of book events they generated.
+	# The book events are collected in a list standing for the ob_to_ts channel during the call.
+	def handle_orders(self,orders):
+		ob_to_ts = self.ob_to_ts
+		self.ob_to_ts = book_events = []
+		try:
+			for o in orders:
+				self.handle_order(o)
+		finally:
+			self.ob_to_ts = ob_to_ts
+		return book_events
+
+	# Let's write a function to check whether the gw_2_ob channel has been defined.
 	# If the channel has been instantiated, handle_order_from_gateway will pop the order
-	# from the top of deque gw_2_ob and will call the handle_order function to process the order for a given action: 
-	
+	# from the top of deque gw_2_ob and will call the handle_order function to process the order for a given action:
+
 	# In the code, handle_order calls either handle_modify, handle_delete, or handle_new.
-	def handle_order(self,o): 
-		if o['action']=='new': 
-			self.handle_new(o) # The handle_new function adds an order to the appropriate list,self.list_bidsandself.list_asks.
-		elif o['action']=='modify': 
+	def handle_order(self,o):
+		if o['action']=='new':
+			self.handle_new(o) # The handle_new function adds an order to the price level of its side.
+		elif o['action']=='modify':
 			self.handle_modify(o) # The handle_modify function modifies the order from the book by using the order given as an argument of this function.
-		elif o['action']=='delete': 
+		elif o['action']=='delete':
 			self.handle_delete(o) # The handle_delete function removes an order from the book by using the order given as an argument of this function.
 		else:
 			print('Error-Cannot handle this action')
-			
+
+		if self.book_event_mode == 'depth':
+			return self.check_generate_depth_event()
 		return self.check_generate_top_of_book_event()
-	
-	# We will now implement the handle_modify function to manage the amendment. 
-	# This function searches in the list of orders if the order exists. 
-	# If that's the case, we will modify the quantity by the new quantity. 
-	# This operation will be possible only if we reduce the quantity of the order:
-	def handle_modify(self,o): 
-		order=self.find_order_in_a_list(o) 
+
+	# The get_side function returns the structures (order index, price levels, sorted prices) of one side of the book.
+	# The bid prices are negated in the sorted list, this is why we also return the sign to apply to a price.
+	def get_side(self,side):
+		if side == 'bid':
+			return self.bid_orders, self.bid_levels, self.bid_prices, -1
+		elif side == 'ask':
+			return self.ask_orders, self.ask_levels, self.ask_prices, 1
+		print('incorrect side')
+		return None
+
+	# The handle_new function stores the order in the id index and appends it at the end of the queue of its price level.
+	# A price level which does not exist yet is created and its price inserted in the sorted list of prices.
+	def handle_new(self,o):
+		side = self.get_side(o['side'])
+		if side is None:
+			return None
+		orders, levels, prices, sign = side
+		if o['id'] in orders:
+			print('duplicate order id=%d' % (o['id']))
+			return None
+		level = levels.get(o['price'])
+		if level is None:
+			level = PriceLevel(o['price'])
+			levels[o['price']] = level
+			insort(prices, sign * o['price'])
+		level.orders[o['id']] = o
+		level.quantity += o['quantity']
+		orders[o['id']] = o
+		self.touch_if_best(o['side'], prices, sign * o['price'])
+		return None
+
+	# We will now implement the handle_modify function to manage the amendment.
+	# This function looks up the order by its ID.
+	# If the order exists, we will modify the quantity by the new quantity.
+	# This operation will be possible only if we reduce the quantity of the order, the order keeps its place in the queue:
+	def handle_modify(self,o):
+		order, side = self.find_order(o)
+		if order is None:
+			return None
 		if order['quantity'] > o['quantity']:
-			order['quantity'] = o['quantity'] 
+			_, levels, prices, sign = self.get_side(side)
+			levels[order['price']].quantity -= order['quantity'] - o['quantity']
+			order['quantity'] = o['quantity']
+			self.touch_if_best(side, prices, sign * order['price'])
 		else:
-			print('incorrect size') 
+			print('incorrect size')
 		return None
-	
-	# The handle_delete function will manage the order cancelation. 
-	# We will remove the orders from the list of orders by checking whether the order exists with the order ID:
+
+	# The handle_delete function will manage the order cancelation.
+	# We remove the order from the id index and from its price level.
+	# When the level becomes empty, its price is removed from the sorted list of prices:
 	def handle_delete(self,o):
-		lookup_list = self.get_list(o)
-		order = self.find_order_in_a_list(o,lookup_list) 
-		if order is not None:
-			lookup_list.remove(order)
+		order, side = self.find_order(o)
+		if order is None:
+			return None
+		orders, levels, prices, sign = self.get_side(side)
+		self.touch_if_best(side, prices, sign * order['price'])
+		del orders[order['id']]
+		level = levels[order['price']]
+		del level.orders[order['id']]
+		level.quantity -= order['quantity']
+		if not level.orders:
+			del levels[order['price']]
+			del prices[bisect_left(prices, sign * order['price'])]
 		return None
-	
-	# The get_list function in the code will help to find the side (which order book) contains the order:
-	def get_list(self,o): 
+
+	# The touch_if_best function flags a side of the book when an update hits its best level.
+	# Updates deeper in the book cannot change the top of the book and leave the flag untouched.
+	# In depth mode, the side is flagged when the update hits one of the first N levels.
+	def touch_if_best(self,side,prices,key):
+		if not prices:
+			return
+		if self.book_event_mode == 'depth':
+			touched = bisect_left(prices, key) < self.depth
+		else:
+			touched = prices[0] == key
+		if touched:
+			if side == 'bid':
+				self.bid_touched = True
+			else:
+				self.ask_touched = True
+
+	# The find_order function will return a reference to the order and the side of the book containing the order.
+	# When the message does not carry a side, we look up the two id indexes:
+	def find_order(self,o):
 		if 'side' in o:
-			if o['side']=='bid':
-				lookup_list = self.list_bids
-			elif o['side'] == 'ask': 
-				lookup_list = self.list_asks
+			side = o['side']
+			if side == 'bid':
+				order = self.bid_orders.get(o['id'])
+			elif side == 'ask':
+				order = self.ask_orders.get(o['id'])
 			else:
-				print('incorrect side') 
-				return None
-			return lookup_list
+				print('incorrect side')
+				return None, None
+		elif o['id'] in self.bid_orders:
+			side = 'bid'
+			order = self.bid_orders[o['id']]
 		else:
-			for order in self.list_bids: 
-				if order['id']==o['id']:
-					return self.list_bids 
-			for order in self.list_asks:
-				if order['id'] == o['id']: 
-					return self.list_asks
-			return None
-   
- 	# The find_order_in_a_list function will return a reference to the order if this order exists:
-	def find_order_in_a_list(self,o,lookup_list = None): 
-		if lookup_list is None:
-			lookup_list = self.get_list(o) 
-		if lookup_list is not None:
-			for order in lookup_list:
-				if order['id'] == o['id']:
-					return order
+			side = 'ask'
+			order = self.ask_orders.get(o['id'])
+		if order is None:
 			print('order not found id=%d' % (o['id']))
-		return None
-	
-	# The following two functions will help with creating the book events. 
+			return None, None
+		return order, side
+
+	# The get_best_bid and get_best_ask functions return the first order of the best price level, or None when the side is empty.
+	def get_best_bid(self):
+		if not self.bid_prices:
+			return None
+		return self.bid_levels[-self.bid_prices[0]].first_order()
+
+	def get_best_ask(self):
+		if not self.ask_prices:
+			return None
+		return self.ask_levels[self.ask_prices[0]].first_order()
+
+	# The following two functions will help with creating the book events.
 	# The book events as defined in the check_generate_top_of_book_event function
 	# will be created by having the top of the book changed.
-	
-	# The create_book_event function creates a dictionary representing a book event.
+
+	# The create_book_event function creates a BookEvent representing a book event.
 	# A book event will be given to the trading strategy to indicate what change was made at the top of the book level:
-	def create_book_event(self,bid,offer): 
-		book_event = {"bid_price": bid['price'] if bid else -1, 
-									"bid_quantity": bid['quantity'] if bid else -1, 
-									"offer_price": offer['price'] if offer else -1, 
-									"offer_quantity": offer['quantity'] if offer else -1
-								 }
-		return book_event
-	
-	# The check_generate_top_of_book_event function will create a book event when the top of the book has changed. 
-	# When the price or the quantity for the best bid or offer has changed, 
+	def create_book_event(self,bid,offer):
+		return BookEvent(bid['price'] if bid else -1,
+										 bid['quantity'] if bid else -1,
+										 offer['price'] if offer else -1,
+										 offer['quantity'] if offer else -1
+										)
+
+	# The check_generate_top_of_book_event function will create a book event when the top of the book has changed.
+	# Only the sides flagged by the last update are looked at. current_bid and current_ask keep the price and the quantity
+	# which were last published, and when the price or the quantity for the best bid or offer has really changed,
 	# we will inform the trading strategies that there is a change at the top of the book:
-	def check_generate_top_of_book_event(self): 
+	def check_generate_top_of_book_event(self):
+		if not self.bid_touched and not self.ask_touched:
+			return None
 		tob_changed = False
-		if not self.list_bids:
-			if self.current_bid is not None: 
+		if self.bid_touched:
+			self.bid_touched = False
+			best_bid = self.get_best_bid()
+			if self.top_of_book_changed(best_bid, self.current_bid):
 				tob_changed = True
-			# if top of book change generate an event if not self.current_bid:
-			if self.current_bid != self.list_bids[0]: 
-				tob_changed=True 
-				self.current_bid=self.list_bids[0] if self.list_bids else None
-			if not self.current_ask: 
-				if not self.list_asks:
-					if self.current_ask is not None: 
-						tob_changed = True
-					elif self.current_ask != self.list_asks[0]: 
-						tob_changed = True
-						self.current_ask = self.list_asks[0] if self.list_asks else None
-				
-			if tob_changed: 
-				be=self.create_book_event(self.current_bid,self.current_ask)
-			if self.ob_to_ts is not None: 
+				self.current_bid = {'price': best_bid['price'], 'quantity': best_bid['quantity']} if best_bid else None
+		if self.ask_touched:
+			self.ask_touched = False
+			best_ask = self.get_best_ask()
+			if self.top_of_book_changed(best_ask, self.current_ask):
+				tob_changed = True
+				self.current_ask = {'price': best_ask['price'], 'quantity': best_ask['quantity']} if best_ask else None
+
+		if tob_changed:
+			be=self.create_book_event(self.current_bid,self.current_ask)
+			if self.ob_to_ts is not None:
+				self.ob_to_ts.append(be)
+			else:
+				return be
+		return None
+
+	def top_of_book_changed(self,best,current):
+		if best is None or current is None:
+			return best is not current
+		return best['price'] != current['price'] or best['quantity'] != current['quantity']
+
+	# The fill_depth function writes the first n levels of one side into a preallocated array.
+	# Only the first n entries of the sorted prices are visited, the rest of the book is never copied.
+	# The rows past the last level of the book are set to -1.
+	def fill_depth(self,prices,levels,sign,out,n):
+		count = min(n, len(prices))
+		for i in range(count):
+			level = levels[sign * prices[i]]
+			out[i, 0] = level.price
+			out[i, 1] = level.quantity
+			out[i, 2] = len(level.orders)
+		out[count:n] = -1
+		return out[:n]
+
+	# The get_depth function returns the first n aggregated levels of the bid and of the ask sides (n is at most depth).
+	# The arrays returned are views on the arrays of the book: they are overwritten by the next call.
+	def get_depth(self,n = None):
+		n = self.depth if n is None else min(n, self.depth)
+		bids = self.fill_depth(self.bid_prices, self.bid_levels, -1, self.bid_depth, n)
+		asks = self.fill_depth(self.ask_prices, self.ask_levels, 1, self.ask_depth, n)
+		return bids, asks
+
+	# The depth_changes function compares the current first N levels of a side with the last published ones
+	# and returns the rows which changed as (level, price, quantity, order count).
+	def depth_changes(self,prices,levels,sign,current,published):
+		self.fill_depth(prices, levels, sign, current, self.depth)
+		changed = np.flatnonzero((current != published).any(axis=1))
+		if len(changed) == 0:
+			return []
+		published[changed] = current[changed]
+		return [(int(i), current[i, 0], current[i, 1], int(current[i, 2])) for i in changed]
+
+	# The check_generate_depth_event function is used in depth mode: when one of the first N levels has changed,
+	# the book event carries only the levels which changed on each side (L2 delta).
+	def check_generate_depth_event(self):
+		if not self.bid_touched and not self.ask_touched:
+			return None
+		bid_changes = []
+		ask_changes = []
+		if self.bid_touched:
+			self.bid_touched = False
+			bid_changes = self.depth_changes(self.bid_prices, self.bid_levels, -1, self.bid_depth, self.published_bid_depth)
+		if self.ask_touched:
+			self.ask_touched = False
+			ask_changes = self.depth_changes(self.ask_prices, self.ask_levels, 1, self.ask_depth, self.published_ask_depth)
+
+		if bid_changes or ask_changes:
+			be = {"bid_levels": bid_changes,
+						"offer_levels": ask_changes
+					 }
+			if self.ob_to_ts is not None:
 				self.ob_to_ts.append(be)
 			else:
 				return be
-	
-	# When we test the order book, we need to test the following functionalities:
-	# Adding a new order 
-	# Modifying a new order 
-	# Deleting an order 
-	# Creating a book event
-	
-	# Unit test for the Order Book
-	import unittest
-	import OrderBook
-	
-	class TestOrderBook(unittest.TestCase): 
-		
-		def setUp(self):
-			self.reforderbook = OrderBook()
-		
-		# Let's create a function to verify if the order insertion works. 
-		# The book must have the list of asks and the list of bids sorted:
-		def test_handlenew(self): 
-			order1 = {'id': 1, 
-								'price': 219, 
-								'quantity': 10, 
-								'side': 'bid', 
-								'action': 'new'
-							 }
-			ob_for_aapl = self.reforderbook
-			ob_for_aapl.handle_order(order1)
-			order2 = order1.copy()
-			order2['id'] = 2
-			order2['price'] = 220 
-			ob_for_aapl.handle_order(order2) 
-			order3 = order1.copy() 
-			order3['price'] = 223 
-			order3['id'] = 3 
-			ob_for_aapl.handle_order(order3) 
-			order4 = order1.copy() 
-			order4['side'] = 'ask' 
-			order4['price'] = 220 
-			order4['id'] = 4 
-			ob_for_aapl.handle_order(order4) 
-			order5 = order4.copy() 
-			order5['price'] = 223 
-			order5['id'] = 5 
-			ob_for_aapl.handle_order(order5) 
-			order6 = order4.copy() 
-			order6['price'] = 221 
-			order6['id'] = 6 
-			ob_for_aapl.handle_order(order6)
-			
-			self.assertEqual(ob_for_aapl.list_bids[0]['id'],3) 
-			self.assertEqual(ob_for_aapl.list_bids[1]['id'], 2) 
-			self.assertEqual(ob_for_aapl.list_bids[2]['id'], 1) 
-			self.assertEqual(ob_for_aapl.list_asks[0]['id'],4) 
-			self.assertEqual(ob_for_aapl.list_asks[1]['id'], 6) 
-			self.assertEqual(ob_for_aapl.list_asks[2]['id'], 5)
-			
-		# Let's now write the following function to test whether the amendment works. 
-		# We fill the book by using the prior function, then we amend the order by changing the quantity:
-		def test_handleamend(self): 
-			self.test_handlenew() 
-			order1 = {'id': 1, 
-								'quantity': 5, 
-								'action': 
-								'modify'
-							 }
-			self.reforderbook.handle_order(order1)
-			self.assertEqual(self.reforderbook.list_bids[2]['id'], 1) 
-			self.assertEqual(self.reforderbook.list_bids[2]['quantity'], 5)
-		
-		# Book management function that removes order from the book by the order ID. 
-		# In this test case, we fill the book with the prior function and we remove the order:
-		def test_handledelete(self): 
-			self.test_handlenew() 
-			order1 = {'id': 1,
-								'action': 
-								'delete'
-							 }
-			self.assertEqual(len(self.reforderbook.list_bids), 3)
-			self.reforderbook.handle_order(order1)
-			self.assertEqual(len(self.reforderbook.list_bids), 2)
-			
-		def test_generate_book_event(self): 
-			order1 = {'id': 1, 
-								'price': 219, 
-								'quantity': 10, 
-								'side': 'bid', 
-								'action': 'new'
-							 }
-			ob_for_aapl = self.reforderbook
-			self.assertEqual(ob_for_aapl.handle_order(order1),
-											 {'bid_price': 219, 'bid_quantity': 10, 
-												'offer_price': -1, 'offer_quantity': -1
-											 }
-											)
-			order2 = order1.copy()
-			order2['id'] = 2
-			order2['price'] = 220
-			order2['side'] = 'ask' 
-			self.assertEqual(ob_for_aapl.handle_order(order2), 
-											 {'bid_price': 219, 'bid_quantity': 10,
-												'offer_price': 220, 'offer_quantity': 10
-											 }
-											) 
-			
-	if __name__ == '__main__':
-		unittest.main()
-  
-
-
-	
-
-
-
-
-
-	
-	
-	
-	
-	
-    
+		return None
+
+# When we test the order book, we need to test the following functionalities:
+# Adding a new order
+# Modifying a new order
+# Deleting an order
+# Creating a book event
+
+# Unit test for the Order Book
+import unittest
+
+class TestOrderBook(unittest.TestCase):
+
+	def setUp(self):
+		self.reforderbook = OrderBook()
+
+	# Let's create a function to verify if the order insertion works.
+	# The book must have the list of asks and the list of bids sorted:
+	def test_handlenew(self):
+		order1 = {'id': 1,
+							'price': 219,
+							'quantity': 10,
+							'side': 'bid',
+							'action': 'new'
+						 }
+		ob_for_aapl = self.reforderbook
+		ob_for_aapl.handle_order(order1)
+		order2 = order1.copy()
+		order2['id'] = 2
+		order2['price'] = 220
+		ob_for_aapl.handle_order(order2)
+		order3 = order1.copy()
+		order3['price'] = 223
+		order3['id'] = 3
+		ob_for_aapl.handle_order(order3)
+		order4 = order1.copy()
+		order4['side'] = 'ask'
+		order4['price'] = 220
+		order4['id'] = 4
+		ob_for_aapl.handle_order(order4)
+		order5 = order4.copy()
+		order5['price'] = 223
+		order5['id'] = 5
+		ob_for_aapl.handle_order(order5)
+		order6 = order4.copy()
+		order6['price'] = 221
+		order6['id'] = 6
+		ob_for_aapl.handle_order(order6)
+
+		self.assertEqual(ob_for_aapl.list_bids[0]['id'],3)
+		self.assertEqual(ob_for_aapl.list_bids[1]['id'], 2)
+		self.assertEqual(ob_for_aapl.list_bids[2]['id'], 1)
+		self.assertEqual(ob_for_aapl.list_asks[0]['id'],4)
+		self.assertEqual(ob_for_aapl.list_asks[1]['id'], 6)
+		self.assertEqual(ob_for_aapl.list_asks[2]['id'], 5)
+
+	# Let's now write the following function to test whether the amendment works.
+	# We fill the book by using the prior function, then we amend the order by changing the quantity:
+	def test_handleamend(self):
+		self.test_handlenew()
+		order1 = {'id': 1,
+							'quantity': 5,
+							'action':
+							'modify'
+						 }
+		self.reforderbook.handle_order(order1)
+		self.assertEqual(self.reforderbook.list_bids[2]['id'], 1)
+		self.assertEqual(self.reforderbook.list_bids[2]['quantity'], 5)
+
+	# Book management function that removes order from the book by the order ID.
+	# In this test case, we fill the book with the prior function and we remove the order:
+	def test_handledelete(self):
+		self.test_handlenew()
+		order1 = {'id': 1,
+							'action':
+							'delete'
+						 }
+		self.assertEqual(len(self.reforderbook.list_bids), 3)
+		self.reforderbook.handle_order(order1)
+		self.assertEqual(len(self.reforderbook.list_bids), 2)
+
+	def test_generate_book_event(self):
+		order1 = {'id': 1,
+							'price': 219,
+							'quantity': 10,
+							'side': 'bid',
+							'action': 'new'
+						 }
+		ob_for_aapl = self.reforderbook
+		self.assertEqual(ob_for_aapl.handle_order(order1),
+										 {'bid_price': 219, 'bid_quantity': 10,
+											'offer_price': -1, 'offer_quantity': -1
+										 }
+										)
+		order2 = order1.copy()
+		order2['id'] = 2
+		order2['price'] = 220
+		order2['side'] = 'ask'
+		self.assertEqual(ob_for_aapl.handle_order(order2),
+										 {'bid_price': 219, 'bid_quantity': 10,
+											'offer_price': 220, 'offer_quantity': 10
+										 }
+										)
+
+	# Orders at the same price are queued by arrival time, and removing an order inside a level keeps the others in place.
+	# An emptied level must disappear from the sorted prices:
+	def test_price_level_queue(self):
+		ob_for_aapl = self.reforderbook
+		for id, price in [(1, 219), (2, 219), (3, 219), (4, 218)]:
+			ob_for_aapl.handle_order({'id': id, 'price': price, 'quantity': 10, 'side': 'bid', 'action': 'new'})
+		self.assertEqual([o['id'] for o in ob_for_aapl.list_bids], [1, 2, 3, 4])
+		self.assertEqual(ob_for_aapl.bid_levels[219].quantity, 30)
+		ob_for_aapl.handle_order({'id': 2, 'side': 'bid', 'action': 'delete'})
+		self.assertEqual([o['id'] for o in ob_for_aapl.list_bids], [1, 3, 4])
+		self.assertEqual(ob_for_aapl.bid_levels[219].quantity, 20)
+		ob_for_aapl.handle_order({'id': 4, 'action': 'delete'})
+		self.assertEqual(ob_for_aapl.bid_prices, [-219])
+		self.assertNotIn(218, ob_for_aapl.bid_levels)
+
+	# The bid and ask sides have their own ID space, the same ID can rest on both sides:
+	def test_same_id_on_both_sides(self):
+		ob_for_aapl = self.reforderbook
+		ob_for_aapl.handle_order({'id': 1, 'price': 100, 'quantity': 1000, 'side': 'ask', 'action': 'new'})
+		be = ob_for_aapl.handle_order({'id': 1, 'price': 100, 'quantity': 1000, 'side': 'bid', 'action': 'new'})
+		self.assertEqual(be, {'bid_price': 100, 'bid_quantity': 1000, 'offer_price': 100, 'offer_quantity': 1000})
+		ob_for_aapl.handle_order({'id': 1, 'side': 'ask', 'action': 'delete'})
+		self.assertEqual(len(ob_for_aapl.list_asks), 0)
+		self.assertEqual(len(ob_for_aapl.list_bids), 1)
+
+	# A book event is generated only when the first level really changes.
+	# Orders added behind the best order or deeper in the book, and deletions deeper in the book, are silent:
+	def test_book_event_only_on_top_of_book_change(self):
+		ob_for_aapl = self.reforderbook
+		self.assertIsNotNone(ob_for_aapl.handle_order({'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'}))
+		self.assertIsNone(ob_for_aapl.handle_order({'id': 2, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'}))
+		self.assertIsNone(ob_for_aapl.handle_order({'id': 3, 'price': 218, 'quantity': 10, 'side': 'bid', 'action': 'new'}))
+		self.assertIsNone(ob_for_aapl.handle_order({'id': 3, 'action': 'delete'}))
+		self.assertEqual(ob_for_aapl.handle_order({'id': 1, 'quantity': 5, 'action': 'modify'}),
+										 {'bid_price': 219, 'bid_quantity': 5, 'offer_price': -1, 'offer_quantity': -1})
+		# The next order in the queue has a different quantity, the deletion of the best order is published
+		self.assertEqual(ob_for_aapl.handle_order({'id': 1, 'action': 'delete'}),
+										 {'bid_price': 219, 'bid_quantity': 10, 'offer_price': -1, 'offer_quantity': -1})
+		self.assertEqual(ob_for_aapl.handle_order({'id': 2, 'action': 'delete'}),
+										 {'bid_price': -1, 'bid_quantity': -1, 'offer_price': -1, 'offer_quantity': -1})
+
+	# Replacing the best order by another one with the same price and quantity is not a change of the top of the book:
+	def test_no_book_event_for_same_price_and_quantity(self):
+		ob_for_aapl = self.reforderbook
+		ob_for_aapl.handle_order({'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'})
+		ob_for_aapl.handle_order({'id': 2, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'})
+		self.assertIsNone(ob_for_aapl.handle_order({'id': 1, 'action': 'delete'}))
+
+	# The depth of book aggregates the quantity and counts the orders of each level, best level first:
+	def test_get_depth(self):
+		self.test_handlenew()
+		ob_for_aapl = self.reforderbook
+		ob_for_aapl.handle_order({'id': 7, 'price': 223, 'quantity': 5, 'side': 'bid', 'action': 'new'})
+		bids, asks = ob_for_aapl.get_depth(4)
+		self.assertEqual(bids.tolist(), [[223, 15, 2], [220, 10, 1], [219, 10, 1], [-1, -1, -1]])
+		self.assertEqual(asks[:3, 0].tolist(), [220, 221, 223])
+		self.assertEqual(ob_for_aapl.get_depth(2)[0].shape, (2, 3))
+
+	# In depth mode, the book event only carries the levels which changed in the first N levels:
+	def test_generate_depth_event(self):
+		ob_for_aapl = OrderBook(depth = 2, book_event_mode = 'depth')
+		be = ob_for_aapl.handle_order({'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'})
+		self.assertEqual(be, {'bid_levels': [(0, 219, 10, 1)], 'offer_levels': []})
+		be = ob_for_aapl.handle_order({'id': 2, 'price': 220, 'quantity': 20, 'side': 'bid', 'action': 'new'})
+		self.assertEqual(be, {'bid_levels': [(0, 220, 20, 1), (1, 219, 10, 1)], 'offer_levels': []})
+		be = ob_for_aapl.handle_order({'id': 3, 'price': 219, 'quantity': 5, 'side': 'bid', 'action': 'new'})
+		self.assertEqual(be, {'bid_levels': [(1, 219, 15, 2)], 'offer_levels': []})
+		# A level below the first N levels does not generate an event
+		self.assertIsNone(ob_for_aapl.handle_order({'id': 4, 'price': 218, 'quantity': 5, 'side': 'bid', 'action': 'new'}))
+		be = ob_for_aapl.handle_order({'id': 2, 'action': 'delete'})
+		self.assertEqual(be, {'bid_levels': [(0, 219, 15, 2), (1, 218, 5, 1)], 'offer_levels': []})
+
+if __name__ == '__main__':
+	unittest.main()
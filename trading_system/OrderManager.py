@@ -1,182 +1,345 @@
 # The purpose of the order manager is to gather the orders from all the trading strategies
-# and to communicate this order with the market. 
-# It will check the validity of the orders and can also keep track of the overall positions and PnL. 
-# It can be a safeguard against mistakes introduced in trading strategies. 
+# and to communicate this order with the market.
+# It will check the validity of the orders and can also keep track of the overall positions and PnL.
+# It can be a safeguard against mistakes introduced in trading strategies.
+
+# This component is the interface between the trading strategies and the market.
+
+# The outstanding orders are kept in a dictionary keyed by order ID, and in one dictionary per status
+# (new, acked, ...) so the orders in a given status are found without scanning all the orders.
+# When an order reaches a terminal status (filled, cancelled or rejected), it is removed from these dictionaries in O(1)
+# and appended to terminal_orders, the history of the last history_size terminal orders kept for audit.
+
+# The order manager gives its own ids to the orders it sends to the market. client_ids maps each of these ids to the id
+# the trading strategy gave to the order, and every report sent back to the strategy carries the strategy's id.
+
+# The pre-trade risk checks are delegated to an optional RiskEngine. The order manager gives it the book events
+# (for the price bands), the quantity of every fill, partial or not (for the positions), and the quantity still open
+# when an order is filled, cancelled or rejected (for the open quantities).
+
+from collections import deque
+
+from TradingMessages import Order, ExecutionReport
+
+
+TERMINAL_STATUSES = ('filled', 'cancelled', 'rejected')
 
-# This component is the interface between the trading strategies and the market. 
 
 class OrderManager:
-	
-	def __init__(self,ts_2_om = None, om_2_ts = None,om_2_gw=None,gw_2_om=None): 
-		self.orders=[]
+
+	def __init__(self,ts_2_om = None, om_2_ts = None,om_2_gw=None,gw_2_om=None,history_size=10000,risk_engine=None):
+		self.orders={}
+		self.orders_by_status={}
+		self.terminal_orders=deque(maxlen=history_size)
 		self.order_id=0
+		self.client_ids={}
+		self.filled_quantities={}
 		self.ts_2_om = ts_2_om
 		self.om_2_gw = om_2_gw
 		self.gw_2_om = gw_2_om
 		self.om_2_ts = om_2_ts
-		
-	# To get new orders into the OrderManager system, we check whether the size of the ts_2_om channel is higher than 0. 
-	# If there is an order in the channel, we remove this order and we call the handle_order_from_tradinig_strategy function. 	
-	
-	def handle_input_from_ts(self): 
+		self.risk_engine = risk_engine
+
+	# To get new orders into the OrderManager system, we check whether the size of the ts_2_om channel is higher than 0.
+	# If there is an order in the channel, we remove this order and we call the handle_order_from_tradinig_strategy function.
+
+	def handle_input_from_ts(self):
 		if self.ts_2_om is not None:
-			if len(self.ts_2_om)>0: 
+			if len(self.ts_2_om)>0:
 				self.handle_order_from_trading_strategy(self.ts_2_om.popleft())
 			else:
 				print('simulation mode')
-				
-	# The handle_order_from_trading_strategy function handles the new order coming from the trading strategies. 
-	# For now, the OrderManager class will just get a copy of the order and store this order into a list of orders.
-	
-	def handle_order_from_trading_strategy(self,order): 
+
+	# The handle_order_from_trading_strategy function handles the new order coming from the trading strategies.
+	# For now, the OrderManager class will just get a copy of the order and store this order into the outstanding orders.
+	# create_new_order already builds a new order, the copy sent to the market keeps the market from changing our own order.
+	# An order failing the checks is sent back to the trading strategy with the status rejected.
+
+	def handle_order_from_trading_strategy(self,order):
 		if self.check_order_valid(order):
-			order=self.create_new_order(order).copy() 
-			self.orders.append(order)
+			client_id = order.get('id')
+			order=self.create_new_order(order)
+			self.add_order(order)
+			if client_id is not None:
+				self.client_ids[order['id']] = client_id
 			if self.om_2_gw is None:
-				print('simulation mode') 
+				print('simulation mode')
 			else:
 				self.om_2_gw.append(order.copy())
-				
-				
-	# Once we take care of the order side, we are going to take care of the market response. 
-	# For this, we will use the same method we used for the two prior functions. 
-	# The handle_input_from_market function checks whether the gw_2_om channel exists. 
+		else:
+			rejection = order.copy()
+			rejection['status'] = 'rejected'
+			if self.om_2_ts is None:
+				print('simulation mode')
+			else:
+				self.om_2_ts.append(rejection)
+
+
+	# Once we take care of the order side, we are going to take care of the market response.
+	# For this, we will use the same method we used for the two prior functions.
+	# The handle_input_from_market function checks whether the gw_2_om channel exists.
 	# If that's the case, the function reads the market response object coming from the market
-	# and calls the handle_order_from_gateway function. 
-	
-	def handle_input_from_market(self): 
+	# and calls the handle_order_from_gateway function.
+
+	def handle_input_from_market(self):
 		if self.gw_2_om is not None:
-			if len(self.gw_2_om)>0: 
+			if len(self.gw_2_om)>0:
 				self.handle_order_from_gateway(self.gw_2_om.popleft())
 		else:
 			print('simulation mode')
-			
-  # The handle_order_from_gateway function will look up in the list of orders created 
+
+	# The handle_order_from_gateway function will look up in the orders created
 	# by the handle_order_from_trading_strategy function. If the market response corresponds
-	# to an order in the list, it means that this market response is valid. 
-	# We will be able to change the state of this order. 
-	# If the market response doesn't find a specific order, 
-	# it means that there is a problem in the exchange between the trading system and the market. 
-	# We will need to raise an error. 
-	
-	def handle_order_from_gateway(self,order_update): 
-		order=self.lookup_order_by_id(order_update['id']) 
+	# to an order we know, it means that this market response is valid.
+	# We will be able to change the state of this order.
+	# If the market response doesn't find a specific order,
+	# it means that there is a problem in the exchange between the trading system and the market.
+	# We will need to raise an error.
+	# The trading strategy receives an execution report of its order, with the price and the quantity of the fill if any.
+
+	def handle_order_from_gateway(self,order_update):
+		order=self.lookup_order_by_id(order_update['id'])
 		if order is not None:
-			order['status']=order_update['status'] 
+			client_id = self.client_ids.get(order['id'], order['id'])
+			if order_update['status'] == 'filled' or order_update['status'] == 'partially_filled':
+				self.fill(order, order_update)
+			self.update_status(order, order_update['status'])
 			if self.om_2_ts is not None:
-				self.om_2_ts.append(order.copy()) 
+				report = ExecutionReport.from_order(order)
+				report.id = client_id
+				report.fill_price = order_update.get('fill_price')
+				report.fill_quantity = order_update.get('fill_quantity')
+				report.leaves_quantity = order_update.get('leaves_quantity')
+				self.om_2_ts.append(report)
 			else:
-				print('simulation mode') self.clean_traded_orders()
+				print('simulation mode')
 		else:
 			print('order not found')
-			
- 	# The check_order_valid function will perform regular checks on an order. 
-	def check_order_valid(self,order): 
+
+	# The handle_orders_from_trading_strategy and handle_orders_from_gateway functions handle a list of messages in one call.
+	# They return the list of messages for the market (om_2_gw) and for the trading strategies (om_2_ts) respectively,
+	# collected in a list standing for the channel during the call.
+	def handle_orders_from_trading_strategy(self,orders):
+		om_2_gw = self.om_2_gw
+		self.om_2_gw = orders_to_market = []
+		try:
+			for order in orders:
+				self.handle_order_from_trading_strategy(order)
+		finally:
+			self.om_2_gw = om_2_gw
+		return orders_to_market
+
+	def handle_orders_from_gateway(self,order_updates):
+		om_2_ts = self.om_2_ts
+		self.om_2_ts = orders_to_strategy = []
+		try:
+			for order_update in order_updates:
+				self.handle_order_from_gateway(order_update)
+		finally:
+			self.om_2_ts = om_2_ts
+		return orders_to_strategy
+
+	# The handle_book_event function gives the book events to the risk engine, which uses them as reference prices.
+	def handle_book_event(self,book_event):
+		if self.risk_engine is not None:
+			self.risk_engine.update_reference_price(book_event)
+
+	# The check_order_valid function will perform regular checks on an order, then the checks of the risk engine.
+	def check_order_valid(self,order):
 		if order['quantity'] < 0:
 			return False
 		if order['price'] < 0:
 			return False
-    return True
+		if self.risk_engine is not None:
+			reason = self.risk_engine.check_order(order)
+			if reason is not None:
+				print('order rejected: %s' % (reason))
+				return False
+		return True
 
-	# The create_new_order, lookup_order_by_id, and clean_traded_orders functions will create an order 
+	# The create_new_order, lookup_order_by_id, and update_status functions will create an order
 	# based on the order sent by the trading strategy, which has a unique order ID.
-	# The second function will help with looking up the order from the list of outstanding orders. 
-	# The last function will clean the orders that have been rejected, filled, or canceled. 
-	
-	# The create_new_order function will create a dictionary to store the order characteristics:
-	def create_new_order(self,order): 
+	# The second function will help with looking up the order from the outstanding orders.
+	# The last function will change the status of an order and clean the orders that have been rejected, filled, or canceled.
+
+	# The create_new_order function will create an Order to store the order characteristics:
+	def create_new_order(self,order):
 		self.order_id += 1
-		neworder = {'id': self.order_id,
-								'price': order['price'], 
-								'quantity': order['quantity'], 
-								'side': order['side'], 
-								'status': 'new',
-								'action': 'New'
-							 }
+		neworder = Order(self.order_id,
+										 order['price'],
+										 order['quantity'],
+										 order['side'],
+										 'New',
+										 'new',
+										 order.get('symbol'),
+										 strategy = order.get('strategy')
+										)
 		return neworder
 
 	# The lookup_order_by_id function will return a reference to the order by looking up by order ID:
 	def lookup_order_by_id(self,id):
-		for i in range(len(self.orders)):
-			if self.orders[i]['id'] == id:
-				return self.orders[i] 
-		return None
-	
-	# The clean_traded_orders function will remove from the list of orders all the orders that have been filled:
-	def clean_traded_orders(self): 
-		order_offsets = []
-		for k in range(len(self.orders)):
-			if self.orders[k]['status'] == 'filled':
-				order_offsets.append(k) 
-			if len(order_offsets):
-				for k in sorted(order_offsets,reverse = True): 
-					del (self.orders[k])
-					
-	# Since the OrderManager component is critical for the safety of trading, 
-	# we need to have exhaustive unit testing to ensure that no strategy will damage your gain, and prevent us from incurring losses:
-	import unittest
-	import OrderManager
-	
-	class TestOrderBook(unittest.TestCase):
-		
-		def setUp(self):
-			self.order_manager = OrderManager()
-
-		# The test_receive_order_from_trading_strategy test verifies whether an order is correctly received by the order manager. 
-		# First, we create an order, order1, and we call the handle_order_from_trading_strategy function. 
-		# Since the trading strategy creates two orders (stored in the channel ts_2_om), 
-		# we call the test_receive_order_from_trading_strategy function twice. 
-		# The order manager will then generate two orders.
-		
-		def test_receive_order_from_trading_strategy(self): 
-			order1 = {'id': 10, 
-								'price': 219, 
-								'quantity': 10, 
-								'side': 'bid',
-							 } 
-			self.order_manager.handle_order_from_trading_strategy(order1) 
-			self.assertEqual(len(self.order_manager.orders),1) 
-			self.order_manager.handle_order_from_trading_strategy(order1) 
-			self.assertEqual(len(self.order_manager.orders),2) 
-			self.assertEqual(self.order_manager.orders[0]['id'],1) 
-			self.assertEqual(self.order_manager.orders[1]['id'],2)
-		
-		# To prevent a malformed order from being sent to the market, 
-		# the test_receive_order_from_trading_strategy_error test checks
-		# whether an order created with a negative price is rejected:
-		
-		def test_receive_order_from_trading_strategy_error(self): 
-			order1 = {'id': 10, 
-								'price': -219, 
-								'quantity': 10, 
-								'side': 'bid',
-							 }
-			self.order_manager.handle_order_from_trading_strategy(order1)
-			self.assertEqual(len(self.order_manager.orders),0)
-			
-		
-		#The following test, test_receive_from_gateway_filled, confirms a market response has been propagated by the order manager:
-		def test_receive_from_gateway_filled(self): 
-			self.test_receive_order_from_trading_strategy() 
-			orderexecution1 = {'id': 2,
-												 'price': 13, 
-												 'quantity': 10, 
-												 'side': 'bid', 
-												 'status' : 'filled'
-												}
-			self.order_manager.handle_order_from_gateway(orderexecution1)
-			self.assertEqual(len(self.order_manager.orders), 1)
-			
-		def test_receive_from_gateway_acked(self): 
-			self.test_receive_order_from_trading_strategy() 
-			orderexecution1 = {'id': 2,
-												 'price': 13, 
-												 'quantity': 10, 
-												 'side': 'bid', 
-												 'status' : 'acked'
-												}
-			self.order_manager.handle_order_from_gateway(orderexecution1) 
-			self.assertEqual(len(self.order_manager.orders), 2) 
-			self.assertEqual(self.order_manager.orders[1]['status'], 'acked')
- 
-		
+		return self.orders.get(id)
+
+	def add_order(self,order):
+		self.orders[order['id']] = order
+		self.orders_by_status.setdefault(order['status'], {})[order['id']] = order
+
+	# The update_status function moves the order from the index of its old status to the index of its new status.
+	# An order reaching a terminal status leaves the outstanding orders and goes to the history:
+	def update_status(self,order,status):
+		self.orders_by_status[order['status']].pop(order['id'], None)
+		order['status'] = status
+		if status in TERMINAL_STATUSES:
+			del self.orders[order['id']]
+			self.client_ids.pop(order['id'], None)
+			self.terminal_orders.append(order)
+			filled_quantity = self.filled_quantities.pop(order['id'], 0)
+			if self.risk_engine is not None:
+				self.risk_engine.on_order_closed(order, order['quantity'] - filled_quantity)
+		else:
+			self.orders_by_status.setdefault(status, {})[order['id']] = order
+
+	# The fill function counts the quantity of a fill, partial or not, and gives it to the risk engine.
+	# A filled update without fill_quantity fills what is left of the order.
+	def fill(self,order,order_update):
+		filled_quantity = self.filled_quantities.get(order['id'], 0)
+		quantity = order_update.get('fill_quantity')
+		if quantity is None:
+			quantity = order['quantity'] - filled_quantity if order_update['status'] == 'filled' else 0
+		self.filled_quantities[order['id']] = filled_quantity + quantity
+		if self.risk_engine is not None:
+			self.risk_engine.on_fill(order, quantity)
+
+	# The get_orders_by_status function returns the outstanding orders having a given status.
+	def get_orders_by_status(self,status):
+		return list(self.orders_by_status.get(status, {}).values())
+
+# Since the OrderManager component is critical for the safety of trading,
+# we need to have exhaustive unit testing to ensure that no strategy will damage your gain, and prevent us from incurring losses:
+import unittest
+from RiskEngine import RiskEngine
+
+class TestOrderBook(unittest.TestCase):
+
+	def setUp(self):
+		self.order_manager = OrderManager()
+
+	# The test_receive_order_from_trading_strategy test verifies whether an order is correctly received by the order manager.
+	# First, we create an order, order1, and we call the handle_order_from_trading_strategy function.
+	# Since the trading strategy creates two orders (stored in the channel ts_2_om),
+	# we call the test_receive_order_from_trading_strategy function twice.
+	# The order manager will then generate two orders.
+
+	def test_receive_order_from_trading_strategy(self):
+		order1 = {'id': 10,
+							'price': 219,
+							'quantity': 10,
+							'side': 'bid',
+						 }
+		self.order_manager.handle_order_from_trading_strategy(order1)
+		self.assertEqual(len(self.order_manager.orders),1)
+		self.order_manager.handle_order_from_trading_strategy(order1)
+		self.assertEqual(len(self.order_manager.orders),2)
+		self.assertEqual(self.order_manager.orders[1]['id'],1)
+		self.assertEqual(self.order_manager.orders[2]['id'],2)
+
+	# To prevent a malformed order from being sent to the market,
+	# the test_receive_order_from_trading_strategy_error test checks
+	# whether an order created with a negative price is rejected:
+
+	def test_receive_order_from_trading_strategy_error(self):
+		order1 = {'id': 10,
+							'price': -219,
+							'quantity': 10,
+							'side': 'bid',
+						 }
+		self.order_manager.handle_order_from_trading_strategy(order1)
+		self.assertEqual(len(self.order_manager.orders),0)
+
+
+	#The following test, test_receive_from_gateway_filled, confirms a market response has been propagated by the order manager:
+	def test_receive_from_gateway_filled(self):
+		self.test_receive_order_from_trading_strategy()
+		orderexecution1 = {'id': 2,
+											 'price': 13,
+											 'quantity': 10,
+											 'side': 'bid',
+											 'status' : 'filled'
+											}
+		self.order_manager.handle_order_from_gateway(orderexecution1)
+		self.assertEqual(len(self.order_manager.orders), 1)
+		self.assertEqual(self.order_manager.terminal_orders[-1]['id'], 2)
+
+	def test_receive_from_gateway_acked(self):
+		self.test_receive_order_from_trading_strategy()
+		orderexecution1 = {'id': 2,
+											 'price': 13,
+											 'quantity': 10,
+											 'side': 'bid',
+											 'status' : 'acked'
+											}
+		self.order_manager.handle_order_from_gateway(orderexecution1)
+		self.assertEqual(len(self.order_manager.orders), 2)
+		self.assertEqual(self.order_manager.orders[2]['status'], 'acked')
+
+	# The status indexes follow the orders, and the history keeps only the last terminal orders:
+	def test_status_indexes(self):
+		order_manager = OrderManager(history_size=2)
+		for i in range(4):
+			order_manager.handle_order_from_trading_strategy({'price': 219, 'quantity': 10, 'side': 'bid'})
+		self.assertEqual([o['id'] for o in order_manager.get_orders_by_status('new')], [1, 2, 3, 4])
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'acked'})
+		order_manager.handle_order_from_gateway({'id': 2, 'status': 'acked'})
+		self.assertEqual([o['id'] for o in order_manager.get_orders_by_status('new')], [3, 4])
+		self.assertEqual([o['id'] for o in order_manager.get_orders_by_status('acked')], [1, 2])
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'filled'})
+		order_manager.handle_order_from_gateway({'id': 3, 'status': 'rejected'})
+		order_manager.handle_order_from_gateway({'id': 4, 'status': 'cancelled'})
+		self.assertEqual(list(order_manager.orders), [2])
+		self.assertEqual([o['id'] for o in order_manager.get_orders_by_status('acked')], [2])
+		self.assertEqual([o['id'] for o in order_manager.terminal_orders], [3, 4])
+
+	# An order failing a risk check is not sent to the market, it is sent back to the strategy as rejected.
+	# A filled order updates the position of the risk engine:
+	def test_risk_engine(self):
+		om_2_ts = deque()
+		om_2_gw = deque()
+		order_manager = OrderManager(om_2_ts=om_2_ts, om_2_gw=om_2_gw, risk_engine=RiskEngine(max_position_per_strategy=10))
+		order = {'id': 7, 'price': 219, 'quantity': 10, 'side': 'buy', 'strategy': 'ma', 'symbol': 'GOOG'}
+		order_manager.handle_order_from_trading_strategy(order)
+		order_manager.handle_order_from_trading_strategy(order)
+		self.assertEqual(len(om_2_gw), 1)
+		self.assertEqual(om_2_ts.popleft(), dict(order, status='rejected'))
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'filled'})
+		self.assertEqual(order_manager.risk_engine.get_position(('strategy', 'ma')), 10)
+		order_manager.handle_order_from_trading_strategy(dict(order, side='sell'))
+		self.assertEqual(len(om_2_gw), 2)
+
+	# A partial fill followed by a cancel changes the position by the quantity filled:
+	def test_partial_fill(self):
+		om_2_gw = deque()
+		order_manager = OrderManager(om_2_ts=deque(), om_2_gw=om_2_gw, risk_engine=RiskEngine(max_position_per_strategy=100))
+		order = {'id': 1, 'price': 219, 'quantity': 100, 'side': 'buy', 'strategy': 'ma', 'symbol': 'GOOG'}
+		order_manager.handle_order_from_trading_strategy(order)
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'partially_filled', 'fill_price': 219, 'fill_quantity': 60, 'leaves_quantity': 40})
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'cancelled'})
+		self.assertEqual(order_manager.risk_engine.get_exposure(('strategy', 'ma')), [60, 0, 0])
+		order_manager.handle_order_from_trading_strategy(dict(order, id=2))
+		self.assertEqual(len(om_2_gw), 1)
+		order_manager.handle_order_from_trading_strategy(dict(order, id=3, quantity=40))
+		self.assertEqual(len(om_2_gw), 2)
+
+	# The reports sent back to the strategy carry the ids of the strategy, even after a rejection
+	# which did not use an id of the order manager:
+	def test_client_ids(self):
+		om_2_ts = deque()
+		order_manager = OrderManager(om_2_ts=om_2_ts, om_2_gw=deque(), risk_engine=RiskEngine(max_order_notional=5000))
+		order_manager.handle_order_from_trading_strategy({'id': 1, 'price': 219, 'quantity': 100, 'side': 'buy'})
+		order_manager.handle_order_from_trading_strategy({'id': 2, 'price': 219, 'quantity': 10, 'side': 'buy'})
+		self.assertEqual(om_2_ts.popleft()['id'], 1)
+		order_manager.handle_order_from_gateway({'id': 1, 'status': 'filled'})
+		self.assertEqual(om_2_ts.popleft()['id'], 2)
+		self.assertEqual(order_manager.client_ids, {})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,168 @@
+# The sweep function runs a back test for every combination of a grid of strategy parameters and every symbol,
+# the back tests being spread over the processes of a ProcessPoolExecutor: each back test is independent,
+# so the sweep runs as many back tests at once as there are cores instead of one after the other.
+
+# The prices are put once in a SharedPrices block of shared memory (multiprocessing.shared_memory):
+# the workers attach to the block when they start and read the prices of a symbol as a NumPy array on the block,
+# without copying them and without reading or unpickling the price file again for each back test.
+# A task only sends the symbol and the parameters to the worker, and gets back a dictionary of metrics.
+# The results of all the back tests are returned as one DataFrame, one row per back test.
+
+# The back tester is 'vectorized' (VectorizedBackTester, the fastest) or 'event' (EventBasedBackTester).
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from VectorizedBackTester import VectorizedBackTester
+from EventBasedBackTester import EventBasedBackTester
+
+
+class SharedPrices:
+
+	def __init__(self,prices=None,name=None,index=None):
+		if name is None:
+			arrays = {symbol: np.asarray(values, dtype=float) for symbol, values in prices.items()}
+			size = sum(len(array) for array in arrays.values())
+			self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 8)
+			block = np.ndarray(size, float, self.shm.buf)
+			self.index = {}
+			start = 0
+			for symbol, array in arrays.items():
+				block[start:start + len(array)] = array
+				self.index[symbol] = (start, len(array))
+				start += len(array)
+			del block
+			self.owner = True
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+			self.index = index
+			self.owner = False
+		self.name = self.shm.name
+
+	# The from_tick_store function reads the prices of symbols from a TickStore.
+	@classmethod
+	def from_tick_store(cls,tick_store,symbols,column='Adj Close'):
+		return cls({symbol: np.concatenate([chunk[column] for chunk in tick_store.read(symbol, [column])]) for symbol in symbols})
+
+	def symbols(self):
+		return list(self.index)
+
+	# The prices of a symbol are a view on the shared memory block.
+	def __getitem__(self,symbol):
+		start, length = self.index[symbol]
+		return np.ndarray(length, float, self.shm.buf, start * 8)
+
+	def close(self):
+		self.shm.close()
+
+	def unlink(self):
+		if self.owner:
+			self.shm.unlink()
+
+
+# The prices of a worker process, attached by the initializer of the pool.
+worker_prices = None
+
+def attach_prices(name,index):
+	global worker_prices
+	worker_prices = SharedPrices(name=name, index=index)
+
+
+# The run_backtest function runs one back test in a worker and returns its metrics.
+def run_backtest(symbol,params,backtester='vectorized',initial_cash=10000):
+	prices = worker_prices[symbol]
+	if backtester == 'vectorized':
+		position, cash, holdings, total = VectorizedBackTester(**params).run(prices)
+		trades = int(np.count_nonzero(np.diff(position, prepend=0)))
+	elif backtester == 'event':
+		eb = EventBasedBackTester(**params)
+		for price in prices.tolist():
+			eb.process_data_from_yahoo(price, symbol)
+			eb.process_events()
+		total = np.asarray(eb.ts.list_total)
+		trades = eb.ts.order_id
+	else:
+		raise ValueError('unknown back tester %s' % backtester)
+	return backtest_metrics(symbol, params, total, trades, initial_cash)
+
+def backtest_metrics(symbol,params,total,trades,initial_cash):
+	total = np.concatenate(([initial_cash], total))
+	drawdown = np.maximum.accumulate(total) - total
+	row = {'symbol': symbol}
+	row.update(params)
+	row.update({'final_total': float(total[-1]), 'pnl': float(total[-1] - initial_cash),
+							'max_drawdown': float(drawdown.max()), 'trades': trades})
+	return row
+
+# The parameter_grid function gives every combination of the values of a grid {parameter: [values]}.
+# The combinations where the small window is not smaller than the large one are skipped.
+def parameter_grid(grid):
+	names = list(grid)
+	combinations = [dict(zip(names, values)) for values in product(*grid.values())]
+	return [params for params in combinations
+					if params.get('small_window_size', 0) < params.get('large_window_size', float('inf'))]
+
+
+# The sweep function runs the back tests of a grid of parameters on the prices of several symbols
+# (a dictionary symbol -> prices, a DataFrame with a column per symbol, or a SharedPrices) and returns their metrics.
+def sweep(prices,grid,symbols=None,backtester='vectorized',max_workers=None):
+	shared = prices if isinstance(prices, SharedPrices) else SharedPrices(prices)
+	if symbols is None:
+		symbols = shared.symbols()
+	try:
+		with ProcessPoolExecutor(max_workers, initializer=attach_prices, initargs=(shared.name, shared.index)) as executor:
+			futures = [executor.submit(run_backtest, symbol, params, backtester)
+								 for symbol in symbols for params in parameter_grid(grid)]
+			rows = [future.result() for future in futures]
+	finally:
+		if shared is not prices:
+			shared.close()
+			shared.unlink()
+	return pd.DataFrame(rows)
+
+
+import unittest
+
+class TestParameterSweep(unittest.TestCase):
+
+	def setUp(self):
+		random_state = np.random.RandomState(0)
+		self.prices = {'GOOG': 100 + np.cumsum(random_state.normal(0, 1, 500)),
+									 'AAPL': 50 + np.cumsum(random_state.normal(0, 1, 500))}
+
+	# Each row of the sweep is the result of the same back test run in the main process:
+	def test_sweep(self):
+		grid = {'small_window_size': [5, 20, 50], 'large_window_size': [20, 100]}
+		results = sweep(self.prices, grid, max_workers=2)
+		self.assertEqual(len(results), 2 * 4)
+		self.assertEqual(list(results.columns), ['symbol', 'small_window_size', 'large_window_size', 'final_total', 'pnl', 'max_drawdown', 'trades'])
+		for row in results.itertuples():
+			backtester = VectorizedBackTester(row.small_window_size, row.large_window_size)
+			backtester.run(self.prices[row.symbol])
+			self.assertEqual(row.final_total, backtester.list_total[-1])
+
+	def test_event_backtester(self):
+		shared = SharedPrices({'GOOG': self.prices['GOOG'][:300]})
+		try:
+			results = sweep(shared, {'small_window_size': [10], 'large_window_size': [30, 60]}, backtester='event', max_workers=2)
+		finally:
+			shared.close()
+			shared.unlink()
+		self.assertEqual(results['large_window_size'].tolist(), [30, 60])
+		self.assertTrue((results['trades'] > 0).all())
+
+if __name__ == '__main__':
+	from TickStore import load_tick_store
+
+	tick_store = load_tick_store(start_date='2001-01-01', end_date='2022-01-01', root='tick_data')
+	shared = SharedPrices.from_tick_store(tick_store, ['GOOG'])
+	try:
+		results = sweep(shared, {'small_window_size': [5, 10, 20, 50], 'large_window_size': [50, 100, 200]})
+	finally:
+		shared.close()
+		shared.unlink()
+	print(results.sort_values('pnl', ascending=False).to_string(index=False))
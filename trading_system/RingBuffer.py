@@ -0,0 +1,155 @@
+# The RingBuffer class is a channel between two processes: one process appends the messages, the other one reads them
+# (single producer, single consumer). It replaces a deque (append, popleft, len) when the components of the trading system
+# run in different processes, each one on its own core with its own GIL.
+
+# The buffer lives in a multiprocessing.shared_memory block:
+#  - a header with the write index (head), the read index (tail), the capacity and the size of a slot;
+#    head and tail are on different cache lines, since each one is written by a different process,
+#  - capacity slots of slot_size bytes; a message is written in the slot head modulo capacity.
+# The producer only writes head and the consumer only writes tail, so no lock is needed: the producer writes the message
+# in its slot before moving head forward, and the consumer reads the slot before moving tail forward.
+# The indexes are aligned 64-bit integers written in one piece, and only ever increase: they are read and written
+# through a memoryview of native integers, a single load or store. struct.pack_into is not used for them,
+# since it clears the bytes before writing the value: the other process could read 0 in between.
+
+# The messages are written with the fixed binary layout of WireCodec instead of being pickled like in a multiprocessing.Queue.
+# A RingBuffer can be given to a child process: the child attaches to the same shared memory block.
+
+import struct
+from multiprocessing import shared_memory
+from time import sleep
+
+from TradingMessages import Order, ExecutionReport, BookEvent
+from WireCodec import encode_into, decode_from, MESSAGE_SIZE
+
+
+HEADER = struct.Struct('<q56xq56xqq')
+HEAD_INDEX = 0
+TAIL_INDEX = 8
+
+
+class RingBuffer:
+
+	def __init__(self,capacity=1024,slot_size=None,name=None):
+		if name is None:
+			if capacity & (capacity - 1):
+				raise ValueError('the capacity must be a power of 2')
+			slot_size = slot_size or MESSAGE_SIZE
+			self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + capacity * slot_size)
+			HEADER.pack_into(self.shm.buf, 0, 0, 0, capacity, slot_size)
+			self.owner = True
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+			_, _, capacity, slot_size = HEADER.unpack_from(self.shm.buf, 0)
+			self.owner = False
+		self.name = self.shm.name
+		self.capacity = capacity
+		self.mask = capacity - 1
+		self.slot_size = slot_size
+		self.buf = self.shm.buf
+		self.header = self.buf[:HEADER.size]
+		self.indexes = self.header.cast('q')
+
+	# A RingBuffer given to another process is attached to the same shared memory block.
+	def __getstate__(self):
+		return {'name': self.name}
+
+	def __setstate__(self,state):
+		self.__init__(name=state['name'])
+
+	def head(self):
+		return self.indexes[HEAD_INDEX]
+
+	def tail(self):
+		return self.indexes[TAIL_INDEX]
+
+	def __len__(self):
+		return self.head() - self.tail()
+
+	# The try_append function writes a message and returns False when the buffer is full.
+	def try_append(self,message):
+		head = self.head()
+		if head - self.tail() >= self.capacity:
+			return False
+		encode_into(self.buf, HEADER.size + (head & self.mask) * self.slot_size, message)
+		self.indexes[HEAD_INDEX] = head + 1
+		return True
+
+	# The append function waits for the consumer when the buffer is full.
+	def append(self,message):
+		while not self.try_append(message):
+			sleep(0)
+
+	def extend(self,messages):
+		for message in messages:
+			self.append(message)
+
+	# The popleft function reads the oldest message; like a deque, it raises IndexError when the buffer is empty.
+	def popleft(self):
+		tail = self.tail()
+		if tail == self.head():
+			raise IndexError('pop from an empty ring buffer')
+		message = decode_from(self.buf, HEADER.size + (tail & self.mask) * self.slot_size)
+		self.indexes[TAIL_INDEX] = tail + 1
+		return message
+
+	def close(self):
+		self.indexes.release()
+		self.header.release()
+		self.buf = None
+		self.shm.close()
+
+	# The creator of the ring buffer removes the shared memory block once every process closed it.
+	def unlink(self):
+		if self.owner:
+			self.shm.unlink()
+
+
+import unittest
+import multiprocessing
+
+def produce(ring_buffer,count):
+	for i in range(count):
+		ring_buffer.append(Order(i, 100.5 + i, 10, 'bid', 'new', symbol='GOOG', timestamp=i * 1000))
+	ring_buffer.close()
+
+class TestRingBuffer(unittest.TestCase):
+
+	def setUp(self):
+		self.ring_buffer = RingBuffer(capacity=8)
+
+	def tearDown(self):
+		self.ring_buffer.close()
+		self.ring_buffer.unlink()
+
+	# The ring buffer is used like a deque, and gives back the same messages:
+	def test_deque_interface(self):
+		messages = [{'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new'},
+								ExecutionReport(2, 218.5, 10, 'sell', 'New', 'partially_filled', 'GOOG', fill_price=218.0, fill_quantity=4, leaves_quantity=6),
+								BookEvent(219, 10, -1, -1, 'GOOG')]
+		self.ring_buffer.extend(messages)
+		self.assertEqual(len(self.ring_buffer), 3)
+		received = [self.ring_buffer.popleft() for i in range(3)]
+		self.assertEqual(received, messages)
+		self.assertIsInstance(received[1], ExecutionReport)
+		self.assertEqual(len(self.ring_buffer), 0)
+		with self.assertRaises(IndexError):
+			self.ring_buffer.popleft()
+		for i in range(8):
+			self.assertTrue(self.ring_buffer.try_append(messages[0]))
+		self.assertFalse(self.ring_buffer.try_append(messages[0]))
+
+	# A producer process sends more messages than the capacity of the buffer: it waits for the consumer.
+	def test_processes(self):
+		process = multiprocessing.Process(target=produce, args=(self.ring_buffer, 100))
+		process.start()
+		received = []
+		while len(received) < 100:
+			if len(self.ring_buffer) > 0:
+				received.append(self.ring_buffer.popleft())
+		process.join()
+		self.assertEqual([o['id'] for o in received], list(range(100)))
+		self.assertEqual(received[99], {'id': 99, 'price': 199.5, 'quantity': 10, 'side': 'bid', 'action': 'new', 'symbol': 'GOOG', 'timestamp': 99000})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,171 @@
+# The RiskEngine class performs the pre-trade risk checks of the order manager.
+# Each order sent by a trading strategy is checked against:
+#  - the position limits per strategy and per symbol: the position, plus the quantity of the orders still open
+#    on the same side, plus the new order, must stay within the limit,
+#  - the notional limit: price times quantity of one order,
+#  - the price band (fat finger check): the price must stay within price_band (a fraction) of the reference price
+#    of the symbol, which is the middle of the last book event (or its only side),
+#  - the order rate: a strategy cannot send more than max_orders orders in throttle_window seconds.
+# A limit set to None is not checked.
+
+# The risk engine does not scan the orders: it keeps the positions, the open quantities, the reference prices
+# and the times of the last orders of each strategy, and updates them when an order is sent, filled (partially or not),
+# cancelled or rejected.
+# Each check is O(1).
+
+import time
+from collections import deque
+
+
+class RiskEngine:
+
+	def __init__(self,max_position_per_strategy=None,max_position_per_symbol=None,max_order_notional=None,
+							 price_band=None,max_orders=None,throttle_window=1.0,clock=time.monotonic):
+		self.max_position_per_strategy = max_position_per_strategy
+		self.max_position_per_symbol = max_position_per_symbol
+		self.max_order_notional = max_order_notional
+		self.price_band = price_band
+		self.max_orders = max_orders
+		self.throttle_window = throttle_window
+		self.clock = clock
+		# exposures[key] is [position, open buy quantity, open sell quantity], key being ('strategy', name) or ('symbol', name)
+		self.exposures = {}
+		self.reference_prices = {}
+		self.order_times = {}
+
+	def get_exposure(self,key):
+		exposure = self.exposures.get(key)
+		if exposure is None:
+			exposure = [0, 0, 0]
+			self.exposures[key] = exposure
+		return exposure
+
+	def get_position(self,key):
+		return self.get_exposure(key)[0]
+
+	# The update_reference_price function is called with each book event.
+	def update_reference_price(self,book_event,symbol=None):
+		bid = book_event['bid_price']
+		offer = book_event['offer_price']
+		if bid > 0 and offer > 0:
+			price = (bid + offer) / 2
+		elif bid > 0:
+			price = bid
+		elif offer > 0:
+			price = offer
+		else:
+			return
+		self.reference_prices[symbol if symbol is not None else book_event.get('symbol')] = price
+
+	# The check_order function returns None when the order passes all the checks, or the reason of the rejection.
+	# An accepted order is counted in the open quantities and in the order rate of its strategy.
+	def check_order(self,order):
+		quantity = order['quantity']
+		price = order['price']
+		buy = order['side'] in ('buy', 'bid')
+		strategy = order.get('strategy')
+		symbol = order.get('symbol')
+
+		if self.max_order_notional is not None and price * quantity > self.max_order_notional:
+			return 'notional limit'
+
+		if self.price_band is not None:
+			reference_price = self.reference_prices.get(symbol)
+			if reference_price is not None and abs(price - reference_price) > self.price_band * reference_price:
+				return 'price band'
+
+		if self.max_position_per_strategy is not None:
+			if self.exceeds_position_limit(('strategy', strategy), quantity, buy, self.max_position_per_strategy):
+				return 'strategy position limit'
+		if self.max_position_per_symbol is not None:
+			if self.exceeds_position_limit(('symbol', symbol), quantity, buy, self.max_position_per_symbol):
+				return 'symbol position limit'
+
+		if self.max_orders is not None:
+			now = self.clock()
+			order_times = self.order_times.get(strategy)
+			if order_times is None:
+				order_times = deque()
+				self.order_times[strategy] = order_times
+			while order_times and order_times[0] <= now - self.throttle_window:
+				order_times.popleft()
+			if len(order_times) >= self.max_orders:
+				return 'order rate'
+			order_times.append(now)
+
+		self.add_open_quantity(order, quantity, buy)
+		return None
+
+	def exceeds_position_limit(self,key,quantity,buy,limit):
+		position, open_buy, open_sell = self.get_exposure(key)
+		if buy:
+			return position + open_buy + quantity > limit
+		return position - open_sell - quantity < -limit
+
+	def add_open_quantity(self,order,quantity,buy):
+		for key in (('strategy', order.get('strategy')), ('symbol', order.get('symbol'))):
+			self.get_exposure(key)[1 if buy else 2] += quantity
+
+	# The on_fill function is called with the quantity of each fill, partial or not: the quantity filled is no longer open
+	# and changes the positions.
+	def on_fill(self,order,quantity):
+		buy = order['side'] in ('buy', 'bid')
+		self.add_open_quantity(order, -quantity, buy)
+		for key in (('strategy', order.get('strategy')), ('symbol', order.get('symbol'))):
+			self.get_exposure(key)[0] += quantity if buy else -quantity
+
+	# The on_order_closed function is called when an order accepted by check_order is filled, cancelled or rejected,
+	# with the quantity which was still open: it is no longer open.
+	def on_order_closed(self,order,open_quantity):
+		self.add_open_quantity(order, -open_quantity, order['side'] in ('buy', 'bid'))
+
+import unittest
+
+class TestRiskEngine(unittest.TestCase):
+
+	def setUp(self):
+		self.now = 0.0
+		self.risk_engine = RiskEngine(max_position_per_strategy=100, max_position_per_symbol=150, max_order_notional=50000,
+																	price_band=0.1, max_orders=3, throttle_window=1.0, clock=lambda: self.now)
+
+	def order(self,quantity,side='buy',price=100,strategy='ma',symbol='GOOG'):
+		return {'id': 1, 'price': price, 'quantity': quantity, 'side': side, 'strategy': strategy, 'symbol': symbol}
+
+	# The open orders count in the position limit until they are closed:
+	def test_position_limits(self):
+		self.assertIsNone(self.risk_engine.check_order(self.order(60)))
+		self.assertEqual(self.risk_engine.check_order(self.order(60)), 'strategy position limit')
+		self.risk_engine.on_fill(self.order(60), 60)
+		self.risk_engine.on_order_closed(self.order(60), 0)
+		self.assertEqual(self.risk_engine.get_position(('strategy', 'ma')), 60)
+		self.assertIsNone(self.risk_engine.check_order(self.order(40)))
+		self.assertEqual(self.risk_engine.check_order(self.order(60, strategy='other')), 'symbol position limit')
+		self.assertIsNone(self.risk_engine.check_order(self.order(60, side='sell', strategy='other')))
+
+	# A partial fill changes the position, the rest of the order is no longer open once it is cancelled:
+	def test_partial_fill(self):
+		self.assertIsNone(self.risk_engine.check_order(self.order(100)))
+		self.risk_engine.on_fill(self.order(100), 60)
+		self.risk_engine.on_order_closed(self.order(100), 40)
+		self.assertEqual(self.risk_engine.get_position(('strategy', 'ma')), 60)
+		self.assertEqual(self.risk_engine.get_exposure(('strategy', 'ma')), [60, 0, 0])
+		self.assertEqual(self.risk_engine.check_order(self.order(100)), 'strategy position limit')
+		self.assertIsNone(self.risk_engine.check_order(self.order(40)))
+
+	def test_notional_and_price_band(self):
+		self.assertEqual(self.risk_engine.check_order(self.order(60, price=1000)), 'notional limit')
+		self.risk_engine.update_reference_price({'bid_price': 99, 'offer_price': 101, 'symbol': 'GOOG'})
+		self.assertEqual(self.risk_engine.check_order(self.order(10, price=115)), 'price band')
+		self.assertIsNone(self.risk_engine.check_order(self.order(10, price=105)))
+		# No book event for this symbol yet: the price band cannot be checked
+		self.assertIsNone(self.risk_engine.check_order(self.order(10, price=115, symbol='AAPL')))
+
+	def test_order_rate(self):
+		for i in range(3):
+			self.assertIsNone(self.risk_engine.check_order(self.order(1)))
+		self.assertEqual(self.risk_engine.check_order(self.order(1)), 'order rate')
+		self.now = 1.5
+		self.assertIsNone(self.risk_engine.check_order(self.order(1)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,129 @@
+# The RollingStatistics class keeps the statistics of the last size values of a stream
+# (count, mean, variance, minimum and maximum) and updates them in O(1) for each new value,
+# instead of summing the whole window again each time like average() does.
+
+# The mean and the variance are updated with Welford's method: adding a value and removing the oldest one
+# only changes the mean and the sum of the squared deviations, which is more accurate than keeping
+# the sum of the squares of prices.
+# The minimum and the maximum are kept with two monotonic deques: the values which can no longer be
+# the minimum (or the maximum) of the window are dropped when a new value arrives, so the front of the deque
+# is always the answer and each value is added and removed once.
+
+# The ExponentialMovingAverage class gives the exponentially weighted moving average of a stream in O(1).
+# One instance of these classes can be shared by the strategies using the same prices.
+
+from collections import deque
+
+
+class RollingStatistics:
+	def __init__(self,size):
+		self.size = size
+		self.values = deque()
+		self.count = 0
+		self.mean_value = 0.0
+		self.squared_deviations = 0.0
+		self.min_values = deque()
+		self.max_values = deque()
+
+	def __len__(self):
+		return len(self.values)
+
+	def is_full(self):
+		return len(self.values) == self.size
+
+	# The append function adds a value to the window and removes the oldest value when the window is full.
+	def append(self,value):
+		self.values.append(value)
+		n = len(self.values)
+		delta = value - self.mean_value
+		self.mean_value += delta / n
+		self.squared_deviations += delta * (value - self.mean_value)
+
+		while self.min_values and self.min_values[-1][1] >= value:
+			self.min_values.pop()
+		self.min_values.append((self.count, value))
+		while self.max_values and self.max_values[-1][1] <= value:
+			self.max_values.pop()
+		self.max_values.append((self.count, value))
+		self.count += 1
+
+		if n > self.size:
+			self.remove_oldest()
+
+	def remove_oldest(self):
+		value = self.values.popleft()
+		n = len(self.values)
+		delta = value - self.mean_value
+		self.mean_value -= delta / n
+		self.squared_deviations -= delta * (value - self.mean_value)
+
+		oldest = self.count - self.size
+		if self.min_values[0][0] < oldest:
+			self.min_values.popleft()
+		if self.max_values[0][0] < oldest:
+			self.max_values.popleft()
+
+	def mean(self):
+		return self.mean_value
+
+	def variance(self):
+		n = len(self.values)
+		if n < 2:
+			return 0.0
+		return max(self.squared_deviations, 0.0) / (n - 1)
+
+	def std(self):
+		return self.variance() ** 0.5
+
+	def min(self):
+		return self.min_values[0][1] if self.min_values else None
+
+	def max(self):
+		return self.max_values[0][1] if self.max_values else None
+
+
+class ExponentialMovingAverage:
+	def __init__(self,alpha=None,span=None):
+		self.alpha = alpha if alpha is not None else 2.0 / (span + 1)
+		self.value = None
+
+	def append(self,value):
+		if self.value is None:
+			self.value = value
+		else:
+			self.value += self.alpha * (value - self.value)
+		return self.value
+
+
+import unittest
+import random
+import statistics
+
+class TestRollingStatistics(unittest.TestCase):
+
+	def setUp(self):
+		random.seed(0)
+		self.prices = [100 + random.gauss(0, 5) for _ in range(500)]
+
+	# At each step, the statistics must be the ones of the last size values:
+	def test_window_statistics(self):
+		rolling_statistics = RollingStatistics(20)
+		for i, price in enumerate(self.prices):
+			rolling_statistics.append(price)
+			window = self.prices[max(0, i - 19):i + 1]
+			self.assertEqual(len(rolling_statistics), len(window))
+			self.assertAlmostEqual(rolling_statistics.mean(), sum(window) / len(window))
+			self.assertEqual(rolling_statistics.min(), min(window))
+			self.assertEqual(rolling_statistics.max(), max(window))
+			if len(window) > 1:
+				self.assertAlmostEqual(rolling_statistics.variance(), statistics.variance(window))
+		self.assertTrue(rolling_statistics.is_full())
+
+	def test_exponential_moving_average(self):
+		ewma = ExponentialMovingAverage(alpha=0.5)
+		self.assertEqual(ewma.append(10), 10)
+		self.assertEqual(ewma.append(20), 15)
+		self.assertEqual(ExponentialMovingAverage(span=3).alpha, 0.5)
+
+if __name__ == '__main__':
+	unittest.main()
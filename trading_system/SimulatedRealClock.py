@@ -1,72 +1,353 @@
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from time import sleep
+
+
+# The clock and the messages carry the time as an integer number of nanoseconds since the epoch (UTC),
+# like the timestamps of the TickStore: comparing or subtracting two times is an integer operation.
+# The timestamps given as ISO strings ('2018-06-29 08:15:27.243860') are converted once, when they enter the system,
+# by parse_timestamp. datetime.strptime is very slow; parse_timestamp slices the fields of the string,
+# and the epoch time of the midnight of each date is cached, since all the messages of a day share the same date.
+
+EPOCH = datetime(1970, 1, 1)
+NANOSECONDS_PER_SECOND = 10 ** 9
+DATE_CACHE = {}
+
+
+# The parse_timestamp function converts a timestamp to nanoseconds since the epoch:
+# 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM:SS' or 'YYYY-MM-DDTHH:MM:SS' with an optional fraction of second and an optional Z.
+# The other ISO formats (with a UTC offset, after the fraction of second or not) are parsed by datetime.fromisoformat. A number is already in nanoseconds.
+def parse_timestamp(timestamp):
+	if not isinstance(timestamp, str):
+		return time_to_ns(timestamp)
+	if timestamp.endswith('Z'):
+		timestamp = timestamp[:-1]
+	length = len(timestamp)
+	if length > 19 and (timestamp[19] != '.' or '+' in timestamp[20:] or '-' in timestamp[20:]):
+		return parse_timestamp_with_offset(timestamp)
+	date = timestamp[:10]
+	midnight = DATE_CACHE.get(date)
+	if midnight is None:
+		midnight = (datetime(int(date[:4]), int(date[5:7]), int(date[8:10])) - EPOCH) // timedelta(seconds=1) * NANOSECONDS_PER_SECOND
+		DATE_CACHE[date] = midnight
+	if length == 10:
+		return midnight
+	ns = midnight + (int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])) * NANOSECONDS_PER_SECOND
+	if length > 20:
+		fraction = timestamp[20:29]
+		ns += int(fraction) * 10 ** (9 - len(fraction))
+	return ns
+
+def parse_timestamp_with_offset(timestamp):
+	dt = datetime.fromisoformat(timestamp)
+	if dt.tzinfo is not None:
+		dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+	return time_to_ns(dt)
+
+# The time_to_ns function converts a datetime to nanoseconds since the epoch; a number is already a time in nanoseconds.
+def time_to_ns(time):
+	if isinstance(time, datetime):
+		return (time - EPOCH) // timedelta(microseconds=1) * 1000
+	return int(time)
+
+# The to_datetime function converts a time in nanoseconds to a datetime, to display it.
+def to_datetime(ns):
+	return EPOCH + timedelta(microseconds=ns // 1000)
 
 
 class SimulatedRealClock:
 	def __init__(self,simulated=False):
 		self.simulated = simulated
 		self.simulated_time = None
-		
+
 	def process_order(self,order):
-		self.simulated_time= datetime.strptime(order['timestamp'], '%Y-%m-%d %H:%M:%S.%f')
-		
+		timestamp = order['timestamp']
+		self.simulated_time = timestamp if type(timestamp) is int else parse_timestamp(timestamp)
+
+	# The getTime function returns the time in nanoseconds since the epoch.
 	def getTime(self):
 		if not self.simulated:
-			return datetime.now()
-    else:
-       return self.simulated_time
-
-realtime=SimulatedRealClock()
-print(realtime.getTime())
-# It will return the date/time when you run this code
-simulatedtime=SimulatedRealClock(simulated=True)
-simulatedtime.process_order({'id' : 1, 'timestamp' : '2018-06-29 08:15:27.243860'})
-print(simulatedtime.getTime())
-# It will return 2018-06-29 08:15:27.243860
-
-class TimeOut(threading.Thread):
-  def __init__(self,sim_real_clock,time_to_stop,fun):
-		super().__init__()
-		self.time_to_stop=time_to_stop
-		self.sim_real_clock=sim_real_clock
-		self.callback=fun
-		self.disabled=False
-	
+			return time.time_ns()
+		else:
+			return self.simulated_time
+
+
+# The timeouts were handled by one thread per timeout, checking the time every second.
+# The TimerWheel class handles all the timeouts of the system with a single thread (or with no thread at all in simulation),
+# with a resolution of one millisecond.
+
+# A timer wheel is a circular array of slots, one slot per tick (millisecond): a timer expiring at tick t is put in the slot
+# t modulo the number of slots, so arming and cancelling a timer are O(1), and each tick only looks at its own slot.
+# One wheel of 256 slots only covers 256 ms, so the wheel is hierarchical: the level 1 wheel has slots of 256 ticks,
+# the level 2 wheel slots of 256 * 256 ticks, and so on. A timer is put in the first level whose range covers its expiry,
+# and when the time reaches the start of a slot of a higher level, the timers of this slot are moved down to the lower levels.
+# When the time jumps (simulated time), the ticks where no level has a timer to fire or to move down are skipped.
+
+# The time is read in nanoseconds from the clock given to the wheel (SimulatedRealClock or EventScheduler) with getTime,
+# so the same code works with the real time and with the simulated time.
+# With the real time, start runs the wheel in a thread; with the simulated time, advance is called when the clock moves.
+
+WHEEL_BITS = 8
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4
+
+
+class Timer:
+	__slots__ = ('tick', 'callback', 'slot', 'level')
+
+	def __init__(self,tick,callback):
+		self.tick = tick
+		self.callback = callback
+		self.slot = None
+		self.level = None
+
+
+class TimerWheel:
+
+	def __init__(self,clock,resolution=0.001):
+		self.clock = clock
+		self.resolution = int(resolution * 10 ** 9)
+		self.levels = [[{} for i in range(WHEEL_SIZE)] for level in range(WHEEL_LEVELS)]
+		self.counts = [0] * WHEEL_LEVELS
+		self.current_tick = None
+		self.lock = threading.RLock()
+		self.thread = None
+		self.running = False
+
+	def __len__(self):
+		return sum(self.counts)
+
+	def now_tick(self):
+		return time_to_ns(self.clock.getTime()) // self.resolution
+
+	# The schedule function arms a timer calling fun after delay (in seconds or as a timedelta). It returns the timer.
+	def schedule(self,delay,fun):
+		if isinstance(delay, timedelta):
+			delay = delay.total_seconds()
+		with self.lock:
+			if self.current_tick is None:
+				self.current_tick = self.now_tick()
+			timer = Timer(self.current_tick + max(int(round(delay * 10 ** 9 / self.resolution)), 1), fun)
+			self.insert(timer)
+			return timer
+
+	def cancel(self,timer):
+		with self.lock:
+			if timer.slot is not None:
+				del timer.slot[timer]
+				self.counts[timer.level] -= 1
+				timer.slot = None
+
+	def insert(self,timer):
+		tick = max(timer.tick, self.current_tick + 1)
+		delta = tick - self.current_tick
+		level = 0
+		while level < WHEEL_LEVELS - 1 and delta >= 1 << (WHEEL_BITS * (level + 1)):
+			level += 1
+		timer.slot = self.levels[level][(tick >> (WHEEL_BITS * level)) & WHEEL_MASK]
+		timer.level = level
+		timer.slot[timer] = None
+		self.counts[level] += 1
+
+	# The advance function moves the wheel to the current time of the clock (or to now, in nanoseconds)
+	# and calls the timers which expired, in the order of their expiry.
+	def advance(self,now=None):
+		with self.lock:
+			target = self.now_tick() if now is None else time_to_ns(now) // self.resolution
+			if self.current_tick is None:
+				self.current_tick = target
+				return 0
+			fired = 0
+			while self.current_tick < target:
+				level = 0
+				while level < WHEEL_LEVELS and self.counts[level] == 0:
+					level += 1
+				if level == WHEEL_LEVELS:
+					self.current_tick = target
+					break
+				if level > 0:
+					span = 1 << (WHEEL_BITS * level)
+					next_tick = ((self.current_tick >> (WHEEL_BITS * level)) + 1) * span
+					if next_tick > target:
+						self.current_tick = target
+						break
+					self.current_tick = next_tick - 1
+				fired += self.tick()
+			return fired
+
+	def tick(self):
+		self.current_tick += 1
+		tick = self.current_tick
+		level = 1
+		while level < WHEEL_LEVELS and tick & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+			level += 1
+		for cascade_level in range(level - 1, 0, -1):
+			slot = self.levels[cascade_level][(tick >> (WHEEL_BITS * cascade_level)) & WHEEL_MASK]
+			timers = list(slot)
+			slot.clear()
+			self.counts[cascade_level] -= len(timers)
+			for timer in timers:
+				if timer.tick > tick:
+					self.insert(timer)
+				else:
+					self.insert_expired(timer)
+		slot = self.levels[0][tick & WHEEL_MASK]
+		timers = list(slot)
+		slot.clear()
+		self.counts[0] -= len(timers)
+		for timer in timers:
+			timer.slot = None
+			timer.callback()
+		return len(timers)
+
+	# A timer moved down at its own tick is put in the level 0 slot of this tick, which is handled right after the cascade.
+	def insert_expired(self,timer):
+		timer.slot = self.levels[0][self.current_tick & WHEEL_MASK]
+		timer.level = 0
+		timer.slot[timer] = None
+		self.counts[0] += 1
+
+	# The start function runs the wheel with the real time in a single thread, waking up every tick.
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
 	def run(self):
-		while not self.disabled and self.sim_real_clock.getTime() < self.time_to_stop:
-			sleep(1)
-			if not self.disabled:
-				self.callback()
-				
+		while self.running:
+			self.advance()
+			sleep(self.resolution / 10 ** 9)
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+
+# The OMS arms a timeout of five seconds when it sends an order, and cancels it when the market answers.
 class OMS:
-	def __init__(self,sim_real_clock):
+	def __init__(self,sim_real_clock,timer_wheel):
 		self.sim_real_clock = sim_real_clock
-		self.five_sec_order_time_out_management= TimeOut(sim_real_clock, sim_real_clock.getTime()+timedelta(0,5), self.onTimeOut)
-		
+		self.timer_wheel = timer_wheel
+		self.five_sec_order_time_out_management = None
+
 	def send_order(self):
-		self.five_sec_order_time_out_management.disabled = False
-		self.five_sec_order_time_out_management.start()
+		self.five_sec_order_time_out_management = self.timer_wheel.schedule(timedelta(0,5), self.onTimeOut)
 		print('send order')
-	
+
 	def receive_market_reponse(self):
-		self.five_sec_order_time_out_management.disabled = True
-	
+		if self.five_sec_order_time_out_management is not None:
+			self.timer_wheel.cancel(self.five_sec_order_time_out_management)
+			self.five_sec_order_time_out_management = None
+
 	def onTimeOut(self):
 		print('Order Timeout Please Take Action')
 
-		
+
+import unittest
+import pandas as pd
+
+class TestSimulatedRealClock(unittest.TestCase):
+
+	def test_parse_timestamp(self):
+		for timestamp in ['2018-06-29 08:15:27.243860', '2018-06-29T08:15:27', '2018-06-29 08:15:27.2', '2018-06-29 08:15:27.243860123Z', '2018-06-29']:
+			expected = pd.Timestamp(timestamp.rstrip('Z')).value
+			self.assertEqual(parse_timestamp(timestamp), expected)
+		self.assertEqual(parse_timestamp('2018-06-29T10:15:27+02:00'), parse_timestamp('2018-06-29 08:15:27'))
+		self.assertEqual(parse_timestamp('2024-01-02T09:30:00.123+01:00'), parse_timestamp('2024-01-02 08:30:00.123'))
+		self.assertEqual(parse_timestamp('2024-01-02T09:30:00.123-05:00'), parse_timestamp('2024-01-02 14:30:00.123'))
+		self.assertIn('2018-06-29', DATE_CACHE)
+
+	def test_clock(self):
+		clock = SimulatedRealClock(simulated=True)
+		clock.process_order({'id': 1, 'timestamp': '2018-06-29 08:15:27.243860'})
+		self.assertEqual(to_datetime(clock.getTime()), datetime(2018, 6, 29, 8, 15, 27, 243860))
+		clock.process_order({'id': 2, 'timestamp': clock.getTime() + 1000})
+		self.assertEqual(clock.getTime(), 1530260127243861000)
+		self.assertIsInstance(SimulatedRealClock().getTime(), int)
+
+class TestTimerWheel(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = SimulatedRealClock(simulated=True)
+		self.clock.process_order({'id': 1, 'timestamp': '2018-06-29 08:15:27.243860'})
+		self.timer_wheel = TimerWheel(self.clock)
+		self.fired = []
+
+	def move_to(self,timestamp):
+		self.clock.process_order({'id': 1, 'timestamp': timestamp})
+		return self.timer_wheel.advance()
+
+	# The timers fire in the order of their expiry, at the millisecond:
+	def test_expiry(self):
+		self.timer_wheel.schedule(5, lambda: self.fired.append('5s'))
+		self.timer_wheel.schedule(0.2, lambda: self.fired.append('200ms'))
+		self.timer_wheel.schedule(timedelta(hours=1), lambda: self.fired.append('1h'))
+		self.assertEqual(self.move_to('2018-06-29 08:15:27.442900'), 0)
+		self.assertEqual(self.move_to('2018-06-29 08:15:27.443000'), 1)
+		self.assertEqual(self.move_to('2018-06-29 08:15:32.242000'), 0)
+		self.assertEqual(self.move_to('2018-06-29 09:15:27.243000'), 2)
+		self.assertEqual(self.fired, ['200ms', '5s', '1h'])
+		self.assertEqual(len(self.timer_wheel), 0)
+
+	# A cancelled timeout never fires:
+	def test_cancel(self):
+		oms = OMS(self.clock, self.timer_wheel)
+		oms.onTimeOut = lambda: self.fired.append('timeout')
+		oms.send_order()
+		oms.receive_market_reponse()
+		oms.send_order()
+		self.move_to('2018-06-29 08:21:27.243860')
+		self.assertEqual(self.fired, ['timeout'])
+
+	# Many timers spread over all the levels fire in order:
+	def test_many_timers(self):
+		delays = [(i * 7919) % 100000 / 10.0 for i in range(2000)]
+		for delay in delays:
+			self.timer_wheel.schedule(delay, lambda delay=delay: self.fired.append(delay))
+		self.timer_wheel.advance(time_to_ns(self.clock.getTime()) + 10 ** 13)
+		self.assertEqual(len(self.fired), 2000)
+		self.assertEqual(self.fired, sorted(self.fired))
+
+	def test_real_time(self):
+		timer_wheel = TimerWheel(SimulatedRealClock())
+		timer_wheel.start()
+		try:
+			timer_wheel.schedule(0.01, lambda: self.fired.append('fired'))
+			sleep(0.2)
+		finally:
+			timer_wheel.stop()
+		self.assertEqual(self.fired, ['fired'])
+
+
 if __name__ == '__main__':
+	realtime=SimulatedRealClock()
+	print(to_datetime(realtime.getTime()))
+	# It will return the date/time when you run this code
+	simulatedtime=SimulatedRealClock(simulated=True)
+	simulatedtime.process_order({'id' : 1, 'timestamp' : '2018-06-29 08:15:27.243860'})
+	print(to_datetime(simulatedtime.getTime()))
+	# It will return 2018-06-29 08:15:27.243860
+
 	print('case 1: real time')
 	simulated_real_clock=SimulatedRealClock()
-	oms=OMS(simulated_real_clock)
+	timer_wheel=TimerWheel(simulated_real_clock)
+	timer_wheel.start()
+	oms=OMS(simulated_real_clock,timer_wheel)
 	oms.send_order()
 	for i in range(10):
 		print('do something else: %d' % (i))
-    sleep(1)
-  
-	print('case 2: simulated time')
-  simulated_real_clock=SimulatedRealClock(simulated=True)
-  simulated_real_clock.process_order({'id' : 1,'timestamp' : '2018-06-29 08:15:27.243860'})
-  oms = OMS(simulated_real_clock)
-  oms.send_order()
-  simulated_real_clock. process_order({'id': 1,'timestamp': '2018-06-29 08:21:27.243860'})
+		sleep(1)
+	timer_wheel.stop()
 
+	print('case 2: simulated time')
+	simulated_real_clock=SimulatedRealClock(simulated=True)
+	simulated_real_clock.process_order({'id' : 1,'timestamp' : '2018-06-29 08:15:27.243860'})
+	timer_wheel=TimerWheel(simulated_real_clock)
+	oms = OMS(simulated_real_clock,timer_wheel)
+	oms.send_order()
+	simulated_real_clock.process_order({'id': 1,'timestamp': '2018-06-29 08:21:27.243860'})
+	timer_wheel.advance()
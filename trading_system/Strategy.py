@@ -0,0 +1,198 @@
+# The Strategy class is the base class of the trading strategies. It separates the two parts of a strategy:
+#  - the signal, written by each strategy in the hooks called by the Strategy class: on_book_event for each book event,
+#    on_fill for each fill of one of its orders, and on_timer when a timer expires (a TimerWheel or an EventScheduler
+#    calls handle_timer),
+#  - the execution, shared by all the strategies: the registry of the orders indexed by id, the sending of the new orders,
+#    the status updates from the market, and the position, the cash and the PnL updated by each fill.
+# In its hooks, a strategy only calls send_order: the orders are sent to the order manager when the hook returns.
+
+# The orders are kept in a dictionary indexed by id: a response of the market finds its order in O(1),
+# and an order is removed as soon as it is filled, rejected or cancelled.
+# A fill executes fill_quantity at fill_price (a partial fill included); a filled response without them executes
+# what is left of the order at the price of the order. The position is marked to market at the top of the book:
+# at the bid when long, at the offer when short.
+
+from TradingMessages import Order
+
+
+# The statuses after which the market does not send anything else for an order.
+FINAL_STATUSES = ('filled', 'rejected', 'cancelled')
+
+
+class Strategy:
+
+	def __init__(self, ob_2_ts=None, ts_2_om=None, om_2_ts=None, name=None, cash=10000):
+		self.name = name
+		self.orders = {}
+		self.orders_to_send = []
+		self.filled_quantity = {}
+		self.order_id = 0
+		self.position = 0
+		self.pnl = 0
+		self.cash = cash
+		self.holdings = 0
+		self.current_bid = 0
+		self.current_offer = 0
+		self.ob_2_ts = ob_2_ts
+		self.ts_2_om = ts_2_om
+		self.om_2_ts = om_2_ts
+
+	# The hooks of the strategies.
+	def on_book_event(self,book_event):
+		pass
+
+	def on_fill(self,order,quantity,price):
+		pass
+
+	def on_timer(self,now):
+		pass
+
+	# The send_order function creates an order, which is sent once the hook returns. It returns the order.
+	def send_order(self,price,quantity,side,symbol=None):
+		self.order_id += 1
+		order = Order(self.order_id, price, quantity, side, 'to_be_sent', symbol=symbol, strategy=self.name)
+		self.orders[order['id']] = order
+		self.orders_to_send.append(order)
+		return order
+
+	def handle_input_from_bb(self,book_event=None):
+		if self.ob_2_ts is None:
+			print('simulation mode')
+			self.handle_book_event(book_event)
+		else:
+			if len(self.ob_2_ts)>0:
+				self.handle_book_event(self.ob_2_ts.popleft())
+
+	def handle_response_from_om(self):
+		if self.om_2_ts is not None:
+			if len(self.om_2_ts)>0:
+				self.handle_market_response(self.om_2_ts.popleft())
+		else:
+			print('simulation mode')
+
+	# The handle_book_events and handle_market_responses functions handle a list of messages in one call
+	# and return the list of orders to send to the order manager, collected in a list standing for the ts_2_om channel.
+	def handle_book_events(self,book_events):
+		ts_2_om = self.ts_2_om
+		self.ts_2_om = orders = []
+		try:
+			for book_event in book_events:
+				self.handle_book_event(book_event)
+		finally:
+			self.ts_2_om = ts_2_om
+		return orders
+
+	def handle_market_responses(self,order_executions):
+		ts_2_om = self.ts_2_om
+		self.ts_2_om = orders = []
+		try:
+			for order_execution in order_executions:
+				self.handle_market_response(order_execution)
+		finally:
+			self.ts_2_om = ts_2_om
+		return orders
+
+	def handle_book_event(self,book_event):
+		if book_event is None:
+			return
+		self.current_bid = book_event['bid_price']
+		self.current_offer = book_event['offer_price']
+		self.mark_to_market()
+		self.on_book_event(book_event)
+		self.execution()
+
+	def handle_timer(self,now):
+		self.on_timer(now)
+		self.execution()
+
+	# The handle_market_response function finds the order of the response in the registry and updates its status.
+	def handle_market_response(self, order_execution):
+		order = self.lookup_order(order_execution['id'])
+		if order is None:
+			print('error not found')
+			return
+		status = order_execution['status']
+		order['status'] = status
+		if status == 'filled' or status == 'partially_filled':
+			self.fill(order, order_execution)
+		if status in FINAL_STATUSES:
+			del self.orders[order['id']]
+			self.filled_quantity.pop(order['id'], None)
+		self.execution()
+
+	# The execution function sends the orders created since its last call.
+	def execution(self):
+		for order in self.orders_to_send:
+			order['status'] = 'new'
+			order['action'] = 'no_action'
+			if self.ts_2_om is None:
+				print('Simulation mode')
+			else:
+				self.ts_2_om.append(order.copy())
+		self.orders_to_send.clear()
+
+	# The fill function updates the position, the cash and the PnL with the quantity executed by a response.
+	def fill(self,order,order_execution):
+		filled_quantity = self.filled_quantity.get(order['id'], 0)
+		quantity = order_execution.get('fill_quantity')
+		if quantity is None:
+			quantity = order['quantity'] - filled_quantity
+		price = order_execution.get('fill_price', order['price'])
+		self.filled_quantity[order['id']] = filled_quantity + quantity
+		pos = quantity if order['side'] == 'buy' else -quantity
+		self.position += pos
+		self.pnl -= pos * price
+		self.cash -= pos * price
+		self.mark_to_market()
+		self.on_fill(order, quantity, price)
+
+	# The mark_to_market function values the position at the price it could be closed at.
+	def mark_to_market(self):
+		self.holdings = self.position * (self.current_bid if self.position > 0 else self.current_offer)
+		return self.holdings
+
+	# The get_pnl function returns the PnL of the strategy, the position being marked to market.
+	def get_pnl(self):
+		return self.pnl + self.holdings
+
+	# The lookup_order function returns the outstanding order of an id, or None.
+	def lookup_order(self,id):
+		return self.orders.get(id)
+
+
+import unittest
+
+# The TimerStrategy sends an order on each timer and stops after its first fill.
+class TimerStrategy(Strategy):
+
+	def __init__(self):
+		Strategy.__init__(self, ts_2_om=[], name='timer')
+		self.fills = []
+
+	def on_timer(self,now):
+		if not self.fills:
+			self.send_order(self.current_offer, 10, 'buy', 'GOOG')
+
+	def on_fill(self,order,quantity,price):
+		self.fills.append((order['id'], quantity, price))
+
+class TestStrategy(unittest.TestCase):
+
+	def test_hooks(self):
+		strategy = TimerStrategy()
+		strategy.handle_book_event({'bid_price': 10, 'bid_quantity': 5, 'offer_price': 11, 'offer_quantity': 5, 'symbol': 'GOOG'})
+		strategy.handle_timer(1000)
+		self.assertEqual(strategy.ts_2_om, [{'id': 1, 'price': 11, 'quantity': 10, 'side': 'buy', 'action': 'no_action', 'status': 'new',
+																				 'symbol': 'GOOG', 'strategy': 'timer'}])
+		strategy.handle_market_response({'id': 1, 'status': 'partially_filled', 'fill_price': 11, 'fill_quantity': 4})
+		self.assertEqual(strategy.fills, [(1, 4, 11)])
+		self.assertEqual(strategy.get_pnl(), -4)
+		strategy.handle_timer(2000)
+		self.assertEqual(len(strategy.ts_2_om), 1)
+		strategy.handle_market_response({'id': 1, 'status': 'filled'})
+		self.assertEqual(strategy.fills, [(1, 4, 11), (1, 6, 11)])
+		self.assertEqual((strategy.position, strategy.cash), (10, 10000 - 110))
+		self.assertEqual(strategy.orders, {})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,160 @@
+# The StrategyHost class runs many strategies of the same kind on one stream of book events, as a single Strategy.
+# The strategies are not Python objects: each one is a row of NumPy arrays (its parameters, its state, its position),
+# and a book event calls the signal function once for all of them. The signal function updates the state arrays in place
+# and returns the target position of every strategy; only the strategies whose target changed send an order.
+# So a book event costs a few vectorized operations whatever the number of strategies, plus the orders really sent.
+
+# The signal function is called as signal(price, *state) and can be a NumPy function, or be compiled with Numba
+# (compiled=True): Numba is optional, without it the signal runs as a NumPy function.
+# dual_moving_average_signal is the dual moving average strategy of TradingStrategyDualMA and VectorizedBackTester,
+# one strategy per pair of windows.
+
+# The orders of a hosted strategy carry its name (name.index) in their strategy field, so the order manager
+# and the risk engine see each strategy, and the fills update the position and the cash of each strategy.
+
+import warnings
+
+import numpy as np
+
+from Strategy import Strategy
+
+
+# The compile_signal function compiles a signal function with Numba when it is installed, and warns when it is not.
+def compile_signal(signal):
+	try:
+		from numba import njit
+	except ImportError:
+		warnings.warn('numba is not installed, the signal runs with NumPy', RuntimeWarning)
+		return signal
+	return njit(signal)
+
+
+# The dual_moving_average_signal function updates the sums of the small and large windows of every strategy
+# with a new price and returns their target positions: quantity when the small average is above the large one.
+# The windows which are not full yet are averaged on the prices received so far; a strategy only trades once its small window is full.
+# history keeps the last prices (at least as many as the largest window) and count[0] the number of prices received.
+def dual_moving_average_signal(price, history, count, small_windows, large_windows, small_sums, large_sums, quantity):
+	n = count[0]
+	size = len(history)
+	small_sums += price - np.where(n >= small_windows, history[(n - small_windows) % size], 0.0)
+	large_sums += price - np.where(n >= large_windows, history[(n - large_windows) % size], 0.0)
+	history[n % size] = price
+	count[0] = n + 1
+	small_averages = small_sums / np.minimum(small_windows, n + 1)
+	large_averages = large_sums / np.minimum(large_windows, n + 1)
+	return np.where((small_averages > large_averages) & (small_windows <= n + 1), quantity, 0)
+
+# The dual_moving_average_state function gives the state of dual_moving_average_signal for pairs of windows.
+def dual_moving_average_state(small_windows, large_windows, quantity=10):
+	small_windows = np.asarray(small_windows, dtype=np.int64)
+	large_windows = np.asarray(large_windows, dtype=np.int64)
+	return (np.zeros(int(max(small_windows.max(), large_windows.max())), dtype=float), np.zeros(1, dtype=np.int64),
+					small_windows, large_windows, np.zeros(len(small_windows)), np.zeros(len(large_windows)), quantity)
+
+
+class StrategyHost(Strategy):
+
+	def __init__(self, signal, state, count, ob_2_ts=None, ts_2_om=None, om_2_ts=None, name='host', compiled=False, cash=10000):
+		Strategy.__init__(self, ob_2_ts, ts_2_om, om_2_ts, name, cash * count)
+		self.signal = compile_signal(signal) if compiled else signal
+		self.state = state
+		self.names = ['%s.%d' % (name, index) for index in range(count)]
+		self.indexes = {strategy: index for index, strategy in enumerate(self.names)}
+		self.targets = np.zeros(count, dtype=np.int64)
+		self.positions = np.zeros(count, dtype=np.int64)
+		self.initial_cash = cash
+		self.cashes = np.full(count, float(cash))
+
+	# The book events missing one side of the book are ignored, like in TradingStrategyDualMA.
+	def on_book_event(self,book_event):
+		if book_event['bid_quantity'] == -1 or book_event['offer_quantity'] == -1:
+			return
+		targets = self.signal(book_event['bid_price'], *self.state)
+		changed = np.flatnonzero(targets != self.targets)
+		for index in changed.tolist():
+			quantity = int(targets[index] - self.targets[index])
+			if quantity > 0:
+				order = self.send_order(book_event['offer_price'], quantity, 'buy', book_event.get('symbol'))
+			else:
+				order = self.send_order(book_event['bid_price'], -quantity, 'sell', book_event.get('symbol'))
+			order['strategy'] = self.names[index]
+		self.targets[changed] = targets[changed]
+
+	def on_fill(self,order,quantity,price):
+		index = self.indexes[order['strategy']]
+		pos = quantity if order['side'] == 'buy' else -quantity
+		self.positions[index] += pos
+		self.cashes[index] -= pos * price
+
+	# The get_pnls function returns the PnL of each strategy, its position being marked to market.
+	def get_pnls(self):
+		prices = np.where(self.positions > 0, self.current_bid, self.current_offer)
+		return self.cashes - self.initial_cash + self.positions * prices
+
+
+import unittest
+from VectorizedBackTester import VectorizedBackTester
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+class TestStrategyHost(unittest.TestCase):
+
+	def setUp(self):
+		self.prices = np.round(100 + np.cumsum(np.random.RandomState(0).normal(0, 1, 500)), 2)
+		self.windows = [(5, 20), (10, 50), (20, 100), (50, 100)]
+
+	def book_event(self,price):
+		return {'bid_price': price, 'bid_quantity': 100, 'offer_price': price, 'offer_quantity': 100, 'symbol': 'GOOG'}
+
+	# Each hosted strategy holds the same positions as the vectorized back tester with its windows:
+	def test_dual_moving_average(self):
+		state = dual_moving_average_state([w[0] for w in self.windows], [w[1] for w in self.windows])
+		host = StrategyHost(dual_moving_average_signal, state, len(self.windows), ts_2_om=[], name='dual_ma')
+		targets = []
+		for price in self.prices.tolist():
+			host.handle_book_event(self.book_event(price))
+			targets.append(host.targets.copy())
+		targets = np.array(targets)
+		for index, (small_window_size, large_window_size) in enumerate(self.windows):
+			position, cash, holdings, total = VectorizedBackTester(small_window_size, large_window_size).run(self.prices)
+			self.assertEqual(targets[small_window_size - 1:, index].tolist(), position.tolist())
+		self.assertEqual(len(host.ts_2_om), len(host.orders))
+		self.assertTrue(all(order['strategy'].startswith('dual_ma.') for order in host.ts_2_om))
+
+	# The fills update the position and the cash of the strategy of the order:
+	def test_fills(self):
+		state = dual_moving_average_state([2, 3], [4, 6])
+		host = StrategyHost(dual_moving_average_signal, state, 2, ts_2_om=[])
+		for price in [10, 10, 10, 10, 10, 10, 12]:
+			host.handle_book_event(self.book_event(price))
+		self.assertEqual([order['strategy'] for order in host.ts_2_om], ['host.0', 'host.1'])
+		host.handle_market_response({'id': 2, 'status': 'filled', 'fill_price': 12, 'fill_quantity': 10})
+		self.assertEqual(host.positions.tolist(), [0, 10])
+		self.assertEqual(host.cashes.tolist(), [10000, 10000 - 120])
+		self.assertEqual(host.position, 10)
+		self.assertEqual(host.get_pnls().tolist(), [0, 0])
+
+	# The signal compiled with Numba gives the same targets as the NumPy one:
+	@unittest.skipUnless(numba, 'numba is not installed')
+	def test_compiled(self):
+		small_windows, large_windows = [w[0] for w in self.windows], [w[1] for w in self.windows]
+		host = StrategyHost(dual_moving_average_signal, dual_moving_average_state(small_windows, large_windows), len(self.windows), ts_2_om=[])
+		compiled_host = StrategyHost(dual_moving_average_signal, dual_moving_average_state(small_windows, large_windows), len(self.windows),
+																 ts_2_om=[], compiled=True)
+		self.assertIsNot(compiled_host.signal, dual_moving_average_signal)
+		for price in self.prices.tolist():
+			host.handle_book_event(self.book_event(price))
+			compiled_host.handle_book_event(self.book_event(price))
+			self.assertEqual(compiled_host.targets.tolist(), host.targets.tolist())
+		self.assertEqual(compiled_host.ts_2_om, host.ts_2_om)
+
+	@unittest.skipIf(numba, 'numba is installed')
+	def test_without_numba(self):
+		with self.assertWarns(RuntimeWarning):
+			self.assertIs(compile_signal(dual_moving_average_signal), dual_moving_average_signal)
+
+if __name__ == '__main__':
+	unittest.main()
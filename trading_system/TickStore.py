@@ -0,0 +1,141 @@
+# The TickStore class stores market data by columns on disk, and reads it back without loading the whole history.
+
+# The data of a symbol is split into partitions (one per day by default) and each column of a partition
+# is a NumPy .npy file:
+#     root/GOOG/2018-06-29/timestamp.npy
+#     root/GOOG/2018-06-29/price.npy
+# The timestamps are stored as int64 nanoseconds since the epoch.
+
+# The reader opens the files with memory mapping: the operating system only loads the pages which are read,
+# and the reader gives the data by chunks of chunk_size rows, so a multi-year history is read in constant memory.
+# partition_format is the strftime format naming the partitions; daily bars can be stored by year with '%Y'.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class TickStore:
+
+	def __init__(self,root,partition_format='%Y-%m-%d'):
+		self.root = root
+		self.partition_format = partition_format
+
+	def symbols(self):
+		if not os.path.isdir(self.root):
+			return []
+		return sorted(os.listdir(self.root))
+
+	def partitions(self,symbol):
+		path = os.path.join(self.root, symbol)
+		if not os.path.isdir(path):
+			return []
+		return sorted(os.listdir(path))
+
+	# The write function writes the columns of one partition. The columns are arrays of the same length.
+	# Writing a partition again replaces it.
+	def write(self,symbol,partition,columns):
+		path = os.path.join(self.root, symbol, partition)
+		os.makedirs(path, exist_ok=True)
+		for name, values in columns.items():
+			np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(values))
+
+	# The write_dataframe function splits a data frame indexed by dates into partitions.
+	# The index is stored in the timestamp column.
+	def write_dataframe(self,symbol,df,columns=None):
+		columns = list(df.columns) if columns is None else columns
+		timestamps = pd.DatetimeIndex(df.index)
+		partition_names = timestamps.strftime(self.partition_format)
+		for partition, rows in pd.Series(np.arange(len(df))).groupby(np.asarray(partition_names)):
+			rows = rows.to_numpy()
+			data = {'timestamp': timestamps.values[rows].astype('datetime64[ns]').view('int64')}
+			for column in columns:
+				data[column] = df[column].to_numpy()[rows]
+			self.write(symbol, partition, data)
+
+	# The open_partition function returns the columns of a partition as memory mapped arrays.
+	def open_partition(self,symbol,partition,columns=None):
+		path = os.path.join(self.root, symbol, partition)
+		if columns is None:
+			columns = [name[:-4] for name in sorted(os.listdir(path)) if name.endswith('.npy')]
+		return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in columns}
+
+	# The read function is a generator giving the data of a symbol by chunks of at most chunk_size rows,
+	# in the order of the partitions. Each chunk is a dictionary column name -> array (a view on the memory mapped file).
+	# start and end select the partitions by name (end included).
+	def read(self,symbol,columns=None,start=None,end=None,chunk_size=100000):
+		for partition in self.partitions(symbol):
+			if start is not None and partition < start:
+				continue
+			if end is not None and partition > end:
+				break
+			data = self.open_partition(symbol, partition, columns)
+			count = len(next(iter(data.values())))
+			for offset in range(0, count, chunk_size):
+				yield {name: values[offset:offset + chunk_size] for name, values in data.items()}
+
+	# The read_ticks function is a generator giving (timestamp, value) for each row of a column.
+	def read_ticks(self,symbol,column,start=None,end=None,chunk_size=100000):
+		for chunk in self.read(symbol, ['timestamp', column], start, end, chunk_size):
+			yield from zip(chunk['timestamp'].tolist(), chunk[column].tolist())
+
+
+# The load_financial_data function reads the prices from the pickle file and downloads them the first time.
+# pandas_datareader is only needed for the download.
+def load_financial_data(start_date, end_date,output_file):
+	try:
+		df = pd.read_pickle(output_file)
+		print('File data found...reading GOOG data')
+	except FileNotFoundError:
+		from pandas_datareader import data
+		print('File not found...downloading the GOOG data')
+		df = data.DataReader('GOOG', 'yahoo', start_date, end_date)
+		df.to_pickle(output_file)
+	return df
+
+# The load_tick_store function returns the TickStore holding the prices.
+# The first time, the prices are loaded with load_financial_data and written in the store, by year since they are daily prices.
+def load_tick_store(start_date, end_date,root,symbol='GOOG',output_file='goog_data.pkl'):
+	tick_store = TickStore(root, partition_format='%Y')
+	if not tick_store.partitions(symbol):
+		df = load_financial_data(start_date, end_date, output_file)
+		tick_store.write_dataframe(symbol, df, ['Adj Close'])
+	return tick_store
+
+
+import unittest
+import tempfile
+import shutil
+
+class TestTickStore(unittest.TestCase):
+
+	def setUp(self):
+		self.root = tempfile.mkdtemp()
+		self.tick_store = TickStore(self.root)
+		index = pd.date_range('2018-06-28 09:30', periods=6, freq='12h')
+		self.df = pd.DataFrame({'price': np.arange(6, dtype=float), 'quantity': np.arange(6) * 100}, index=index)
+
+	def tearDown(self):
+		shutil.rmtree(self.root)
+
+	# A data frame is split by day and read back in the same order:
+	def test_write_and_read(self):
+		self.tick_store.write_dataframe('GOOG', self.df)
+		self.assertEqual(self.tick_store.symbols(), ['GOOG'])
+		self.assertEqual(self.tick_store.partitions('GOOG'), ['2018-06-28', '2018-06-29', '2018-06-30'])
+		chunks = list(self.tick_store.read('GOOG', chunk_size=1))
+		self.assertEqual(len(chunks), 6)
+		self.assertIsInstance(chunks[0]['price'].base, np.memmap)
+		ticks = list(self.tick_store.read_ticks('GOOG', 'price'))
+		self.assertEqual([price for _, price in ticks], self.df['price'].tolist())
+		self.assertEqual(ticks[0][0], pd.Timestamp('2018-06-28 09:30').value)
+
+	def test_read_range(self):
+		self.tick_store.write_dataframe('GOOG', self.df)
+		ticks = list(self.tick_store.read_ticks('GOOG', 'quantity', start='2018-06-29', end='2018-06-30'))
+		self.assertEqual([quantity for _, quantity in ticks], [200, 300, 400, 500])
+		self.assertEqual(list(self.tick_store.read('AAPL')), [])
+
+if __name__ == '__main__':
+	unittest.main()
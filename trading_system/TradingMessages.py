@@ -0,0 +1,161 @@
+# The messages exchanged between the components of the trading system were dictionaries.
+# A dictionary is large and each hop was building a new one and copying it again before sending it.
+# The Order, ExecutionReport and BookEvent classes below use __slots__: the fields are stored in the instance
+# without a per-instance dictionary, which makes the messages several times smaller and faster to create and copy.
+
+# The classes keep a dictionary interface (o['price'], o['status'] = 'filled', 'side' in o, o.get('symbol'), o.copy())
+# so the existing code and the tests which build dictionaries keep working:
+# a field set to None behaves like a missing key, and a message compares equal to the dictionary of its fields.
+# from_dict and to_dict convert from and to dictionaries at the edges of the system.
+
+
+class Message:
+	__slots__ = ()
+
+	def __getitem__(self,key):
+		value = getattr(self, key, None)
+		if value is None:
+			raise KeyError(key)
+		return value
+
+	def __setitem__(self,key,value):
+		try:
+			setattr(self, key, value)
+		except AttributeError:
+			raise KeyError(key)
+
+	def __contains__(self,key):
+		return getattr(self, key, None) is not None
+
+	def get(self,key,default = None):
+		value = getattr(self, key, None)
+		return default if value is None else value
+
+	def keys(self):
+		return [key for key in self.__slots__ if getattr(self, key) is not None]
+
+	def to_dict(self):
+		return {key: getattr(self, key) for key in self.__slots__ if getattr(self, key) is not None}
+
+	@classmethod
+	def from_dict(cls,d):
+		message = cls()
+		for key, value in d.items():
+			message[key] = value
+		return message
+
+	def __eq__(self,other):
+		if isinstance(other, Message):
+			other = other.to_dict()
+		if isinstance(other, dict):
+			return self.to_dict() == other
+		return NotImplemented
+
+	__hash__ = None
+
+	def __repr__(self):
+		return '%s(%s)' % (type(self).__name__, self.to_dict())
+
+
+# An Order is created by the liquidity provider (action new/modify/delete on the book)
+# and by the trading strategies and the order manager (action to_be_sent/New/Cancel/Amend, with a status).
+class Order(Message):
+	__slots__ = ('id', 'price', 'quantity', 'side', 'action', 'status', 'symbol', 'timestamp', 'strategy')
+
+	def __init__(self,id = None,price = None,quantity = None,side = None,action = None,status = None,symbol = None,timestamp = None,strategy = None):
+		self.id = id
+		self.price = price
+		self.quantity = quantity
+		self.side = side
+		self.action = action
+		self.status = status
+		self.symbol = symbol
+		self.timestamp = timestamp
+		self.strategy = strategy
+
+	def copy(self):
+		return Order(self.id, self.price, self.quantity, self.side, self.action, self.status, self.symbol, self.timestamp, self.strategy)
+
+
+# An ExecutionReport is the answer of the market to an order (status accepted, rejected, cancelled, partially_filled, filled).
+# A fill also gives the price and the quantity of the fill, and the quantity of the order left to fill.
+class ExecutionReport(Message):
+	__slots__ = ('id', 'price', 'quantity', 'side', 'action', 'status', 'symbol', 'timestamp', 'strategy',
+							 'fill_price', 'fill_quantity', 'leaves_quantity')
+
+	def __init__(self,id = None,price = None,quantity = None,side = None,action = None,status = None,symbol = None,timestamp = None,strategy = None,
+							 fill_price = None,fill_quantity = None,leaves_quantity = None):
+		self.id = id
+		self.price = price
+		self.quantity = quantity
+		self.side = side
+		self.action = action
+		self.status = status
+		self.symbol = symbol
+		self.timestamp = timestamp
+		self.strategy = strategy
+		self.fill_price = fill_price
+		self.fill_quantity = fill_quantity
+		self.leaves_quantity = leaves_quantity
+
+	@classmethod
+	def from_order(cls,order,status = None):
+		return cls(order['id'], order.get('price'), order.get('quantity'), order.get('side'), order.get('action'),
+							 status if status is not None else order.get('status'), order.get('symbol'), order.get('timestamp'), order.get('strategy'),
+							 order.get('fill_price'), order.get('fill_quantity'), order.get('leaves_quantity'))
+
+	def copy(self):
+		return ExecutionReport(self.id, self.price, self.quantity, self.side, self.action, self.status, self.symbol, self.timestamp, self.strategy,
+													 self.fill_price, self.fill_quantity, self.leaves_quantity)
+
+
+# A BookEvent is the top of the book sent by the order book to the trading strategies.
+class BookEvent(Message):
+	__slots__ = ('bid_price', 'bid_quantity', 'offer_price', 'offer_quantity', 'symbol')
+
+	def __init__(self,bid_price = None,bid_quantity = None,offer_price = None,offer_quantity = None,symbol = None):
+		self.bid_price = bid_price
+		self.bid_quantity = bid_quantity
+		self.offer_price = offer_price
+		self.offer_quantity = offer_quantity
+		self.symbol = symbol
+
+	def copy(self):
+		return BookEvent(self.bid_price, self.bid_quantity, self.offer_price, self.offer_quantity, self.symbol)
+
+
+import unittest
+
+class TestTradingMessages(unittest.TestCase):
+
+	# An order is used like a dictionary and compares equal to the dictionary of the fields set:
+	def test_order_as_dict(self):
+		order = Order(1, 219, 10, 'bid', 'new')
+		self.assertEqual(order['price'], 219)
+		self.assertTrue('side' in order)
+		self.assertFalse('status' in order)
+		self.assertIsNone(order.get('status'))
+		with self.assertRaises(KeyError):
+			order['status']
+		order['status'] = 'acked'
+		self.assertEqual(order, {'id': 1, 'price': 219, 'quantity': 10, 'side': 'bid', 'action': 'new', 'status': 'acked'})
+		with self.assertRaises(KeyError):
+			order['unknown'] = 1
+		self.assertFalse(hasattr(order, '__dict__'))
+
+	def test_copy_and_conversion(self):
+		order = Order.from_dict({'id': 2, 'price': 220, 'quantity': 10, 'side': 'ask', 'action': 'New'})
+		copy = order.copy()
+		copy['status'] = 'filled'
+		self.assertIsNone(order.status)
+		report = ExecutionReport.from_order(copy)
+		self.assertEqual(report.to_dict(), {'id': 2, 'price': 220, 'quantity': 10, 'side': 'ask', 'action': 'New', 'status': 'filled'})
+
+	def test_book_event(self):
+		be = BookEvent(219, 10, -1, -1)
+		self.assertEqual(be, {'bid_price': 219, 'bid_quantity': 10, 'offer_price': -1, 'offer_quantity': -1})
+		be['symbol'] = 'GOOG'
+		self.assertEqual(be['symbol'], 'GOOG')
+
+if __name__ == '__main__':
+	unittest.main()
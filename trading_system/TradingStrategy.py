@@ -11,54 +11,29 @@
 # One is taking the book events form the order book, 
 #the two others are made to send orders and receive order updates from the market.
 
+# The signal is written in the on_book_event hook of the Strategy class, which handles the execution part:
+# the registry of the orders, the sending of the orders, the fills, the position and the PnL.
 
-class TradingStrategy:
+from Strategy import Strategy
+
+
+class TradingStrategy(Strategy):
 	
-	def __init__(self, ob_2_ts, ts_2_om, om_2_ts):
-		self.orders = []
-		self.order_id = 0
-		self.position = 0
-		self.pnl = 0
-		self.cash = 10000
-		self.current_bid = 0
-		self.current_offer = 0
-		self.ob_2_ts = ob_2_ts
-		self.ts_2_om = ts_2_om
-		self.om_2_ts = om_2_ts
-		
+	def __init__(self, ob_2_ts=None, ts_2_om=None, om_2_ts=None):
+		Strategy.__init__(self, ob_2_ts, ts_2_om, om_2_ts)
 		
-	#We will code two functions to handle the book events from the order book as shown in the code; 
-	#handle_input_from_bb checks whether there are book events in deque ob_2_ts and
-	#will call the handle_book_event function. 
-	
-	def handle_input_from_bb(self,book_event=None): 
-		if self.ob_2_ts is None:
-			print('simulation mode')
-			self.handle_book_event(book_event) 
-			
-		else:
-			if len(self.ob_2_ts)>0: 
-				be=self.handle_book_event(self.ob_2_ts.popleft()) 
-				self.handle_book_event(be)
-				
-	
-	# The handle_book_event function calls the function signal to check whether 
+	# The on_book_event function calls the function signal to check whether 
 	# there is a signal to send an order.		
-	def handle_book_event(self,book_event):
-		if book_event is not None:
-			self.current_bid = book_event['bid_price'] 
-			self.current_offer = book_event['offer_price']
-			
+	def on_book_event(self,book_event):
 		if self.signal(book_event): 
 			self.create_orders(book_event,
 												 min(book_event['bid_quantity'], 
 														 book_event['offer_quantity'])
 												)
-			self.execution()
 		
 	# In this case, the signal verifies whether the bid price is higher than the ask price. 
 	# If this condition is verified, this function returns True. 
-	# The handle_book_event function in the code will create an order
+	# The on_book_event function in the code will create an order
 	# by calling the create_orders function. 
 	
 	def signal(self, book_event): 
@@ -76,88 +51,13 @@ class TradingStrategy:
 	# Therefore, the two orders must be created simultaneously. 
 	# This function increments the order ID for any created orders. 
 	# This order ID will be local to the trading strategy. 
+	# The orders are new Order objects which are only referenced by the strategy, there is no need to copy them.
 	
 	
 	def create_orders(self,book_event,quantity): 
-		self.order_id+=1 
-		ord = {'id': self.order_id,
-					 'price': book_event['bid_price'], 
-					 'quantity': quantity,
-					 'side': 'sell',
-					 'action': 'to_be_sent'
-					}
-		self.orders.append(ord.copy())
-		
-		price=book_event['offer_price'] 
-		side='buy'
-		self.order_id+=1
-		ord = {'id': self.order_id,
-					 'price': book_event['offer_price'], 
-					 'quantity': quantity,
-					 'side': 'buy',
-					 'action': 'to_be_sent'
-					}
-		self.orders.append(ord.copy())
-	
-	
-	# The function execution will take care of processing orders in their whole order life cycle. 
-	# For instance, when an order is created, its status is new. 
-	# Once the order has been sent to the market, the market will respond by acknowledging the order or reject the order. 
-	# If the other is rejected, this function will remove the order from the list of outstanding orders.
-	
-	# When an order is filled, it means this order has been executed. 
-	# Once an order is filled, the strategy must update the position 
-	# and the PnL with the help of the code below. 
+		self.send_order(book_event['bid_price'], quantity, 'sell', book_event.get('symbol'))
+		self.send_order(book_event['offer_price'], quantity, 'buy', book_event.get('symbol'))
 	
-	def execution(self):
-		orders_to_be_removed = []
-		for index, order in enumerate(self.orders):
-			if order['action'] == 'to_be_sent': # Send order
-				order['status'] = 'new' 
-				order['action'] = 'no_action' 
-				if self.ts_2_om is None:
-					print('Simulation mode') 
-				else:
-					self.ts_2_om.append(order.copy()) 
-			if order['status'] == 'rejected':
-				orders_to_be_removed.append(index) 
-			if order['status'] == 'filled':
-				orders_to_be_removed.append(index)
-				pos = order['quantity'] if order['side'] == 'buy' else -order['quantity'] 
-				self.position += pos
-				self.pnl -= pos * order['price']
-				self.cash -= pos * order['price']
-			
-		for order_index in sorted(orders_to_be_removed,reverse=True): 
-			del (self.orders[order_index])
-  
-	# The handle_response_from_om and handle_market_response functions will collect the information
-	# from the order manager (collecting information from the market) as shown in the following code. 
-	
-	def handle_response_from_om(self): 
-		if self.om_2_ts is not None:
-			self.handle_market_response(self.om_2_ts.popleft()) 
-		else:
-			print('simulation mode')
-	
-	def handle_market_response(self, order_execution): 
-		order,_=self.lookup_orders(order_execution['id']) 
-		if order is None:
-			print('error not found')
-			return 
-		order['status']=order_execution['status'] 
-		self.execution()
-	
-	# The lookup_orders function in the following code checks whether
-	# an order exists in the data structure gathering all the orders and return this order.
-	
-	def lookup_orders(self,id): 
-		count=0
-		for o in self.orders: 
-			if o['id'] == id:
-				return o, count
-			count+=1 
-		return None, None
 	
 	# The test_receive_top_of_book test case verifies whether the book event is correctly handled by the trading strategy. 
 	# The test_rejected_order and test_filled_order test cases verify whether a response from the market is correctly handled.
@@ -168,7 +68,6 @@ class TradingStrategy:
 	# This way of doing it increases the reuse of the same code.
 	
 import unittest
-import TradingStrategy
 
 
 class TestMarketSimulator(unittest.TestCase): 
@@ -191,14 +90,14 @@ class TestMarketSimulator(unittest.TestCase):
 								 }
 		self.trading_strategy.handle_book_event(book_event) 
 		self.assertEqual(len(self.trading_strategy.orders), 2) 
-		self.assertEqual(self.trading_strategy.orders[0]['side'], 'sell') 
-		self.assertEqual(self.trading_strategy.orders[1]['side'], 'buy') 
-		self.assertEqual(self.trading_strategy.orders[0]['price'], 12) 
-		self.assertEqual(self.trading_strategy.orders[1]['price'], 11) 
-		self.assertEqual(self.trading_strategy.orders[0]['quantity'], 100) 
+		self.assertEqual(self.trading_strategy.orders[1]['side'], 'sell') 
+		self.assertEqual(self.trading_strategy.orders[2]['side'], 'buy') 
+		self.assertEqual(self.trading_strategy.orders[1]['price'], 12) 
+		self.assertEqual(self.trading_strategy.orders[2]['price'], 11) 
 		self.assertEqual(self.trading_strategy.orders[1]['quantity'], 100) 
-		self.assertEqual(self.trading_strategy.orders[0]['action'], 'no_action') 
-		self.assertEqual(self.trading_strategy.orders[1]['action'], 'no_action')
+		self.assertEqual(self.trading_strategy.orders[2]['quantity'], 100) 
+		self.assertEqual(self.trading_strategy.orders[1]['action'], 'no_action') 
+		self.assertEqual(self.trading_strategy.orders[2]['action'], 'no_action')
 		
 		
 	# We will create a market response indicating a rejection of a given order. 
@@ -212,10 +111,11 @@ class TestMarketSimulator(unittest.TestCase):
 											 'status' : 'rejected'
 											}
 		self.trading_strategy.handle_market_response(order_execution) 
-		self.assertEqual(self.trading_strategy.orders[0]['side'], 'buy') 
-		self.assertEqual(self.trading_strategy.orders[0]['price'], 11) 
-		self.assertEqual(self.trading_strategy.orders[0]['quantity'], 100) 
-		self.assertEqual(self.trading_strategy.orders[0]['status'], 'new')
+		self.assertNotIn(1, self.trading_strategy.orders)
+		self.assertEqual(self.trading_strategy.orders[2]['side'], 'buy') 
+		self.assertEqual(self.trading_strategy.orders[2]['price'], 11) 
+		self.assertEqual(self.trading_strategy.orders[2]['quantity'], 100) 
+		self.assertEqual(self.trading_strategy.orders[2]['status'], 'new')
 
 	# Now, we will need to test the behavior of the trading strategy when the order is filled. 
 	# We will need to update the position, the pnl, and the cash that we have to invest as shown in the following code. 
@@ -239,5 +139,23 @@ class TestMarketSimulator(unittest.TestCase):
 		self.assertEqual(self.trading_strategy.position, 0)
 		self.assertEqual(self.trading_strategy.cash, 10100)
 		self.assertEqual(self.trading_strategy.pnl, 100)
-	
-		
+
+	# An order can be filled in several parts, each one at its own price; the position is marked to market at the bid:
+	def test_partial_fills(self):
+		self.test_receive_top_of_book()
+		self.trading_strategy.handle_market_response({'id': 2, 'status': 'partially_filled', 'fill_price': 11, 'fill_quantity': 40, 'leaves_quantity': 60})
+		self.assertEqual(self.trading_strategy.position, 40)
+		self.assertEqual(self.trading_strategy.cash, 10000 - 440)
+		self.assertEqual(self.trading_strategy.get_pnl(), -440 + 40 * 12)
+		self.trading_strategy.handle_market_response({'id': 2, 'status': 'filled', 'fill_price': 10, 'fill_quantity': 60, 'leaves_quantity': 0})
+		self.assertEqual(self.trading_strategy.position, 100)
+		self.assertEqual(self.trading_strategy.cash, 10000 - 440 - 600)
+		self.assertNotIn(2, self.trading_strategy.orders)
+		self.trading_strategy.handle_market_response({'id': 1, 'status': 'filled'})
+		self.assertEqual(self.trading_strategy.position, 0)
+		self.assertEqual(self.trading_strategy.pnl, 1200 - 1040)
+		self.assertEqual(self.trading_strategy.get_pnl(), 160)
+		self.assertEqual(len(self.trading_strategy.orders), 0)
+
+if __name__ == '__main__':
+	unittest.main()
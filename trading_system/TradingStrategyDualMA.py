@@ -0,0 +1,128 @@
+# The TradingStrategyDualMA class is the dual moving average strategy used by the event-based backtester.
+# It takes the book events from the order book and uses the bid price to update a small and a large moving average.
+# When the small average is above the large one, the strategy buys, and when it goes below, the strategy sells.
+
+# The strategy keeps two sets of metrics:
+#  the paper metrics assume that every order is executed at the bid price when the signal is triggered,
+#  the other metrics are updated only when the market fills the orders sent to the order manager.
+
+# The moving averages are kept in RollingStatistics objects, which update the averages in O(1) for each book event.
+# The signal is the on_book_event hook of the Strategy class, which sends the orders and updates the metrics on each fill.
+
+from RollingStatistics import RollingStatistics
+from Strategy import Strategy
+
+
+class TradingStrategyDualMA(Strategy):
+
+	def __init__(self, ob_2_ts=None, ts_2_om=None, om_2_ts=None, small_window_size=50, large_window_size=100):
+		Strategy.__init__(self, ob_2_ts, ts_2_om, om_2_ts)
+		self.paper_position = 0
+		self.paper_pnl = 0
+		self.paper_cash = 10000
+		self.long_signal = False
+		self.total = 0
+		self.small_window = RollingStatistics(small_window_size)
+		self.large_window = RollingStatistics(large_window_size)
+		self.list_position = []
+		self.list_cash = []
+		self.list_holdings = []
+		self.list_total = []
+		self.list_paper_position = []
+		self.list_paper_cash = []
+		self.list_paper_holdings = []
+		self.list_paper_total = []
+
+	# The create_metrics_out_of_prices function updates the two moving averages.
+	# It returns True once the small window is full, when the signal can be used.
+	def create_metrics_out_of_prices(self,price_update):
+		self.small_window.append(price_update)
+		self.large_window.append(price_update)
+		if self.small_window.is_full():
+			if self.small_window.mean() > self.large_window.mean():
+				self.long_signal = True
+			else:
+				self.long_signal = False
+			return True
+		return False
+
+	# The buy_sell_or_hold_something function creates an order when the signal changes
+	# and records the paper metrics and the metrics of the orders really filled.
+	def buy_sell_or_hold_something(self,book_event):
+		if self.long_signal and self.paper_position<=0:
+			self.create_order(book_event,book_event['bid_quantity'],'buy')
+			self.paper_position += book_event['bid_quantity']
+			self.paper_cash -= book_event['bid_quantity'] * book_event['bid_price']
+		elif self.paper_position>0 and not self.long_signal:
+			self.create_order(book_event,book_event['bid_quantity'],'sell')
+			self.paper_position -= book_event['bid_quantity']
+			self.paper_cash -= -book_event['bid_quantity'] * book_event['bid_price']
+
+		self.paper_holdings = self.paper_position * book_event['bid_price']
+		self.paper_total = (self.paper_holdings + self.paper_cash)
+		self.list_paper_position.append(self.paper_position)
+		self.list_paper_cash.append(self.paper_cash)
+		self.list_paper_holdings.append(self.paper_holdings)
+		self.list_paper_total.append(self.paper_holdings+self.paper_cash)
+
+		self.holdings = self.position * book_event['bid_price']
+		self.total = (self.holdings + self.cash)
+		self.list_position.append(self.position)
+		self.list_cash.append(self.cash)
+		self.list_holdings.append(self.holdings)
+		self.list_total.append(self.holdings+self.cash)
+
+	# The signal function only uses the book events having both a bid and an offer.
+	def signal(self, book_event):
+		if book_event['bid_quantity'] != -1 and book_event['offer_quantity'] != -1:
+			if self.create_metrics_out_of_prices(book_event['bid_price']):
+				self.buy_sell_or_hold_something(book_event)
+
+	def create_order(self,book_event,quantity,side):
+		self.send_order(book_event['bid_price'], quantity, side, book_event.get('symbol'))
+
+	def on_book_event(self,book_event):
+		self.signal(book_event)
+
+
+import unittest
+
+class TestTradingStrategyDualMA(unittest.TestCase):
+
+	def setUp(self):
+		self.trading_strategy = TradingStrategyDualMA(small_window_size=2, large_window_size=4)
+
+	def book_event(self,price):
+		return {'bid_price': price, 'bid_quantity': 10, 'offer_price': price, 'offer_quantity': 10}
+
+	# The strategy buys when the small average goes above the large one and sells when it goes below:
+	def test_signal(self):
+		for price in [10, 10, 10, 10]:
+			self.trading_strategy.handle_book_event(self.book_event(price))
+		self.assertEqual(len(self.trading_strategy.orders), 0)
+		self.trading_strategy.handle_book_event(self.book_event(12))
+		self.assertEqual(len(self.trading_strategy.orders), 1)
+		self.assertEqual(self.trading_strategy.orders[1]['side'], 'buy')
+		self.assertEqual(self.trading_strategy.paper_position, 10)
+		for price in [8, 8]:
+			self.trading_strategy.handle_book_event(self.book_event(price))
+		self.assertEqual(self.trading_strategy.orders[2]['side'], 'sell')
+		self.assertEqual(self.trading_strategy.paper_position, 0)
+		self.assertEqual(self.trading_strategy.list_paper_total[-1], 10000 - 120 + 80)
+
+	# A filled order updates the position and the cash:
+	def test_filled_order(self):
+		for price in [10, 10, 10, 10, 12]:
+			self.trading_strategy.handle_book_event(self.book_event(price))
+		self.trading_strategy.handle_market_response({'id': 1, 'status': 'filled'})
+		self.assertEqual(len(self.trading_strategy.orders), 0)
+		self.assertEqual(self.trading_strategy.position, 10)
+		self.assertEqual(self.trading_strategy.cash, 10000 - 120)
+
+	# The book events missing one side of the book are ignored:
+	def test_one_sided_book_event(self):
+		self.trading_strategy.handle_book_event({'bid_price': 10, 'bid_quantity': 10, 'offer_price': -1, 'offer_quantity': -1})
+		self.assertEqual(len(self.trading_strategy.small_window), 0)
+
+if __name__ == '__main__':
+	unittest.main()
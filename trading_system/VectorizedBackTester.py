@@ -0,0 +1,96 @@
+# The VectorizedBackTester class runs the dual moving average strategy of ForLoopBackTester
+# on the whole price series at once with NumPy, instead of handling the prices line by line.
+
+# The two moving averages are computed from the cumulative sum of the prices: the sum of a window is the difference
+# of two cumulative sums, so every average costs O(1) whatever the size of the window.
+# Like in the for-loop backtester, the large window is not full yet when the small window becomes full,
+# its average is then computed on the prices received so far.
+
+# The strategy holds 10 shares when the small average is above the large one and nothing otherwise,
+# so the position is known directly from the signal. The cash is the running sum of the trades,
+# and list_position, list_cash, list_holdings and list_total are the same lists as the ones of ForLoopBackTester.
+# The comparison of the two averages may differ from the for-loop backtester only when the two averages are equal
+# up to the rounding of the floating point sums.
+
+import numpy as np
+
+
+class VectorizedBackTester:
+	def __init__(self,small_window_size=50,large_window_size=100,initial_cash=10000,trade_quantity=10):
+		self.small_window_size=small_window_size
+		self.large_window_size=large_window_size
+		self.initial_cash=initial_cash
+		self.trade_quantity=trade_quantity
+		self.list_position=[]
+		self.list_cash=[]
+		self.list_holdings = []
+		self.list_total=[]
+
+	# The moving_average function returns, for each price, the average of the last window_size prices
+	# (or of all the prices received so far at the beginning of the series).
+	def moving_average(self,cumulative_sum,window_size):
+		count = len(cumulative_sum) - 1
+		end = np.arange(1, count + 1)
+		start = np.maximum(end - window_size, 0)
+		return (cumulative_sum[end] - cumulative_sum[start]) / (end - start)
+
+	# The run function computes the signals, the positions, the cash, the holdings and the total for the whole series.
+	# It takes a sequence of prices (a list, a NumPy array or a pandas Series) and returns the metrics as arrays.
+	def run(self,prices):
+		prices = np.asarray(prices, dtype=float)
+		cumulative_sum = np.concatenate(([0.0], np.cumsum(prices)))
+		small_average = self.moving_average(cumulative_sum, self.small_window_size)
+		large_average = self.moving_average(cumulative_sum, self.large_window_size)
+		return self.run_with_averages(prices, small_average, large_average, self.small_window_size - 1)
+
+	# The run_with_averages function trades the prices from the index start with moving averages already computed
+	# (by a FeatureCache, for instance, on a longer history than the prices traded).
+	def run_with_averages(self,prices,small_average,large_average,start=0):
+		tradable = slice(start, None)
+		prices = np.asarray(prices, dtype=float)[tradable]
+		long_signal = small_average[tradable] > large_average[tradable]
+
+		position = np.where(long_signal, self.trade_quantity, 0)
+		trades = np.diff(position, prepend = 0)
+		cash = self.initial_cash - np.cumsum(trades * prices)
+		holdings = position * prices
+		total = holdings + cash
+
+		self.list_position = position.tolist()
+		self.list_cash = cash.tolist()
+		self.list_holdings = holdings.tolist()
+		self.list_total = total.tolist()
+		return position, cash, holdings, total
+
+
+import unittest
+from ForLookBackTester import ForLoopBackTester
+
+class TestVectorizedBackTester(unittest.TestCase):
+
+	def setUp(self):
+		self.prices = 100 + np.cumsum(np.random.RandomState(0).normal(0, 1, 1000))
+
+	# The vectorized backtester must give the same metrics as the for-loop backtester:
+	def test_same_as_for_loop(self):
+		for small_window_size, large_window_size in [(50, 100), (5, 20)]:
+			naive_backtester = ForLoopBackTester(small_window_size, large_window_size)
+			for date, price in enumerate(self.prices):
+				price_information = {'date': date, 'price': float(price)}
+				if naive_backtester.create_metrics_out_of_prices(price_information):
+					naive_backtester.buy_sell_or_hold_something(price_information)
+
+			vectorized_backtester = VectorizedBackTester(small_window_size, large_window_size)
+			vectorized_backtester.run(self.prices)
+			self.assertEqual(vectorized_backtester.list_position, naive_backtester.list_position)
+			np.testing.assert_allclose(vectorized_backtester.list_cash, naive_backtester.list_cash)
+			np.testing.assert_allclose(vectorized_backtester.list_holdings, naive_backtester.list_holdings)
+			np.testing.assert_allclose(vectorized_backtester.list_total, naive_backtester.list_total)
+
+	def test_short_series(self):
+		vectorized_backtester = VectorizedBackTester()
+		vectorized_backtester.run(self.prices[:10])
+		self.assertEqual(vectorized_backtester.list_position, [])
+
+if __name__ == '__main__':
+	unittest.main()
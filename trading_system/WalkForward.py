@@ -0,0 +1,185 @@
+# The WalkForward class validates the dual moving average strategy out of sample.
+# The history is split in folds: a training window followed by a test window, the folds moving forward by step prices
+# (rolling windows), or all starting at the beginning of the history (anchored, the training window grows).
+# For each fold, every combination of a grid of parameters is back tested on the training window,
+# the best one (the highest pnl, or another metric) is kept and back tested on the test window, which it has never seen.
+
+# The folds overlap, and the same windows are used by many folds and many combinations of parameters:
+# the moving averages are computed once on the whole history and kept in a FeatureCache, each fold only takes a slice.
+# Since a moving average only uses the past prices, its slice is the average the strategy would have seen at that time
+# (the first averages of a fold are computed with the prices before the fold, as in live trading).
+# The FeatureCache keeps the arrays by key and removes the least recently used one when it is full (LRU).
+# A FeatureCache can be shared by several histories: the key of a feature holds the symbol and the identity of the prices
+# (their number and a hash of their bytes), so two histories never share a moving average, even with the same symbol.
+
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from VectorizedBackTester import VectorizedBackTester
+from ParameterSweep import parameter_grid
+
+
+class FeatureCache:
+
+	def __init__(self,max_size=64):
+		self.max_size = max_size
+		self.features = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.features)
+
+	def __contains__(self,key):
+		return key in self.features
+
+	# The get function returns the feature of a key, calling compute() to create it the first time.
+	def get(self,key,compute):
+		feature = self.features.get(key)
+		if feature is not None:
+			self.hits += 1
+			self.features.move_to_end(key)
+			return feature
+		self.misses += 1
+		feature = compute()
+		self.features[key] = feature
+		if len(self.features) > self.max_size:
+			self.features.popitem(last=False)
+		return feature
+
+	def clear(self):
+		self.features.clear()
+
+
+# The walk_forward_splits function gives the (train, test) slices of the folds of a history of count prices.
+def walk_forward_splits(count,train_size,test_size,step=None,anchored=False):
+	step = step or test_size
+	splits = []
+	train_start = 0
+	while train_start + train_size + test_size <= count:
+		train_end = train_start + train_size
+		splits.append((slice(0 if anchored else train_start, train_end), slice(train_end, train_end + test_size)))
+		train_start += step
+	return splits
+
+
+class WalkForward:
+
+	def __init__(self,prices,grid,train_size,test_size,step=None,anchored=False,symbol='prices',metric='pnl',cache=None,
+							 initial_cash=10000,trade_quantity=10):
+		self.prices = prices
+		self.values = np.asarray(prices, dtype=float)
+		self.grid = grid
+		self.splits = walk_forward_splits(len(self.values), train_size, test_size, step, anchored)
+		self.symbol = symbol
+		self.metric = metric
+		self.cache = cache if cache is not None else FeatureCache()
+		self.initial_cash = initial_cash
+		self.trade_quantity = trade_quantity
+		self.cumulative_sum = None
+		self.data_key = (len(self.values), hashlib.blake2b(self.values.tobytes(), digest_size=16).hexdigest())
+
+	# The moving_average function gives the moving average of the whole history, computed once for each window.
+	def moving_average(self,window_size):
+		return self.cache.get((self.symbol, self.data_key, 'moving_average', window_size), lambda: self.compute_moving_average(window_size))
+
+	def compute_moving_average(self,window_size):
+		if self.cumulative_sum is None:
+			self.cumulative_sum = np.concatenate(([0.0], np.cumsum(self.values)))
+		return VectorizedBackTester().moving_average(self.cumulative_sum, window_size)
+
+	# The evaluate function back tests parameters on a slice of the history and returns its metrics.
+	# The trading starts once the small window is full.
+	def evaluate(self,params,window):
+		backtester = VectorizedBackTester(params['small_window_size'], params['large_window_size'], self.initial_cash, self.trade_quantity)
+		start = max(params['small_window_size'] - 1 - window.start, 0)
+		position, cash, holdings, total = backtester.run_with_averages(self.values[window], self.moving_average(params['small_window_size'])[window],
+																																	self.moving_average(params['large_window_size'])[window], start)
+		total = np.concatenate(([self.initial_cash], total))
+		return {'pnl': float(total[-1] - self.initial_cash),
+						'max_drawdown': float((np.maximum.accumulate(total) - total).max()),
+						'trades': int(np.count_nonzero(np.diff(position, prepend=0)))}
+
+	# The run function optimizes the parameters on the training window of each fold, evaluates them on its test window,
+	# and returns one row per fold.
+	def run(self):
+		grid = parameter_grid(self.grid)
+		rows = []
+		for fold, (train, test) in enumerate(self.splits):
+			in_sample = [(self.evaluate(params, train), params) for params in grid]
+			best_metrics, best_params = max(in_sample, key=lambda result: result[0][self.metric])
+			out_of_sample = self.evaluate(best_params, test)
+			row = {'fold': fold, 'train_start': self.label(train.start), 'train_end': self.label(train.stop - 1),
+						 'test_start': self.label(test.start), 'test_end': self.label(test.stop - 1)}
+			row.update(best_params)
+			row.update({'in_sample_' + name: value for name, value in best_metrics.items()})
+			row.update({'out_of_sample_' + name: value for name, value in out_of_sample.items()})
+			rows.append(row)
+		return pd.DataFrame(rows)
+
+	# The folds are given by dates when the prices are a pandas Series.
+	def label(self,position):
+		if isinstance(self.prices, pd.Series):
+			return self.prices.index[position]
+		return position
+
+
+import unittest
+
+class TestWalkForward(unittest.TestCase):
+
+	def setUp(self):
+		self.prices = 100 + np.cumsum(np.random.RandomState(0).normal(0, 1, 1000))
+
+	def test_splits(self):
+		self.assertEqual(walk_forward_splits(10, 4, 2), [(slice(0, 4), slice(4, 6)), (slice(2, 6), slice(6, 8)), (slice(4, 8), slice(8, 10))])
+		self.assertEqual(walk_forward_splits(10, 4, 3, anchored=True), [(slice(0, 4), slice(4, 7)), (slice(0, 7), slice(7, 10))])
+
+	def test_cache(self):
+		cache = FeatureCache(max_size=2)
+		cache.get('a', lambda: 1)
+		cache.get('b', lambda: 2)
+		self.assertEqual(cache.get('a', lambda: 0), 1)
+		cache.get('c', lambda: 3)
+		self.assertNotIn('b', cache)
+		self.assertIn('a', cache)
+		self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+	# Each moving average is computed once for all the folds; the first fold gives the same result as
+	# the vectorized back tester on the same prices, since it starts at the beginning of the history:
+	def test_run(self):
+		walk_forward = WalkForward(pd.Series(self.prices, pd.date_range('2001-01-01', periods=1000)),
+															 {'small_window_size': [5, 20], 'large_window_size': [50, 100]}, 400, 100)
+		results = walk_forward.run()
+		self.assertEqual(len(results), 6)
+		self.assertEqual(walk_forward.cache.misses, 4)
+		self.assertEqual(results['test_start'][1], pd.Timestamp('2002-05-16'))
+		first = results.iloc[0]
+		backtester = VectorizedBackTester(int(first['small_window_size']), int(first['large_window_size']))
+		backtester.run(self.prices[:400])
+		self.assertAlmostEqual(first['in_sample_pnl'], backtester.list_total[-1] - 10000)
+
+	# Two histories sharing a cache, under the same symbol, get their own moving averages:
+	def test_shared_cache(self):
+		cache = FeatureCache()
+		grid = {'small_window_size': [5], 'large_window_size': [50]}
+		results = WalkForward(self.prices, grid, 400, 100, cache=cache).run()
+		other_prices = self.prices[::-1].copy()
+		other_results = WalkForward(other_prices, grid, 400, 100, cache=cache).run()
+		self.assertEqual(cache.misses, 4)
+		reference = WalkForward(other_prices, grid, 400, 100).run()
+		self.assertEqual(other_results['in_sample_pnl'].tolist(), reference['in_sample_pnl'].tolist())
+		self.assertNotEqual(other_results['in_sample_pnl'].tolist(), results['in_sample_pnl'].tolist())
+		WalkForward(self.prices, grid, 400, 100, cache=cache).run()
+		self.assertEqual(cache.misses, 4)
+
+if __name__ == '__main__':
+	from TickStore import load_tick_store
+
+	tick_store = load_tick_store(start_date='2001-01-01', end_date='2022-01-01', root='tick_data')
+	prices = np.concatenate([chunk['Adj Close'] for chunk in tick_store.read('GOOG', ['Adj Close'])])
+	walk_forward = WalkForward(prices, {'small_window_size': [5, 10, 20, 50], 'large_window_size': [50, 100, 200]}, 756, 252, symbol='GOOG')
+	print(walk_forward.run().to_string(index=False))
@@ -0,0 +1,261 @@
+# The WireCodec module gives the binary layout of the messages of the trading system, used to record them,
+# to replay them and to send them from one process to another (see RingBuffer).
+
+# A message is a fixed size record: 96 bytes for an order or an execution report, 56 bytes for a book event.
+#  - the first byte is the type of message, followed by a bit mask of the fields set (a field set to None is not sent),
+#  - the strings side, action and status are small integers (their index in SIDES, ACTIONS and STATUSES),
+#  - the prices are fixed point integers: the price times PRICE_SCALE, so a price is exact and is compared as an integer,
+#  - the symbol and the strategy are strings of at most 16 bytes: a longer string is not truncated, it raises a ValueError.
+# The same layout is described twice: a struct to write or read one message at an offset of a buffer (encode_into, decode_from),
+# and a NumPy dtype to handle many messages at once. decode_array does not copy anything: it returns a structured array
+# which is a view on the buffer (a file, a shared memory block), and whose columns are read as NumPy arrays.
+
+import struct
+import pickle
+from timeit import default_timer
+
+import numpy as np
+
+from TradingMessages import Order, ExecutionReport, BookEvent
+
+
+PRICE_SCALE = 10 ** 6
+
+SIDES = ('bid', 'ask', 'buy', 'sell')
+ACTIONS = ('new', 'modify', 'delete', 'New', 'Cancel', 'Amend', 'to_be_sent', 'no_action')
+STATUSES = ('new', 'acked', 'accepted', 'rejected', 'cancelled', 'partially_filled', 'filled')
+SIDE_CODES = {side: code for code, side in enumerate(SIDES)}
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+ORDER, EXECUTION_REPORT, BOOK_EVENT = 1, 2, 3
+
+ORDER_FIELDS = ('side', 'action', 'status', 'id', 'price', 'quantity', 'timestamp', 'fill_price', 'fill_quantity',
+								'leaves_quantity', 'symbol', 'strategy')
+ORDER_STRUCT = struct.Struct('<BxHBBBxqqqqqqq16s16s')
+ORDER_DTYPE = np.dtype([('kind', 'u1'), ('pad0', 'u1'), ('mask', '<u2'), ('side', 'u1'), ('action', 'u1'), ('status', 'u1'), ('pad1', 'u1'),
+												('id', '<i8'), ('price', '<i8'), ('quantity', '<i8'), ('timestamp', '<i8'), ('fill_price', '<i8'),
+												('fill_quantity', '<i8'), ('leaves_quantity', '<i8'), ('symbol', 'S16'), ('strategy', 'S16')])
+
+BOOK_EVENT_FIELDS = ('bid_price', 'bid_quantity', 'offer_price', 'offer_quantity', 'symbol')
+BOOK_EVENT_STRUCT = struct.Struct('<BxH4xqqqq16s')
+BOOK_EVENT_DTYPE = np.dtype([('kind', 'u1'), ('pad0', 'u1'), ('mask', '<u2'), ('pad1', 'V4'), ('bid_price', '<i8'), ('bid_quantity', '<i8'),
+														 ('offer_price', '<i8'), ('offer_quantity', '<i8'), ('symbol', 'S16')])
+
+MESSAGE_SIZE = max(ORDER_STRUCT.size, BOOK_EVENT_STRUCT.size)
+
+# How each field is written: its code table, or the fixed point scale, or a string.
+ENCODERS = {'side': SIDE_CODES, 'action': ACTION_CODES, 'status': STATUS_CODES}
+DECODERS = {'side': SIDES, 'action': ACTIONS, 'status': STATUSES}
+PRICE_FIELDS = ('price', 'fill_price', 'bid_price', 'offer_price')
+STRING_FIELDS = ('symbol', 'strategy')
+STRING_SIZE = 16
+
+
+# The message_kind function gives the type of a message. A dictionary with a bid_price is a book event,
+# a dictionary with a fill_quantity an execution report, and a dictionary with an id an order.
+# Anything else is not a message of the trading system and raises a ValueError.
+def message_kind(message):
+	if isinstance(message, BookEvent):
+		return BOOK_EVENT
+	if isinstance(message, ExecutionReport):
+		return EXECUTION_REPORT
+	if isinstance(message, Order):
+		return ORDER
+	if isinstance(message, dict):
+		if 'bid_price' in message:
+			return BOOK_EVENT
+		if 'fill_quantity' in message:
+			return EXECUTION_REPORT
+		if 'id' in message:
+			return ORDER
+	raise ValueError('unknown message type: %r' % (message,))
+
+def encode_string(field,value):
+	value = value.encode()
+	if len(value) > STRING_SIZE:
+		raise ValueError('%s is longer than %d bytes: %r' % (field, STRING_SIZE, value))
+	return value
+
+def encode_values(message,fields):
+	mask = 0
+	values = []
+	for index, field in enumerate(fields):
+		value = message.get(field)
+		if value is None:
+			values.append(b'' if field in STRING_FIELDS else 0)
+			continue
+		mask |= 1 << index
+		if field in ENCODERS:
+			value = ENCODERS[field][value]
+		elif field in PRICE_FIELDS:
+			value = int(round(value * PRICE_SCALE))
+		elif field in STRING_FIELDS:
+			value = encode_string(field, value)
+		values.append(value)
+	return mask, values
+
+# The encode_into function writes a message at an offset of a buffer and returns the size written.
+def encode_into(buffer,offset,message):
+	kind = message_kind(message)
+	if kind == BOOK_EVENT:
+		mask, values = encode_values(message, BOOK_EVENT_FIELDS)
+		BOOK_EVENT_STRUCT.pack_into(buffer, offset, kind, mask, *values)
+		return BOOK_EVENT_STRUCT.size
+	mask, values = encode_values(message, ORDER_FIELDS)
+	ORDER_STRUCT.pack_into(buffer, offset, kind, mask, *values)
+	return ORDER_STRUCT.size
+
+def encode(message):
+	buffer = bytearray(BOOK_EVENT_STRUCT.size if message_kind(message) == BOOK_EVENT else ORDER_STRUCT.size)
+	encode_into(buffer, 0, message)
+	return bytes(buffer)
+
+# The decode_from function reads the message written at an offset of a buffer.
+def decode_from(buffer,offset=0):
+	kind = buffer[offset]
+	if kind == BOOK_EVENT:
+		fields, values, message = BOOK_EVENT_FIELDS, BOOK_EVENT_STRUCT.unpack_from(buffer, offset), BookEvent()
+	else:
+		fields, values = ORDER_FIELDS, ORDER_STRUCT.unpack_from(buffer, offset)
+		message = ExecutionReport() if kind == EXECUTION_REPORT else Order()
+	mask = values[1]
+	for index, field in enumerate(fields):
+		if not mask & (1 << index):
+			continue
+		value = values[index + 2]
+		if field in DECODERS:
+			value = DECODERS[field][value]
+		elif field in PRICE_FIELDS:
+			value = value / PRICE_SCALE
+		elif field in STRING_FIELDS:
+			value = value.rstrip(b'\0').decode()
+		setattr(message, field, value)
+	return message
+
+
+# The encode_array function writes a list of messages of the same type in a structured array, one column at a time.
+def encode_array(messages,kind=ORDER):
+	dtype, fields = (BOOK_EVENT_DTYPE, BOOK_EVENT_FIELDS) if kind == BOOK_EVENT else (ORDER_DTYPE, ORDER_FIELDS)
+	array = np.zeros(len(messages), dtype)
+	array['kind'] = [message_kind(message) for message in messages]
+	for index, field in enumerate(fields):
+		values = [message.get(field) for message in messages]
+		present = np.array([value is not None for value in values], bool)
+		if not present.any():
+			continue
+		array['mask'] |= present.astype(np.uint16) << index
+		if field in ENCODERS:
+			codes = ENCODERS[field]
+			array[field] = [codes[value] if value is not None else 0 for value in values]
+		elif field in PRICE_FIELDS:
+			array[field] = np.rint(np.array([value if value is not None else 0 for value in values], float) * PRICE_SCALE)
+		elif field in STRING_FIELDS:
+			array[field] = [encode_string(field, value) if value is not None else b'' for value in values]
+		else:
+			array[field] = [value if value is not None else 0 for value in values]
+	return array
+
+# The decode_array function gives the messages of a buffer as a structured array, without copying the buffer.
+def decode_array(buffer,kind=ORDER):
+	return np.frombuffer(buffer, BOOK_EVENT_DTYPE if kind == BOOK_EVENT else ORDER_DTYPE)
+
+# The to_messages function converts the rows of a structured array back to messages.
+def to_messages(array):
+	buffer = array.view(np.uint8)
+	return [decode_from(buffer, offset) for offset in range(0, len(buffer), array.dtype.itemsize)]
+
+def prices(array,field='price'):
+	return array[field] / PRICE_SCALE
+
+
+# The record_messages function writes messages of the same type to a file, and read_recording maps the file back
+# in memory as a structured array: the file is not read, the pages are loaded when the rows are used.
+def record_messages(path,messages,kind=ORDER):
+	encode_array(messages, kind).tofile(path)
+
+def read_recording(path,kind=ORDER):
+	return np.memmap(path, BOOK_EVENT_DTYPE if kind == BOOK_EVENT else ORDER_DTYPE, mode='r')
+
+# The benchmark function measures the time to send count orders through a binary channel, in seconds:
+#  - dict: the dictionary messages are pickled and unpickled, like in a multiprocessing.Queue,
+#  - codec: each order is written and read with encode_into and decode_from,
+#  - codec_array: the orders are written in a structured array, and their prices read from a view on its buffer.
+def benchmark(count=100000):
+	orders = [{'id': i, 'price': 100 + i * 0.01, 'quantity': 10, 'side': 'bid', 'action': 'new', 'symbol': 'GOOG', 'timestamp': i}
+						for i in range(count)]
+	timings = {}
+
+	start = default_timer()
+	for order in orders:
+		pickle.loads(pickle.dumps(order, pickle.HIGHEST_PROTOCOL))
+	timings['dict'] = default_timer() - start
+
+	buffer = bytearray(MESSAGE_SIZE)
+	start = default_timer()
+	for order in orders:
+		encode_into(buffer, 0, order)
+		decode_from(buffer, 0)
+	timings['codec'] = default_timer() - start
+
+	start = default_timer()
+	array = encode_array(orders)
+	prices(decode_array(array.tobytes())).sum()
+	timings['codec_array'] = default_timer() - start
+	return timings
+
+
+import os
+import tempfile
+import unittest
+
+class TestWireCodec(unittest.TestCase):
+
+	def test_round_trip(self):
+		messages = [Order(1, 219.25, 10, 'bid', 'new', symbol='GOOG', timestamp=1530260127243860000),
+								{'id': 2, 'price': 218, 'quantity': 10, 'side': 'ask', 'action': 'New', 'status': 'accepted', 'strategy': 'dual_ma'},
+								ExecutionReport(3, 218.5, 10, 'sell', 'New', 'partially_filled', 'GOOG', fill_price=218.0, fill_quantity=4, leaves_quantity=6),
+								BookEvent(219.1, 10, -1, -1, 'GOOG')]
+		for message in messages:
+			decoded = decode_from(encode(message))
+			self.assertEqual(decoded, message)
+		self.assertEqual(len(encode(messages[0])), 96)
+		self.assertEqual(len(encode(messages[3])), 56)
+		self.assertEqual(ORDER_DTYPE.itemsize, ORDER_STRUCT.size)
+		self.assertEqual(BOOK_EVENT_DTYPE.itemsize, BOOK_EVENT_STRUCT.size)
+
+	# The array of messages is a view on the buffer, its columns are NumPy arrays:
+	def test_array(self):
+		orders = [{'id': i, 'price': 100 + i * 0.25, 'quantity': 10, 'side': 'bid', 'action': 'new'} for i in range(5)]
+		buffer = bytearray(encode_array(orders).tobytes())
+		array = decode_array(buffer)
+		self.assertTrue(np.shares_memory(array, np.frombuffer(buffer, np.uint8)))
+		self.assertEqual(prices(array).tolist(), [100, 100.25, 100.5, 100.75, 101])
+		self.assertEqual(array['side'].tolist(), [SIDE_CODES['bid']] * 5)
+		self.assertEqual(to_messages(array), orders)
+
+	def test_recording(self):
+		events = [BookEvent(219.1 + i, 10, 220.5, 5, 'GOOG') for i in range(3)]
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'book_events.bin')
+			record_messages(path, events, BOOK_EVENT)
+			recording = read_recording(path, BOOK_EVENT)
+			self.assertEqual(prices(recording, 'bid_price').tolist(), [219.1, 220.1, 221.1])
+			self.assertEqual(to_messages(recording), events)
+			del recording
+
+	# A string too long for its field and a message of an unknown type are refused, never truncated or guessed:
+	def test_invalid_messages(self):
+		order = Order(1, 219.25, 10, 'bid', 'new', symbol='GOOG', strategy='s' * 16)
+		self.assertEqual(decode_from(encode(order)), order)
+		self.assertRaises(ValueError, encode, Order(1, 219.25, 10, 'bid', 'new', symbol='GOOG', strategy='s' * 17))
+		self.assertRaises(ValueError, encode_array, [{'id': 1, 'symbol': 'A' * 17}])
+		self.assertRaises(ValueError, encode, {'bid_quantity': 10, 'offer_quantity': 10})
+		self.assertRaises(ValueError, encode, [1, 2])
+
+	def test_benchmark(self):
+		self.assertEqual(sorted(benchmark(100)), ['codec', 'codec_array', 'dict'])
+
+if __name__ == '__main__':
+	for name, seconds in benchmark().items():
+		print('%s: %.3f s' % (name, seconds))